@@ -1,17 +1,42 @@
-from flask import Flask, render_template
+from flask import Flask, Response, render_template
 import os
-from app.quiz.controllers import blueprint as quiz_blueprint
+from app.config import Config
+from app.quiz.controllers import init_app as init_quiz
 from .web import blueprint as web_blueprint
+from app.libs.metrics import default_registry
 
 
 template_dir = os.path.abspath('app/templates')
 static_dir = os.path.abspath('app/static')
-app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
 
-app.register_blueprint(web_blueprint)
-app.register_blueprint(quiz_blueprint, url_prefix='/quiz')
 
-
-@app.route('/')  # Strona glowna
-def index():
+def index():  # Strona glowna
     return render_template('home.html')
+
+
+def metrics():
+    """
+        Collected timings in Prometheus text format, empty with disabled metrics
+    """
+    return Response(default_registry().render(), mimetype='text/plain; version=0.0.4')
+
+
+def create_app(config=None):
+    """
+        Build Flask application, MongoDB is connected on first request of every process
+    Parameters
+    ----------
+    config : Config, optional
+        Application settings, read from environment by default
+
+    Returns
+    -------
+    flask.Flask
+        Application with web, quiz and metrics endpoints
+    """
+    app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
+    app.register_blueprint(web_blueprint)
+    init_quiz(app, Config.from_env() if config is None else config)
+    app.add_url_rule('/', view_func=index)
+    app.add_url_rule('/metrics', view_func=metrics)
+    return app
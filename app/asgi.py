@@ -0,0 +1,241 @@
+"""
+    ASGI entry point serving quiz endpoints with AsyncQuiz and Motor
+
+    Run from repository root:
+        uvicorn app.asgi:application --port 5500
+
+    Endpoints are the same as /quiz endpoints of Flask application, synchronous
+    server from main.py keeps working alongside.
+    /metrics serves the same Prometheus metrics as Flask application.
+"""
+import asyncio
+import inspect
+import json
+import re
+from urllib.parse import unquote
+from app.quiz.async_models import AsyncQuiz
+from app.quiz.async_records import AsyncUser
+from app.quiz.events import format_sse
+from app.libs.metrics import default_registry, event_listeners, timed
+from app.quiz.indexes import RECORD_COLLECTIONS
+from app.quiz.rooms import RoomRegistry, DEFAULT_ROOM
+
+ROUTE = re.compile(
+    r'^/quiz(?:/rooms/(?P<room_id>[^/]+))?/(?P<action>[a-z_]+)(?P<args>(?:/[^/]+)*)$')
+EVENTS_POLL_INTERVAL = 0.1  # Seconds between checks of room events
+KEEP_ALIVE_INTERVAL = 15.0  # Seconds of silence before keep-alive comment
+request_seconds = default_registry().histogram(
+    'bigquiz_request_seconds', 'Duration of quiz endpoints', ('endpoint',))
+
+
+def create_asgi_app(db=None, registry=None, connect=None):
+    """
+        Prepare ASGI application serving quiz endpoints
+    Parameters
+    ----------
+    db : motor.motor_asyncio.AsyncIOMotorDatabase, optional
+        Motor Database reference, created by connect at lifespan startup by default
+    registry : RoomRegistry, optional
+        Registry of AsyncQuiz rooms, created for db by default
+    connect : callable, optional
+        Function returning Motor Database, called inside running event loop
+
+    Returns
+    -------
+    callable
+        ASGI application
+    """
+    state = {'db': db, 'rooms': registry}
+
+    async def startup():
+        if state['db'] is None:
+            state['db'] = connect()
+            for col, record in RECORD_COLLECTIONS.items():
+                if record.indexes:
+                    await state['db'][col].create_indexes(record.indexes)
+        if state['rooms'] is None:
+            state['rooms'] = RoomRegistry(
+                state['db'], quiz_factory=AsyncQuiz)
+
+    async def register_user(quiz, user_name):
+        user = await AsyncUser.load_by_name(state['db'], user_name, 'users')
+        quiz.register_user(user)
+        return True
+
+    async def remove_user(quiz, user_name):
+        quiz.remove_user(user_name)
+        return True
+
+    async def start_game(quiz, user_name=None):
+        await quiz.start_game(await quiz.propose_game())
+        return True
+
+    async def put_answer(quiz, user_name, choice):
+        try:
+            answer = ['A', 'B', 'C', 'D'].index(choice)
+        except ValueError:
+            print('Invalid answer')
+            return False
+        return await quiz.register_answer(user_name, answer)
+
+    actions = {name: timed(request_seconds, name)(action) for name, action in [
+        ('register_user', register_user), ('remove_user', remove_user), ('start_game', start_game),
+        ('put_answer', put_answer), ('send_x', start_game)]}
+    arities = {name: path_arity(action) for name, action in actions.items()}
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    try:
+                        await startup()
+                    except Exception as e:
+                        await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                        return
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    if state['rooms'] is not None:
+                        state['rooms'].close()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+        if scope['path'] == '/metrics':
+            await respond(send, 200, default_registry().render(), b'text/plain; version=0.0.4')
+            return
+        if state['rooms'] is None:
+            await startup()
+        match = ROUTE.match(scope['path'])
+        if match is None:
+            await respond(send, 404, json.dumps(False))
+            return
+        args = [unquote(x) for x in match['args'].split('/')[1:]]
+        if match['action'] == 'events':
+            action, arity = stream_events, (0, 0)
+        else:
+            action = actions.get(match['action'])
+            arity = None if action is None else arities[match['action']]
+        if action is None or not arity[0] <= len(args) <= arity[1]:
+            # Unknown action or wrong number of path arguments, no room is created for them
+            await respond(send, 404, json.dumps(False))
+            return
+        quiz = state['rooms'].get(unquote(match['room_id'] or DEFAULT_ROOM)).quiz
+        if action is stream_events:
+            await stream_events(quiz, scope, receive, send)
+            return
+        await respond(send, 200, json.dumps(await action(quiz, *args)))
+
+    return application
+
+
+def path_arity(action):
+    """
+        Smallest and largest number of path arguments accepted by action
+    Parameters
+    ----------
+    action : callable
+        Endpoint coroutine function taking quiz and path arguments
+
+    Returns
+    -------
+    tuple of int
+        Minimal and maximal number of path arguments
+    """
+    parameters = list(inspect.signature(action).parameters.values())[1:]
+    required = [p for p in parameters if p.default is inspect.Parameter.empty]
+    return len(required), len(parameters)
+
+
+async def respond(send, status, body, content_type=b'app/json'):
+    """
+        Send complete HTTP response
+    Parameters
+    ----------
+    send : callable
+        ASGI send channel
+    status : int
+        HTTP status code
+    body : str
+        Response body
+    content_type : bytes, default b'app/json'
+        Content-Type header value, same as Flask endpoints
+    """
+    body = body.encode()
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', content_type), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def stream_events(quiz, scope, receive, send):
+    """
+        Server-Sent Events stream of quiz events, resumed after Last-Event-ID header
+    Parameters
+    ----------
+    quiz : AsyncQuiz
+        Quiz of room
+    scope : dict
+        ASGI connection scope
+    receive : callable
+        ASGI receive channel, watched for client disconnect
+    send : callable
+        ASGI send channel
+    """
+    headers = dict(scope['headers'])
+    try:
+        last_id = int(headers.get(b'last-event-id'))
+    except (TypeError, ValueError):
+        last_id = None
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no')]})
+    if last_id is None:
+        last_id = quiz.events.last_id
+        message = f"event: question-changed\ndata: {json.dumps(quiz.question_state())}\n\n"
+        await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+    disconnected = asyncio.ensure_future(_disconnect(receive))
+    silence = 0.0
+    try:
+        while not disconnected.done():
+            events = quiz.events.events_after(last_id)
+            if events:
+                last_id = events[-1][0]
+                body = ''.join(format_sse(event) for event in events)
+                silence = 0.0
+            elif silence >= KEEP_ALIVE_INTERVAL:
+                body = format_sse(None)
+                silence = 0.0
+            else:
+                await asyncio.sleep(EVENTS_POLL_INTERVAL)
+                silence += EVENTS_POLL_INTERVAL
+                continue
+            await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+    except OSError:
+        return
+    finally:
+        disconnected.cancel()
+
+
+async def _disconnect(receive):
+    """
+        Wait for http.disconnect message of client
+    """
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def connect():
+    """
+        Motor Database of settings read from environment
+    Returns
+    -------
+    motor.motor_asyncio.AsyncIOMotorDatabase
+        BigQuiz database
+    """
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from app.config import Config
+    config = Config.from_env()
+    return AsyncIOMotorClient(config.mongo_uri, event_listeners=event_listeners())[config.mongo_db]
+
+
+application = create_asgi_app(connect=connect)
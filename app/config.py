@@ -0,0 +1,100 @@
+import os
+from constants import MONGO_DB_NAME
+
+
+class Config:
+    """
+    Settings of application, from_env reads them from BIGQUIZ_* environment variables:
+        BIGQUIZ_MONGO_URI     MongoDB connection string, required
+        BIGQUIZ_MONGO_DB      database name
+        BIGQUIZ_STATE_STORE   'process' keeps live game state in worker memory,
+                              'mongo' shares it between worker processes
+        BIGQUIZ_JOURNAL_DIR   directory of write-behind journals, empty writes
+                              round results to MongoDB in requests
+        BIGQUIZ_EVENT_STREAMS limit of /events streams of Flask process, every stream
+                              holds one server thread, ASGI application has no limit
+    BIGQUIZ_METRICS is not a setting of Config, endpoints are decorated on import, so it is read
+    from environment by app.libs.metrics.default_registry before any application is built
+
+    Attributes
+    ----------
+    mongo_uri : str
+        MongoDB connection string
+    mongo_db : str
+        Database name
+    state_store : str
+        'process' or 'mongo' store of live game state
+    journal_directory : str
+        Directory of write-behind journals, empty disables journal
+    event_streams : int
+        Limit of simultaneous /events streams of process
+    client_options : dict
+        Additional MongoClient keyword arguments
+    quiz_factory : type or None
+        Quiz class of rooms, Quiz by default
+
+    Methods
+    -------
+    from_env(environ=None, **overrides)
+        Settings read from environment variables
+    """
+
+    def __init__(self, mongo_uri, mongo_db=MONGO_DB_NAME, state_store='process',
+                 journal_directory='', event_streams=4, client_options=None, quiz_factory=None) -> None:
+        """
+            Prepare settings, defaults are used by applications without environment
+        Parameters
+        ----------
+        mongo_uri : str
+            MongoDB connection string
+        mongo_db : str, default constants.MONGO_DB_NAME
+            Database name
+        state_store : str, default 'process'
+            'process' or 'mongo' store of live game state
+        journal_directory : str, default ''
+            Directory of write-behind journals, empty disables journal
+        event_streams : int, default 4
+            Limit of simultaneous /events streams of process
+        client_options : dict, optional
+            Additional MongoClient keyword arguments
+        quiz_factory : type, optional
+            Quiz class of rooms
+        """
+        self.mongo_uri = mongo_uri
+        self.mongo_db = mongo_db
+        self.state_store = state_store
+        self.journal_directory = journal_directory
+        self.event_streams = event_streams
+        self.client_options = client_options or {}
+        self.quiz_factory = quiz_factory
+
+    @classmethod
+    def from_env(cls, environ=None, **overrides):
+        """
+            Settings read from environment variables
+        Parameters
+        ----------
+        environ : mapping, optional
+            Environment variables, os.environ by default
+        overrides :
+            Settings taking precedence over environment
+
+        Returns
+        -------
+        Config
+
+        Raises
+        ------
+        KeyError
+            BIGQUIZ_MONGO_URI is not set and mongo_uri is not overridden
+        """
+        environ = os.environ if environ is None else environ
+        if 'mongo_uri' not in overrides and not environ.get('BIGQUIZ_MONGO_URI'):
+            raise KeyError('BIGQUIZ_MONGO_URI environment variable is required')
+        settings = {'mongo_uri': environ.get('BIGQUIZ_MONGO_URI'),
+                    'mongo_db': environ.get('BIGQUIZ_MONGO_DB', MONGO_DB_NAME),
+                    'state_store': environ.get('BIGQUIZ_STATE_STORE', 'process'),
+                    'journal_directory': environ.get('BIGQUIZ_JOURNAL_DIR', ''),
+                    'event_streams': int(environ.get('BIGQUIZ_EVENT_STREAMS', 4))}
+        settings.update(overrides)
+        return cls(**settings)
@@ -0,0 +1,341 @@
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from pymongo import monitoring
+
+# Upper bounds in seconds, last bucket catches everything slower
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Family of latency histograms with shared name and buckets, one histogram per labels values
+
+    Attributes
+    ----------
+    registry : MetricsRegistry
+        Registry rendering the family
+    name : str
+        Prometheus metric name
+    help : str
+        Description of metric
+    label_names : tuple of str
+        Names of labels given to observe in the same order
+    buckets : tuple of float
+        Sorted upper bounds of buckets
+
+    Methods
+    -------
+    observe(value, *labels)
+        Count value in bucket of histogram selected by labels values
+    render()
+        Prometheus text lines of family
+    """
+
+    def __init__(self, registry, name, help, label_names=(), buckets=DEFAULT_BUCKETS) -> None:
+        """
+            Prepare family without observations
+        Parameters
+        ----------
+        registry : MetricsRegistry
+            Registry rendering the family
+        name : str
+            Prometheus metric name
+        help : str
+            Description of metric
+        label_names : tuple of str, default ()
+            Names of labels given to observe
+        buckets : tuple of float, default DEFAULT_BUCKETS
+            Sorted upper bounds of buckets
+        """
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._children = {}  # Labels values to [bucket counts, sum]
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.registry.enabled
+
+    def observe(self, value, *labels):
+        """
+            Count value in bucket of histogram selected by labels values
+        Parameters
+        ----------
+        value : float
+            Observed value, seconds for latencies
+        labels : str
+            Labels values in order of label_names
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(labels)
+            if child is None:
+                child = self._children[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            child[0][index] += 1
+            child[1] += value
+
+    def render(self):
+        """
+            Prometheus text lines of family
+        Returns
+        -------
+        list of str
+            HELP, TYPE and sample lines
+        """
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            children = [(labels, list(counts), total)
+                        for labels, (counts, total) in self._children.items()]
+        for labels, counts, total in sorted(children):
+            pairs = [f'{name}="{escape(value)}"' for name, value in zip(self.label_names, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket = format_labels(pairs + [f'le="{le}"'])
+                lines.append(f'{self.name}_bucket{bucket} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(pairs)} {total!r}')
+            lines.append(f'{self.name}_count{format_labels(pairs)} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """
+    Family of values read from callback while rendering, used for counters kept by other objects
+
+    Attributes
+    ----------
+    name : str
+        Prometheus metric name
+    help : str
+        Description of metric
+    kind : str
+        Prometheus type, 'gauge' or 'counter'
+    label_name : str or None
+        Name of label of values returned as dict
+    function : callable
+        Function returning number or dict of label value to number
+
+    Methods
+    -------
+    render()
+        Prometheus text lines of family
+    """
+
+    def __init__(self, name, help, function, label_name=None, kind='gauge') -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_name = label_name
+        self.function = function
+
+    def render(self):
+        """
+            Prometheus text lines of family
+        Returns
+        -------
+        list of str
+            HELP, TYPE and sample lines
+        """
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        values = self.function()
+        if self.label_name is None:
+            lines.append(f'{self.name} {values!r}')
+        else:
+            for label, value in sorted(values.items()):
+                lines.append(f'{self.name}{{{self.label_name}="{escape(label)}"}} {value!r}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process wide set of metric families rendered in Prometheus text format
+    Disabled registry keeps families empty, decorators return undecorated functions
+
+    Attributes
+    ----------
+    enabled : bool
+        Collecting of observations
+
+    Methods
+    -------
+    histogram(name, help, label_names=(), buckets=DEFAULT_BUCKETS)
+        Registered or new histogram family
+    gauge(name, help, function, label_name=None, kind='gauge')
+        Register family read from callback
+    render()
+        Prometheus text exposition of all families
+    """
+
+    def __init__(self, enabled=True) -> None:
+        """
+            Prepare registry without families
+        Parameters
+        ----------
+        enabled : bool, default True
+            Collecting of observations
+        """
+        self.enabled = enabled
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+            Registered or new histogram family
+        Parameters
+        ----------
+        name : str
+            Prometheus metric name
+        help : str
+            Description of metric
+        label_names : tuple of str, default ()
+            Names of labels given to observe
+        buckets : tuple of float, default DEFAULT_BUCKETS
+            Sorted upper bounds of buckets
+
+        Returns
+        -------
+        Histogram
+        """
+        with self._lock:
+            if name not in self._families:
+                self._families[name] = Histogram(self, name, help, label_names, buckets)
+            return self._families[name]
+
+    def gauge(self, name, help, function, label_name=None, kind='gauge'):
+        """
+            Register family read from callback, replacing family of the same name
+        Parameters
+        ----------
+        name : str
+            Prometheus metric name
+        help : str
+            Description of metric
+        function : callable
+            Function returning number or dict of label value to number
+        label_name : str, optional
+            Name of label of values returned as dict
+        kind : str, default 'gauge'
+            Prometheus type, 'gauge' or 'counter'
+        """
+        with self._lock:
+            self._families[name] = Gauge(name, help, function, label_name, kind)
+
+    def render(self):
+        """
+            Prometheus text exposition of all families
+        Returns
+        -------
+        str
+            Metrics in text format version 0.0.4
+        """
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    pymongo command listener counting MongoDB round trips and their durations per command name
+
+    Attributes
+    ----------
+    histogram : Histogram
+        Family labelled by command name and outcome
+    """
+
+    def __init__(self, registry) -> None:
+        self.histogram = registry.histogram(
+            'bigquiz_mongo_command_seconds', 'Duration of MongoDB commands', ('command', 'outcome'))
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.histogram.observe(event.duration_micros / 1e6, event.command_name, 'succeeded')
+
+    def failed(self, event):
+        self.histogram.observe(event.duration_micros / 1e6, event.command_name, 'failed')
+
+
+def timed(histogram, *labels):
+    """
+        Decorator observing duration of function or coroutine function calls
+        Function is returned undecorated by disabled registry
+    Parameters
+    ----------
+    histogram : Histogram
+        Family of observed durations
+    labels : str
+        Labels values of histogram, function name by default for family with one label
+    """
+    def decorator(func):
+        if not histogram.enabled:
+            return func
+        values = labels or (func.__name__,) * len(histogram.label_names)
+        observe = histogram.observe
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def inner(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    observe(time.perf_counter() - start, *values)
+        else:
+            @functools.wraps(func)
+            def inner(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    observe(time.perf_counter() - start, *values)
+        return inner
+    return decorator
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(pairs):
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+_default_registry = None
+
+
+def default_registry():
+    """
+        Shared registry enabled by BIGQUIZ_METRICS=1 environment variable
+        Only the environment switches metrics, it is read once, before endpoints are decorated
+    Returns
+    -------
+    MetricsRegistry
+        Process wide metrics registry
+    """
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = MetricsRegistry(enabled=os.environ.get('BIGQUIZ_METRICS', '') == '1')
+    return _default_registry
+
+
+def event_listeners():
+    """
+        Listeners of MongoClient commands, empty for disabled registry
+    Returns
+    -------
+    list of pymongo.monitoring.CommandListener
+    """
+    registry = default_registry()
+    return [CommandMetrics(registry)] if registry.enabled else []
@@ -0,0 +1,38 @@
+import pytest
+from bson.objectid import ObjectId
+from pytest_mock_resources import create_mongo_fixture
+from app.libs.types import MongoIdList
+
+mongo = create_mongo_fixture()
+
+
+@pytest.fixture
+def id_list(mongo):
+    ids = mongo['games'].insert_many([{} for _ in range(5)]).inserted_ids
+    storage = MongoIdList()
+    storage.set_collection(mongo['games'])
+    return storage, ids
+
+
+def test_append_skips_duplicates_and_missing(id_list):
+    storage, ids = id_list
+    storage.append(ids[0])
+    storage.append(ids[0])
+    storage.append(ObjectId())
+    assert list(storage) == [ids[0]]
+    assert ids[0] in storage
+
+
+def test_extend_checks_existence_in_bulk(id_list):
+    storage, ids = id_list
+    storage.append(ids[1])
+    storage.extend([ids[0], ids[1], ObjectId(), ids[2], ids[0]])
+    assert list(storage) == [ids[1], ids[0], ids[2]]
+
+
+def test_load_trusts_stored_ids(id_list):
+    storage, ids = id_list
+    unknown = ObjectId()
+    storage.load([ids[3], unknown, ids[3]])
+    assert list(storage) == [ids[3], unknown]
+    assert len(storage) == 2
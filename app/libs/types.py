@@ -1,4 +1,5 @@
 import abc
+import weakref
 import collections.abc as collections
 from bson.objectid import ObjectId
 from pymongo.errors import InvalidName
@@ -8,6 +9,8 @@ from pymongo.database import Database
 class UnchangedProperty(abc.ABC):
     """
     Abstract Descriptor for validated once set property.
+    Values are stored in owner instance under storage_name attribute, so they are released
+    together with the instance. Owners without instance storage fall back to weak references.
 
     Methods
     validate(value)
@@ -16,14 +19,43 @@ class UnchangedProperty(abc.ABC):
 
     def __init__(self, default=None) -> None:
         """
-        Prepare instances dict for multi owner usage
+        Prepare weak instances dict for owners without instance storage
         ----------
         default :, None
             default preset value
         """
-        self.instances = {}
+        self.instances = weakref.WeakKeyDictionary()
+        self.storage_name = None
         self._default = default
 
+    def __set_name__(self, owner, name):
+        """
+        Set name of owner instance attribute keeping the value
+        Parameters
+        ----------
+        owner : type
+            Class containing descriptor
+        name : str
+            Name of descriptor in owner class
+        """
+        self.storage_name = self.storage(name)[0]
+
+    @staticmethod
+    def storage(*names):
+        """
+        Names of owner attributes keeping values of descriptors, used in owners' __slots__
+        Parameters
+        ----------
+        names : str
+            Names of descriptors
+
+        Returns
+        -------
+        tuple of str
+            Storage names of descriptors
+        """
+        return tuple(f'_unchanged_{name}' for name in names)
+
     def __get__(self, instance, parent):
         """
         Getter method return default value in case of preset state
@@ -38,12 +70,12 @@ class UnchangedProperty(abc.ABC):
         """
         if instance is None:
             return self
-        try:
-            return self.instances[instance]
-        except KeyError:
-            return self._default
-        except Exception as e:
-            print(e)
+        if self.storage_name is not None:
+            try:
+                return getattr(instance, self.storage_name)
+            except AttributeError:
+                pass
+        return self.instances.get(instance, self._default)
 
     def __set__(self, instance, value):
         """
@@ -59,7 +91,7 @@ class UnchangedProperty(abc.ABC):
         AttributeError
             If the value is previous set
         """
-        if instance in self.instances:
+        if self.is_set(instance):
             raise AttributeError("can't set attribute")
         else:
             try:
@@ -67,7 +99,26 @@ class UnchangedProperty(abc.ABC):
             except Exception as e:
                 print(e)
             else:
-                self.instances[instance] = value
+                try:
+                    setattr(instance, self.storage_name, value)
+                except (AttributeError, TypeError):
+                    self.instances[instance] = value
+
+    def is_set(self, instance):
+        """
+        Check if value of instance was set
+        Parameters
+        ----------
+        instance :
+
+        Returns
+        -------
+        bool
+            Setting state of instance value
+        """
+        if self.storage_name is not None and hasattr(instance, self.storage_name):
+            return True
+        return instance in self.instances
 
     @abc.abstractmethod
     def validate(self, value):
@@ -133,6 +184,8 @@ class IterableStorage(abc.ABC):
         Type checking of new property value
     """
 
+    __slots__ = ()
+
     def __init__(self):
         """
         Create storage list for validated values
@@ -213,9 +266,12 @@ class MongoId():
     ----------
     set collection(collection):
         set MongoDB collection name
+    to_object_id(value)
+        Convert str, int and ObjectId values to ObjectId
     validate(value)
         Accept only str, int and ObjectId values
     """
+    __slots__ = ()
 
     def set_collection(self, collection):
         """
@@ -227,6 +283,32 @@ class MongoId():
         """
         self.collection = collection
 
+    @staticmethod
+    def to_object_id(value):
+        """
+            Convert str, int and ObjectId values to ObjectId
+        Parameters
+        ----------
+        value :
+            Converted value
+
+        Returns
+        -------
+        bson.objectid.ObjectId
+            Id of MongoDB record
+
+        Raises
+        ------
+        TypeError
+            Inserted value is not in proper type of ObjectId, str or int
+        """
+        if type(value) == ObjectId:
+            return value
+        elif type(value) in [str, int]:
+            object_id = ['0']*(24-len(str(value)))+list(str(value))
+            return ObjectId(''.join(object_id))
+        raise TypeError('value must be in type ObjectId, str or int')
+
     def validate(self, value):
         """
             Accept only str, int and ObjectId values
@@ -249,23 +331,118 @@ class MongoId():
         InvalidName
             In collection is not record with that ObjectId
         """
-        if type(value) == ObjectId:
-            result = self.collection.find({'_id': value})
-        elif type(value) in [str, int]:
-            object_id = ['0']*(24-len(str(value)))+list(str(value))
-            value = ObjectId(''.join(object_id))
-            result = self.collection.find(
-                {'_id': ObjectId(''.join(object_id))})
-        else:
-            raise TypeError('value must be in type ObjectId, str or int')
-        if len(list(result)):
-            if not isinstance(self, collections.Iterable) or value not in list(self):
-                return value
+        value = self.to_object_id(value)
+        if isinstance(self, collections.Iterable) and value in self:
             raise ValueError(f'Value {value} is in set')
-        raise InvalidName(f'There was no record with id: {value}')
+        if self.collection.find_one({'_id': value}, {'_id': 1}) is None:
+            raise InvalidName(f'There was no record with id: {value}')
+        return value
 
 
 class MongoIdList(MongoId, IterableStorage):
     """
-        Iterable storage contained only ObjectId objects
+        Iterable storage contained only unique ObjectId objects
+        Insertion order is kept in list, membership is checked in hash set
+    Methods
+    ----------
+    extend(values)
+        Add new validated elements checking their existence in one query
+    load(values)
+        Add trusted elements read from database without validation
     """
+
+    __slots__ = ('collection', 'storage', '_members')
+
+    def __init__(self):
+        """
+        Create storage list and membership set for validated values
+        """
+        super().__init__()
+        self._members = set()
+
+    def __contains__(self, value):
+        return value in self._members
+
+    def __len__(self):
+        return len(self.storage)
+
+    def __setitem__(self, key, value):
+        """
+            Validated list item edition
+        Parameters
+        ----------
+        key : int
+            index of changing list element
+        value :
+            new value of list element
+        """
+        previous = self.storage[key]
+        try:
+            value = self.validate(value)
+        except Exception as e:
+            print(e)
+        else:
+            self._members.discard(previous)
+            self._members.add(value)
+            self.storage[key] = value
+
+    def append(self, value):
+        """
+        Add new validated element to the end of storage
+        Parameters
+        ----------
+        value :
+            New validated element
+        """
+        try:
+            value = self.validate(value)
+        except Exception as e:
+            print(e)
+        else:
+            self._members.add(value)
+            self.storage.append(value)
+
+    def extend(self, values):
+        """
+        Add new validated elements checking their existence in one query
+        Parameters
+        ----------
+        values : iterable
+            New validated elements, duplicates and ids without record are skipped
+        """
+        new_values = []
+        seen = set()
+        for value in values:
+            try:
+                value = self.to_object_id(value)
+            except TypeError as e:
+                print(e)
+                continue
+            if value in self._members or value in seen:
+                print(f'Value {value} is in set')
+            else:
+                seen.add(value)
+                new_values.append(value)
+        if not new_values:
+            return
+        existing = {x['_id'] for x in self.collection.find(
+            {'_id': {'$in': new_values}}, {'_id': 1})}
+        for value in new_values:
+            if value in existing:
+                self._members.add(value)
+                self.storage.append(value)
+            else:
+                print(f'There was no record with id: {value}')
+
+    def load(self, values):
+        """
+        Add trusted elements read from database without validation
+        Parameters
+        ----------
+        values : iterable of bson.objectid.ObjectId
+            Ids stored in database record
+        """
+        for value in values:
+            if value not in self._members:
+                self._members.add(value)
+                self.storage.append(value)
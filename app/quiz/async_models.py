@@ -0,0 +1,274 @@
+import asyncio
+from collections import deque
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.libs.types import UnchangedTypedPropert
+from app.quiz.models import Quiz
+from app.quiz.unit_of_work import AsyncUnitOfWork
+from app.quiz.async_records import AsyncGame, AsyncQuestion
+
+
+class AsyncQuestionPool:
+    """
+    Per game pool of ready to serve questions refilled in background asyncio task
+
+    Attributes
+    ----------
+    size : int
+        Number of questions kept in pool
+    low_water : int
+        Pool length which triggers background refill
+
+    Methods
+    -------
+    pop()
+        Take question unknown to players, loading it if pool is empty
+    invalidate()
+        Drop prefetched questions after change of players set
+    refill()
+        Load questions until pool is full
+    stop()
+        Cancel background refilling task
+    """
+
+    def __init__(self, db, known_questions, col='questions', size=8, low_water=3, players=None):
+        """
+            Prepare empty pool, background task is started on first demand
+        Parameters
+        ----------
+        db : motor.motor_asyncio.AsyncIOMotorDatabase
+            Database containing questions collection
+        known_questions : callable
+            Function returning set of question codes known by players
+        col : str, default 'questions'
+            Name of questions collection
+        size : int, default 8
+            Number of questions kept in pool
+        low_water : int, default 3
+            Pool length which triggers background refill
+        players : callable, optional
+            Function returning ids of players, whose stored history is skipped by sampler
+        """
+        self.db = db
+        self.size = size
+        self.low_water = low_water
+        self._known_questions = known_questions
+        self._players = players or (lambda: ())
+        self._col = col
+        self._questions = deque()
+        self._generation = 0
+        self._stopped = False
+        self._task = None
+
+    def __len__(self):
+        return len(self._questions)
+
+    async def pop(self):
+        """
+            Take question unknown to players, loading it if pool is empty
+        Returns
+        -------
+        AsyncQuestion
+            Question not contained in players' history
+        """
+        known = self._known_questions()
+        question = None
+        while self._questions:
+            candidate = self._questions.popleft()
+            if candidate.question_code not in known:
+                question = candidate
+                break
+        if question is None:
+            pooled = [x.question_code for x in self._questions]
+            question = await AsyncQuestion.get_unknown_question(
+                self.db, known, self._col, exclude=pooled, users=self._players())
+        if len(self._questions) < self.low_water:
+            self._request_refill()
+        return question
+
+    def invalidate(self):
+        """
+            Drop prefetched questions after change of players set
+        """
+        self._questions.clear()
+        self._generation += 1
+        self._request_refill()
+
+    async def refill(self):
+        """
+            Load questions until pool is full, results loaded for outdated players set are skipped
+        """
+        while not self._stopped and len(self._questions) < self.size:
+            generation = self._generation
+            pooled = [x.question_code for x in self._questions]
+            question = await AsyncQuestion.get_unknown_question(
+                self.db, self._known_questions(), self._col, exclude=pooled, users=self._players())
+            if generation == self._generation and \
+                    question.question_code not in [x.question_code for x in self._questions]:
+                self._questions.append(question)
+
+    def stop(self):
+        """
+            Cancel background refilling task
+        """
+        self._stopped = True
+        if self._task is not None:
+            self._task.cancel()
+
+    def _request_refill(self):
+        """
+            Start background task if none is running, skipped outside of event loop
+        """
+        if self._stopped or (self._task is not None and not self._task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        """
+            Background task body
+        """
+        try:
+            await self.refill()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(e)
+
+
+class AsyncQuiz(Quiz):
+    """
+    Quiz manager for asyncio servers based on Motor
+    Game state logic is shared with Quiz, database and Trivia API calls are awaited,
+    so waiting room does not block other rooms served by the same event loop.
+
+    Attributes
+    ----------
+    db : motor.motor_asyncio.AsyncIOMotorDatabase
+        Motor Database reference
+
+    Methods
+    -------
+    start_game(game)
+        Set new or saved Game and load it's state
+    update_game()
+        Update game and users params in connected MongoDB records
+    flush_rounds()
+        Write queued round results in completion order
+    register_answer(user_name,choice)
+        Put choice in user's key update answers order and run loading new question if needed
+    load_next_question()
+        Load new question from prefetched pool
+    propose_game()
+        Check if in games collection is unfinished game started by all loaded users
+    """
+    db = UnchangedTypedPropert(AsyncIOMotorDatabase)
+    unit_of_work = AsyncUnitOfWork
+    question_pool = AsyncQuestionPool
+
+    def __init__(self, db, use_transaction=False):
+        """
+            Initialize quiz game manager with default state
+        Parameters
+        ----------
+        db : motor.motor_asyncio.AsyncIOMotorDatabase
+            Motor Database reference
+        use_transaction : bool, default False
+            Write round results in single transaction, requires replica set
+        """
+        super().__init__(db, use_transaction)
+        self._state_lock = asyncio.Lock()  # Held over awaited game state changes
+        self._write_lock = asyncio.Lock()
+
+    async def start_game(self, game):
+        """
+            Set Game and load it's state
+        Parameters
+        ----------
+        game : AsyncGame
+            New or saved Game object
+        """
+        if not isinstance(game, AsyncGame):
+            return
+        async with self._state_lock:
+            with self._lock:
+                is_new = self._prepare_game(game)
+            try:
+                if is_new:
+                    await game.save_to_db('games')
+                    await self._join_game_unit(game).flush()
+                await self.load_next_question()
+            except Exception:
+                with self._lock:
+                    self._abort_game()
+                raise
+
+    async def update_game(self):
+        """
+            Update game and users params in connected MongoDB records
+        """
+        with self._lock:
+            self._queue_round()
+        await self.flush_rounds()
+
+    async def flush_rounds(self):
+        """
+            Write queued round results in completion order
+        """
+        async with self._write_lock:
+            while self._pending_rounds:
+                await self._pending_rounds.popleft().flush()
+
+    async def register_answer(self, user_name, choice):
+        """
+            Put choice in user's key update answers order and run loading new question if needed
+        Parameters
+        ----------
+        user_name : str
+            Name of responded user
+        choice : int
+            Id of given answer
+
+        Returns
+        -------
+        Boolean
+            Saving state of given answer
+        """
+        async with self._state_lock:
+            with self._lock:
+                completed = self._apply_answer(user_name, choice)
+            if completed is None:
+                return False
+            if completed:
+                try:
+                    await self.load_next_question()
+                except Exception:
+                    with self._lock:
+                        self._abort_game()
+                    await self.flush_rounds()  # Completed round is still written
+                    raise
+        if completed:
+            await self.flush_rounds()
+        return True
+
+    async def load_next_question(self):
+        """
+            Load new question from prefetched pool
+        """
+        question = await self._question_pool.pop()
+        with self._lock:
+            self.current_question = question
+
+    async def propose_game(self):
+        """
+            Check if in games collection is unfinished game started by all loaded users
+        Returns
+        -------
+        AsyncGame
+            Game record reference connected with all users
+        """
+        proposed_game = await AsyncGame.load_by_users(
+            self.db, [x._id for x in self.loaded_users], 'games', unfinished=True)
+        return proposed_game or AsyncGame(self.db)
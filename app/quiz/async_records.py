@@ -0,0 +1,387 @@
+import datetime
+import pymongo
+from bson.objectid import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from app.libs.types import UnchangedTypedPropert
+from app.quiz.records import Game, User, Question, SAMPLE_SIZE
+from app.quiz.cache import default_cache
+from app.quiz.opentdb import default_async_client, OpenTDBError
+
+
+class AsyncRecordMixin:
+    """
+    Motor versions of MongoRecordAdapter database calls
+    Params, snapshots and update documents are shared with synchronous records,
+    only database round trips are awaited.
+
+    Attributes
+    ----------
+    db : motor.motor_asyncio.AsyncIOMotorDatabase
+        Motor Database reference
+
+    Methods
+    -------
+    save_to_db(col)
+        Save Record in MongoDB collection
+    load_one(cls, db, query, col, projection=None, sort=None, games_col='games', users_col='users', guestions_col='questions', cached=True)
+        Alternative constructor of record selected by filter, loaded from cache or in single query
+    """
+    db = UnchangedTypedPropert(AsyncIOMotorDatabase)
+    __slots__ = ()
+
+    async def save_to_db(self, col):
+        """
+        Save Record in MongoDB collection, saved record receives only changed fields
+        Duplicates are detected by unique indexes of collection
+
+        Parameters
+        ----------
+        col : str
+            Target collection name
+
+        Raises
+        ------
+        AttributeError
+            Try to create new record with same params as existed one
+        """
+        if self._id == None:
+            try:
+                x = await self.db[col].insert_one(self.to_json())
+            except DuplicateKeyError as e:
+                raise AttributeError(str(e)) from e
+            self._id = ObjectId(x.inserted_id)
+        else:
+            update = self.pending_update()
+            if update:
+                await self.db[col].update_one({'_id': self._id}, update)
+        for related_col, query, update in self.pending_upserts():
+            await self.db[related_col].update_one(query, update, upsert=True)
+        default_cache().invalidate(self.db, col, self._id)
+        self.mark_saved()
+
+    @classmethod
+    async def load_one(cls, db, query, col, projection=None, sort=None, games_col='games', users_col='users', guestions_col='questions', cached=True):
+        """
+            Alternative constructor of record selected by filter, loaded from cache or in single query
+        Parameters
+        ----------
+        db : motor.motor_asyncio.AsyncIOMotorDatabase
+            Database containing record
+        query : dict
+            Find filter of record
+        col : str
+            Name of record collection
+        projection : dict, optional
+            Fetched fields, projection of class by default
+        sort : list of tuple, optional
+            Order selecting first of matched records
+        games_col : str, default 'games'
+            Games collection name
+        users_col : str, default 'users'
+            Users collection name
+        guestions_col : str, default 'questions'
+            Questions collection name
+        cached : bool, default True
+            Use record cache, False reads current record from database
+
+        Returns
+        -------
+        AsyncRecordMixin
+            New instance of class containing values of fetched record or None
+        """
+        key = cls.cache_key(query) if cached and projection is None and sort is None else None
+        document = None
+        if key is not None:
+            document = default_cache().get(db, col, *key)
+        if document is None:
+            document = await db[col].find_one(
+                query, cls.projection if projection is None else projection, sort=sort)
+            if document is None:
+                return None
+            if key is not None:
+                default_cache().put(db, col, document, cls.cache_keys)
+        return cls.from_document(db, document, games_col, users_col, guestions_col)
+
+
+class AsyncGame(AsyncRecordMixin, Game):
+    """
+        Game style MongoDB record adapter using Motor
+
+    Methods
+    -------
+    load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True)
+        Alternative constructor of existed record's object selected by id
+    load_by_users(cls, db, users, col, unfinished=False)
+        Alternative constructor of existed record's object selected by users list
+    save_to_db(col)
+        Save Record in MongoDB collection
+    """
+    __slots__ = ()
+
+    @classmethod
+    async def load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True):
+        """
+            Alternative constructor of existed record's object selected by id
+        Parameters
+        ----------
+        db : motor.motor_asyncio.AsyncIOMotorDatabase
+            Database containing Game style record
+        _id : ObjectId
+            Id of loaded record
+        games_col : str, default 'games'
+            Games collection name
+        users_col : str, default 'users'
+            Users collection name
+        guestions_col : str, default 'questions'
+            Questions collection name
+        cached : bool, default True
+            Use record cache, False reads current record from database
+
+        Returns
+        -------
+        AsyncGame
+            New instance of AsyncGame class containing values of existed record or None
+        """
+        return await cls.load_one(db, {'_id': _id}, games_col, games_col=games_col,
+                                  users_col=users_col, guestions_col=guestions_col, cached=cached)
+
+    @classmethod
+    async def load_by_users(cls, db, users, col, unfinished=False):
+        """
+            Alternative constructor of existed record's object selected by users list
+            Exact users set is matched by indexed users_key, the newest game is loaded in one query
+        Parameters
+        ----------
+        db : motor.motor_asyncio.AsyncIOMotorDatabase
+            Database containing Game style record
+        users : list of ObjectId
+            List of users ObjectIds
+        col : str
+            Name of games collection
+        unfinished : bool, default False
+            Match only games which are not finished
+
+        Returns
+        -------
+        AsyncGame
+            New instance of AsyncGame class containing values of existed record or None
+        """
+        return await cls.load_one(db, cls.users_query(users, unfinished), col,
+                                  sort=[('_id', pymongo.DESCENDING)], games_col=col)
+
+    async def save_to_db(self, col):
+        """
+            Save Record in MongoDB collection
+        Parameters
+        ----------
+        col : str
+            Name of games collection
+        """
+        try:
+            self.game_time = datetime.datetime.now()
+        except AttributeError:
+            print('Game saved again')
+        await super().save_to_db(col)
+
+
+class AsyncUser(AsyncRecordMixin, User):
+    """
+        User style MongoDB record adapter using Motor
+
+    Methods
+    -------
+    load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True)
+        Alternative constructor of existed record's object selected by id
+    load_by_name(cls, db, name, col)
+        Alternative constructor of existed record's object selected by user's name
+    """
+    __slots__ = ()
+
+    @classmethod
+    async def load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True):
+        """
+            Alternative constructor of existed record's object selected by id
+        Parameters
+        ----------
+        db : motor.motor_asyncio.AsyncIOMotorDatabase
+            Database containing User style record
+        _id : ObjectId
+            Id of loaded record
+        games_col : str, default 'games'
+            Games collection name
+        users_col : str, default 'users'
+            Users collection name
+        guestions_col : str, default 'questions'
+            Questions collection name
+        cached : bool, default True
+            Use record cache, False reads current record from database
+
+        Returns
+        -------
+        AsyncUser
+            New instance of AsyncUser class containing values of existed record or None
+        """
+        return await cls.load_one(db, {'_id': _id}, users_col, games_col=games_col,
+                                  users_col=users_col, guestions_col=guestions_col, cached=cached)
+
+    @classmethod
+    async def load_by_name(cls, db, name, col):
+        """
+            Alternative constructor of existed record's object selected by user's name
+        Parameters
+        ----------
+        db : motor.motor_asyncio.AsyncIOMotorDatabase
+            Database containing User style record
+        name : str
+            User's name
+        col : str
+            Name of users collection
+
+        Returns
+        -------
+        AsyncUser
+            New instance of AsyncUser class containing values of existed or created record
+        """
+        user = await cls.load_one(db, {'name': name}, col, users_col=col)
+        if user is not None:
+            return user
+        new_user = cls(db, users_col=col)
+        new_user.name = name
+        try:
+            await new_user.save_to_db(col)
+        except AttributeError:
+            # Same name registered meanwhile by parallel request, unique index keeps one record
+            return await cls.load_one(db, {'name': name}, col, users_col=col)
+        return new_user
+
+
+class AsyncQuestion(AsyncRecordMixin, Question):
+    """
+        Question style MongoDB record adapter using Motor
+
+    Methods
+    -------
+    load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True)
+        Alternative constructor of existed record's object selected by id
+    load_new_question()
+        Trivia API request for geting new random question
+    get_unknown_question(cls, db, questions, col, exclude=(), users=())
+        Alternative constructor for record containing question not contained in list
+    sample_unknown_document(db, questions, col, sample_size=SAMPLE_SIZE, exclude=(), users=())
+        Pick random record with question not contained in list
+    """
+    __slots__ = ()
+
+    @classmethod
+    async def load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True):
+        """
+            Alternative constructor of existed record's object selected by id
+        Parameters
+        ----------
+        db : motor.motor_asyncio.AsyncIOMotorDatabase
+            Database containing Question style record
+        _id : ObjectId
+            Id of loaded record
+        games_col : str, default 'games'
+            Games collection name
+        users_col : str, default 'users'
+            Users collection name
+        guestions_col : str, default 'questions'
+            Questions collection name
+        cached : bool, default True
+            Use record cache, False reads current record from database
+
+        Returns
+        -------
+        AsyncQuestion
+            New instance of AsyncQuestion class containing values of existed record or None
+        """
+        return await cls.load_one(db, {'_id': _id}, guestions_col, games_col=games_col,
+                                  users_col=users_col, guestions_col=guestions_col, cached=cached)
+
+    async def load_new_question(self):
+        """
+            Trivia API request for geting new random question
+        Raises
+        ------
+        OpenTDBError
+            Trivia API returned no question
+        """
+        results = await default_async_client().fetch(1)
+        if not results:
+            raise OpenTDBError(1)
+        self.fill_from_document(self.document_from_api(results[0]))
+
+    @classmethod
+    async def get_unknown_question(cls, db, questions, col, exclude=(), users=()):
+        """
+            Alternative constructor for record containing question not contained in list
+        Parameters
+        ----------
+        db : motor.motor_asyncio.AsyncIOMotorDatabase
+            Database containing Question style record
+        questions : set of str
+            Known question codes, any container supporting in operator
+        col : str
+            Name of questions collection
+        exclude : sequence of str, default ()
+            Few additional codes to skip, such as already prefetched questions
+        users : list of ObjectId, default ()
+            Players whose stored history of seen questions is skipped
+
+        Returns
+        -------
+        AsyncQuestion
+            Unique new instance of AsyncQuestion class
+
+        Raises
+        ------
+        pymongo.errors.PyMongoError
+            Sampling failed, Trivia API is asked only when no unknown question is stored
+        """
+        random_question = await cls.sample_unknown_document(
+            db, questions, col, exclude=exclude, users=users)
+        if random_question is not None:
+            default_cache().put(db, col, random_question, cls.cache_keys)
+            return cls.from_document(db, random_question, guestions_col=col)
+        new_question = cls(db, guestions_col=col)
+        await new_question.load_new_question()
+        try:
+            await new_question.save_to_db(col)
+        except AttributeError:
+            new_question = await cls.load_one(
+                db, {'question_code': new_question.question_code}, col, guestions_col=col)
+        return new_question
+
+    @staticmethod
+    async def sample_unknown_document(db, questions, col, sample_size=SAMPLE_SIZE, exclude=(), users=()):
+        """
+            Pick random record with question not contained in list
+        Parameters
+        ----------
+        db : motor.motor_asyncio.AsyncIOMotorDatabase
+            Database containing Question style record
+        questions : set of str
+            Known question codes, any container supporting in operator
+        col : str
+            Name of questions collection
+        sample_size : int, default SAMPLE_SIZE
+            Number of random records checked before database side filtering fallback
+        exclude : sequence of str, default ()
+            Few additional codes to skip
+        users : list of ObjectId, default ()
+            Players whose stored history of seen questions is skipped
+
+        Returns
+        -------
+        dict or None
+            Questions collection record or None if all questions are known
+        """
+        async for document in db[col].aggregate(Question.sample_pipeline(sample_size, users)):
+            code = document['question_code']
+            if code not in questions and code not in exclude:
+                return document
+        async for document in db[col].aggregate(Question.unknown_pipeline(questions, exclude, users)):
+            return document
+        return None
@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import OrderedDict
+import bson
+from app.libs.metrics import default_registry
+
+DEFAULT_TTL = {'users': 30.0, 'games': 5.0, 'questions': None}  # Seconds, None keeps record until evicted
+
+
+class RecordCache:
+    """
+    In-process LRU cache of fetched record documents with per collection TTL
+    Documents are kept BSON encoded, so every hit builds new objects and records never share lists.
+    Entries are found by _id or by secondary unique fields, such as users name.
+
+    Attributes
+    ----------
+    max_bytes : int
+        Memory cap of encoded documents
+    ttl : dict
+        Collection name to seconds of keeping document, None keeps it until evicted
+
+    Methods
+    -------
+    get(db, col, field, value)
+        Cached document selected by _id or secondary field
+    put(db, col, document, keys=())
+        Cache fetched document under _id and secondary fields
+    invalidate(db, col, _id)
+        Drop document changed in database
+    clear()
+        Drop all documents
+    stats()
+        Hit, miss, eviction, expiration and invalidation counters
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, ttl=None) -> None:
+        """
+            Prepare empty cache
+        Parameters
+        ----------
+        max_bytes : int, default 64 MiB
+            Memory cap of encoded documents
+        ttl : dict, optional
+            Collection name to seconds of keeping document, DEFAULT_TTL by default,
+            collections missing in mapping are not cached
+        """
+        self.max_bytes = max_bytes
+        self.ttl = DEFAULT_TTL if ttl is None else ttl
+        self._entries = OrderedDict()  # (db, col, _id) to (expiry, encoded document, secondary keys)
+        self._keys = {}  # (db, col, field, value) to _id
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ['hits', 'misses', 'evictions', 'expirations', 'invalidations'], 0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, db, col, field, value):
+        """
+            Cached document selected by _id or secondary field
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            Database of record
+        col : str
+            Collection name
+        field : str
+            '_id' or secondary field given to put
+        value :
+            Field value
+
+        Returns
+        -------
+        dict or None
+            New copy of document, None on miss
+        """
+        with self._lock:
+            _id = value if field == '_id' else self._keys.get((db.name, col, field, value))
+            entry = self._entries.get((db.name, col, _id))
+            if entry is not None and entry[0] is not None and entry[0] < time.monotonic():
+                self._drop((db.name, col, _id))
+                self._counters['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end((db.name, col, _id))
+            self._counters['hits'] += 1
+            encoded = entry[1]
+        return bson.decode(encoded)
+
+    def put(self, db, col, document, keys=()):
+        """
+            Cache fetched document under _id and secondary fields
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            Database of record
+        col : str
+            Collection name, documents of collections without TTL entry are skipped
+        document : dict
+            Fetched document containing _id
+        keys : sequence of str, default ()
+            Secondary unique fields of document
+        """
+        if col not in self.ttl:
+            return
+        encoded = bson.encode(document)
+        if len(encoded) > self.max_bytes:
+            return
+        ttl = self.ttl[col]
+        expiry = None if ttl is None else time.monotonic() + ttl
+        secondary = [(db.name, col, field, document[field])
+                     for field in keys if field in document]
+        with self._lock:
+            self._drop((db.name, col, document['_id']))
+            self._entries[(db.name, col, document['_id'])] = (expiry, encoded, secondary)
+            self._bytes += len(encoded)
+            for key in secondary:
+                self._keys[key] = document['_id']
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._counters['evictions'] += 1
+
+    def invalidate(self, db, col, _id):
+        """
+            Drop document changed in database
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            Database of record
+        col : str
+            Collection name
+        _id : bson.objectid.ObjectId
+            Id of changed record
+        """
+        with self._lock:
+            if self._drop((db.name, col, _id)):
+                self._counters['invalidations'] += 1
+
+    def clear(self):
+        """
+            Drop all documents
+        """
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+            Hit, miss, eviction, expiration and invalidation counters
+        Returns
+        -------
+        dict
+            Counters with current number of entries and bytes
+        """
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries), bytes=self._bytes)
+
+    def _drop(self, key):
+        """
+            Remove entry with its secondary keys, called under lock
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= len(entry[1])
+        for secondary in entry[2]:
+            if self._keys.get(secondary) == key[2]:
+                del self._keys[secondary]
+        return True
+
+
+_default_cache = None
+
+
+def default_cache():
+    """
+        Shared cache used by records loads
+    Returns
+    -------
+    RecordCache
+        Process wide record cache
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = RecordCache()
+    return _default_cache
+
+
+if default_registry().enabled:
+    default_registry().gauge('bigquiz_record_cache', 'Record cache counters with current entries and bytes',
+                             lambda: default_cache().stats(), label_name='stat')
@@ -0,0 +1,85 @@
+import os
+import threading
+from pymongo.mongo_client import MongoClient
+
+
+class LazyClient:
+    """
+    MongoClient created on first use in every process
+    Construction resolves SRV records and starts monitor threads, so it is deferred until first
+    request. Forked process gets its own client, pymongo clients are not fork safe.
+
+    Attributes
+    ----------
+    uri : str
+        MongoDB connection string
+    options : dict
+        MongoClient keyword arguments
+
+    Methods
+    -------
+    database(name)
+        Database of process client
+    close()
+        Close client of current process
+    """
+
+    def __init__(self, uri, **options) -> None:
+        """
+            Remember connection settings without connecting
+        Parameters
+        ----------
+        uri : str
+            MongoDB connection string
+        options :
+            MongoClient keyword arguments
+        """
+        self.uri = uri
+        self.options = options
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """
+            MongoClient of current process, created on first access
+        Returns
+        -------
+        pymongo.mongo_client.MongoClient
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Client inherited from parent process is dropped without close, its sockets are shared
+                    self._client = MongoClient(self.uri, **self.options)
+                    self._pid = os.getpid()
+        return self._client
+
+    @property
+    def connected(self):
+        return self._pid == os.getpid()
+
+    def database(self, name):
+        """
+            Database of process client
+        Parameters
+        ----------
+        name : str
+            Database name
+
+        Returns
+        -------
+        pymongo.database.Database
+        """
+        return self.client[name]
+
+    def close(self):
+        """
+            Close client of current process
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._pid = None
@@ -1,78 +1,222 @@
-from constants import MONGO_DB_URI, MONGO_DB_NAME
+import atexit
 import json
+import os
+import threading
 from app.quiz.records import User
-from flask import Blueprint, Response
-from pymongo.mongo_client import MongoClient
+from app.quiz.indexes import ensure_indexes
+from flask import Blueprint, Response, current_app, request, stream_with_context
+from .connection import LazyClient
 from .models import Quiz
-from functools import partial
-from app.libs.tools import print_game_state
+from .rooms import RoomRegistry, DEFAULT_ROOM
+from .state import MongoStateStore
+from .journal import WriteBehind
+from .events import format_sse
+from app.libs.metrics import default_registry, event_listeners, timed
 blueprint = Blueprint('quiz', __name__)
 
-myclient = MongoClient(MONGO_DB_URI)
-mydb = myclient[MONGO_DB_NAME]
 
-quiz = Quiz(mydb)
+class QuizContext:
+    """
+    Database connection and game rooms of quiz endpoints, created on first request of every process
+    Application construction stays free of network calls, so it can be imported and forked cheaply.
+
+    Attributes
+    ----------
+    config : app.config.Config
+        Application settings
+    client : LazyClient
+        Fork aware MongoDB client
+    event_streams : threading.BoundedSemaphore
+        Free slots of /events streams, every stream holds one server thread
+
+    Methods
+    -------
+    close()
+        Close rooms, journal and client of current process
+    """
+
+    def __init__(self, config) -> None:
+        """
+            Prepare context without connecting
+        Parameters
+        ----------
+        config : app.config.Config
+            Application settings
+        """
+        self.config = config
+        self.client = LazyClient(config.mongo_uri, **dict(
+            {'event_listeners': event_listeners()}, **config.client_options))
+        self.event_streams = threading.BoundedSemaphore(config.event_streams)
+        self._rooms = None
+        self._write_behind = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def db(self):
+        """
+            MongoDB Database of current process
+        Returns
+        -------
+        pymongo.database.Database
+        """
+        return self.client.database(self.config.mongo_db)
+
+    @property
+    def rooms(self):
+        """
+            Room registry of current process, created with indexes and journal recovery on first access
+        Returns
+        -------
+        RoomRegistry
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+        return self._rooms
+
+    def _start(self):
+        """
+            Create room registry of current process, called under lock
+        """
+        db = self.db
+        ensure_indexes(db)
+        config = self.config
+        self._write_behind = WriteBehind(
+            db, config.journal_directory) if config.journal_directory else None
+        self._rooms = RoomRegistry(db, quiz_factory=config.quiz_factory or Quiz, state_store=MongoStateStore(
+            db) if config.state_store == 'mongo' else None, write_behind=self._write_behind)
+        if self._write_behind is not None:
+            self._rooms.recover()
+            atexit.register(self._write_behind.close)
+        self._pid = os.getpid()
+
+    def close(self):
+        """
+            Close rooms, journal and client of current process
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                self._rooms.close()
+                if self._write_behind is not None:
+                    self._write_behind.close()
+            self._rooms = None
+            self._write_behind = None
+            self._pid = None
+            self.client.close()
+
+
+def init_app(app, config):
+    """
+        Register quiz endpoints under /quiz with context of config
+    Parameters
+    ----------
+    app : flask.Flask
+        Application
+    config : app.config.Config
+        Application settings
+    """
+    app.extensions['bigquiz'] = QuizContext(config)
+    app.register_blueprint(blueprint, url_prefix='/quiz')
+
+
+def quiz_context():
+    """
+        QuizContext of current application
+    Returns
+    -------
+    QuizContext
+    """
+    return current_app.extensions['bigquiz']
 
 
-quiz_state = partial(print_game_state, quiz=quiz)
+request_seconds = default_registry().histogram(
+    'bigquiz_request_seconds', 'Duration of quiz endpoints', ('endpoint',))
 
 
-@blueprint.route('/register_user/<user_name>')
-@quiz_state
-def register_user(user_name):
+def room_route(rule):
+    """
+        Register endpoint under default room rule and room namespaced rule
+    Parameters
+    ----------
+    rule : str
+        Endpoint rule without room prefix
+    """
+    def decorator(func):
+        blueprint.route(rule, defaults={'room_id': DEFAULT_ROOM})(func)
+        return blueprint.route(f'/rooms/<room_id>{rule}')(func)
+    return decorator
+
+
+@room_route('/register_user/<user_name>')
+@timed(request_seconds)
+def register_user(user_name, room_id):
     """
         Endpoint for register user in the QuizGame
     Parameters
     ----------
     user_name : str
         User name
+    room_id : str
+        Game room id
 
     Returns
     -------
     Response JSON
         TODO User register success
     """
-    user = User.load_by_name(mydb, user_name, 'users')
-    quiz.register_user(user)
+    user = User.load_by_name(quiz_context().db, user_name, 'users')
+    with quiz_context().rooms.use(room_id) as quiz:
+        quiz.register_user(user)
     return Response(json.dumps(True), mimetype='app/json')
 
 
-@blueprint.route('/remove_user/<user_name>')
-@quiz_state
-def remove_user(user_name):
+@room_route('/remove_user/<user_name>')
+@timed(request_seconds)
+def remove_user(user_name, room_id):
     """
         Endpoint to remove user from the QuizGame
     Parameters
     ----------
     user_name : str
         User name
+    room_id : str
+        Game room id
 
     Returns
     -------
     Response JSON
         TODO User removing success
     """
-    quiz.remove_user(user_name)
+    with quiz_context().rooms.use(room_id) as quiz:
+        quiz.remove_user(user_name)
     return Response(json.dumps(True), mimetype='app/json')
 
 
-@blueprint.route('/start_game')
-@quiz_state
-def start_game():
+@room_route('/start_game')
+@timed(request_seconds)
+def start_game(room_id):
     """
         Endpoint to start new game depends on loaded users
+    Parameters
+    ----------
+    room_id : str
+        Game room id
+
     Returns
     -------
     Response JSON
         TODO Game starting success
     """
-    quiz.start_game(quiz.propose_game())
+    with quiz_context().rooms.use(room_id) as quiz:
+        quiz.start_game(quiz.propose_game())
     return Response(json.dumps(True), mimetype='app/json')
 
 
-@blueprint.route('/put_answer/<user_name>/<choice>')
-@quiz_state
-def put_answer(user_name, choice):
+@room_route('/put_answer/<user_name>/<choice>')
+@timed(request_seconds)
+def put_answer(user_name, choice, room_id):
     """_summary_
 
     Parameters
@@ -81,6 +225,8 @@ def put_answer(user_name, choice):
         _description_
     choice : str
         Given answer in 
+    room_id : str
+        Game room id
 
     Returns
     -------
@@ -95,26 +241,72 @@ def put_answer(user_name, choice):
         print('Invalid answer')
         success = False
     else:
-        success = quiz.register_answer(
-            user_name, answer)
+        with quiz_context().rooms.use(room_id, exclusive=False) as quiz:
+            success = quiz.register_answer(user_name, answer)
     finally:
         return Response(json.dumps(success), mimetype='app/json')
 
 
-@blueprint.route('/send_x/<user_name>')
-@quiz_state
-def send_x(user_name):
+@room_route('/send_x/<user_name>')
+@timed(request_seconds)
+def send_x(user_name, room_id):
     """
         Endpoint to run special action send by third party android app
     Parameters
     ----------
     user_name : str
         User name
+    room_id : str
+        Game room id
 
     Returns
     -------
     _type_
         TODO Game starting success
     """
-    quiz.start_game(quiz.propose_game())
+    with quiz_context().rooms.use(room_id) as quiz:
+        quiz.start_game(quiz.propose_game())
     return Response(json.dumps(True), mimetype='app/json')
+
+
+@room_route('/events')
+def events(room_id):
+    """
+        Server-Sent Events stream of question-changed, answer-received and score-updated events
+        Reconnecting client receives missed events after Last-Event-ID
+    Parameters
+    ----------
+    room_id : str
+        Game room id
+
+    Returns
+    -------
+    Response text/event-stream
+        Endless stream of game events, 503 when all stream slots of process are taken,
+        ASGI application serves streams without holding threads
+    """
+    context = quiz_context()
+    quiz = context.rooms.get(room_id).quiz
+    try:
+        last_id = int(request.headers.get('Last-Event-ID'))
+    except (TypeError, ValueError):
+        last_id = None
+    if last_id is not None and last_id > quiz.events.last_id:
+        last_id = None  # Id of earlier room, for example from before restart, client gets current state
+
+    def stream():
+        if last_id is None:
+            yield f"event: question-changed\ndata: {json.dumps(quiz.question_state())}\n\n"
+        for event in quiz.events.listen(last_id):
+            yield format_sse(event)
+    # Slot is taken last and released by closed response, so failed room loads can not leak it
+    if not context.event_streams.acquire(blocking=False):
+        return Response(json.dumps(False), status=503, mimetype='app/json', headers={'Retry-After': '5'})
+    try:
+        response = Response(stream_with_context(stream()), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        response.call_on_close(context.event_streams.release)
+    except BaseException:
+        context.event_streams.release()
+        raise
+    return response
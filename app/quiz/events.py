@@ -0,0 +1,142 @@
+import json
+import threading
+from collections import deque
+
+
+class Broadcaster:
+    """
+    Fan-out of game events to any number of listeners
+    Events are kept in bounded ring buffer with increasing ids, listeners only remember
+    id of last received event, so idle listener costs no queue and no thread of broadcaster.
+
+    Methods
+    -------
+    publish(name, data)
+        Add new event and wake up listeners
+    events_after(last_id)
+        Events published after event with given id
+    listen(last_id=None, timeout=15.0)
+        Generator of events, None is yielded after timeout without events
+    close()
+        Finish all listeners after delivering buffered events
+    """
+
+    def __init__(self, history=256) -> None:
+        """
+            Prepare empty events buffer
+        Parameters
+        ----------
+        history : int, default 256
+            Number of last events available for reconnecting listeners
+        """
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @property
+    def last_id(self):
+        """
+            Id of last published event
+        Returns
+        -------
+        int
+            Event id, 0 before first event
+        """
+        return self._last_id
+
+    def publish(self, name, data):
+        """
+            Add new event and wake up listeners
+        Parameters
+        ----------
+        name : str
+            Event name
+        data :
+            Json serializable event data
+        """
+        with self._condition:
+            self._last_id += 1
+            self._events.append((self._last_id, name, data))
+            self._condition.notify_all()
+
+    def events_after(self, last_id):
+        """
+            Events published after event with given id
+        Parameters
+        ----------
+        last_id : int
+            Id of last received event
+
+        Returns
+        -------
+        list of tuple
+            (id, name, data) events still kept in buffer
+        """
+        with self._condition:
+            return [event for event in self._events if event[0] > last_id]
+
+    def listen(self, last_id=None, timeout=15.0):
+        """
+            Generator of events, None is yielded after timeout without events
+        Parameters
+        ----------
+        last_id : int, optional
+            Id of last received event, new events only by default, ids above last
+            published event, for example from before restart, are treated as current
+        timeout : float, default 15.0
+            Seconds of waiting before yielding None
+
+        Returns
+        -------
+        generator
+            (id, name, data) events or None for keep-alive
+        """
+        with self._condition:
+            last_id = self._last_id if last_id is None else min(last_id, self._last_id)
+        return self._listen(last_id, timeout)
+
+    def _listen(self, last_id, timeout):
+        """
+            Events generator started from last_id fixed at listen() call
+        """
+        while True:
+            with self._condition:
+                if self._last_id <= last_id and not self._closed:
+                    self._condition.wait(timeout)
+                events = [event for event in self._events if event[0] > last_id]
+                closed = self._closed
+            if not events:
+                if closed:
+                    return
+                yield None
+            for event in events:
+                last_id = event[0]
+                yield event
+
+    def close(self):
+        """
+            Finish all listeners after delivering buffered events
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+def format_sse(event):
+    """
+        Format event as Server-Sent Events message
+    Parameters
+    ----------
+    event : tuple or None
+        (id, name, data) event or None for keep-alive comment
+
+    Returns
+    -------
+    str
+        Server-Sent Events message
+    """
+    if event is None:
+        return ': keep-alive\n\n'
+    event_id, name, data = event
+    return f'id: {event_id}\nevent: {name}\ndata: {json.dumps(data)}\n\n'
@@ -0,0 +1,167 @@
+"""
+    Index bootstrap and query plan verification for BigQuiz collections
+
+    Run from repository root:
+        python -m app.quiz.indexes           # create indexes
+        python -m app.quiz.indexes --check   # create indexes and fail on collection scanning plans
+"""
+import argparse
+import os
+import sys
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+from app.quiz.records import Game, User, Question, SeenQuestion, SEEN_COLLECTION
+
+RECORD_COLLECTIONS = {'games': Game, 'users': User, 'questions': Question,
+                      SEEN_COLLECTION: SeenQuestion}
+
+
+def ensure_indexes(db, collections=RECORD_COLLECTIONS):
+    """
+        Idempotently create indexes declared by every record adapter
+        Failing build, such as unique index over duplicates left by older versions, is reported and
+        skipped, so application still starts, app.quiz.migrate fixes the data
+    Parameters
+    ----------
+    db : pymongo.database.Database
+        Database containing BigQuiz collections
+    collections : dict, default RECORD_COLLECTIONS
+        Collection name to MongoRecordAdapter subclass mapping
+
+    Returns
+    -------
+    list of str
+        Names of collections whose indexes could not be built
+    """
+    failed = []
+    for col, record in collections.items():
+        try:
+            record.create_indexes(db, col)
+        except OperationFailure as e:
+            print(f'Indexes of {col} not created, run app.quiz.migrate first: {e}')
+            failed.append(col)
+    return failed
+
+
+def record_queries(db):
+    """
+        Commands issued by records module, built by the same query and pipeline builders as records use
+    Parameters
+    ----------
+    db : pymongo.database.Database
+        Database of explained commands
+
+    Returns
+    -------
+    list of tuple
+        (description, collection name, find, aggregate or update command document)
+    """
+    some_id = ObjectId()
+    users = [ObjectId(), ObjectId()]
+    known = [Question.make_question_code(str(x), '', []) for x in range(3)]
+    user = User(db)
+    user._id = some_id
+    user.questions.append(known[0])
+    seen_col, seen_query, seen_update = user.pending_upserts()[0]
+
+    def find(col, record, query, sort=None):
+        # load_one is find_one, projection and sort of adapter class
+        command = {'find': col, 'filter': query, 'limit': 1}
+        if record.projection is not None:
+            command['projection'] = record.projection
+        if sort is not None:
+            command['sort'] = dict(sort)
+        return col, command
+
+    def aggregate(col, pipeline):
+        return col, {'aggregate': col, 'pipeline': pipeline, 'cursor': {}}
+
+    return [
+        ('User.load_by_id', *find('users', User, {'_id': some_id})),
+        ('User.load_by_name', *find('users', User, {'name': 'player'})),
+        ('User.pending_upserts', seen_col, {'update': seen_col, 'updates': [
+            {'q': seen_query, 'u': seen_update, 'upsert': True}]}),
+        ('Game.load_by_id', *find('games', Game, {'_id': some_id})),
+        ('Game.load_by_users', *find('games', Game, Game.users_query(users, unfinished=True), Game.newest_first)),
+        ('Question.load_by_id', *find('questions', Question, {'_id': some_id})),
+        ('Question code lookup', *find('questions', Question, {'question_code': known[0]})),
+        ('Question.sample_pipeline', *aggregate('questions', Question.sample_pipeline(users=users))),
+        ('Question.unknown_pipeline', *aggregate('questions', Question.unknown_pipeline(known, users=users))),
+    ]
+
+
+def _scans(plan, skip_cursor=False):
+    """
+        Yield collection scans found in explain output
+        $lookup stages report scans of joined collection as collectionScans, SBE joins as strategy
+    Parameters
+    ----------
+    plan : dict or list
+        Explain output or its part
+    skip_cursor : bool, default False
+        Skip $cursor stage, which reads random records of opening $sample by design
+    """
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            if key == 'stage' and value == 'COLLSCAN':
+                yield 'COLLSCAN'
+            elif key == 'collectionScans' and value:
+                yield '$lookup COLLSCAN'
+            elif key == 'strategy' and value == 'NestedLoopJoin':
+                yield 'NestedLoopJoin'
+            elif not (skip_cursor and key == '$cursor'):
+                yield from _scans(value, skip_cursor)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _scans(value, skip_cursor)
+
+
+def check_query_plans(db, queries=None):
+    """
+        Explain every records command with execution statistics and find ones scanning collection
+        Statistics of $lookup stages are reported only for executed pipelines, so collections should hold data
+    Parameters
+    ----------
+    db : pymongo.database.Database
+        Database containing BigQuiz collections with created indexes
+    queries : list of tuple, optional
+        Commands in record_queries(db) format, all records commands by default
+
+    Returns
+    -------
+    list of str
+        Descriptions of commands scanning collection
+    """
+    failures = []
+    for description, col, command in queries or record_queries(db):
+        plan = db.command('explain', command, verbosity='executionStats')
+        opening_sample = '$sample' in command.get('pipeline', [{}])[0]
+        scans = set(_scans(plan, skip_cursor=opening_sample))
+        if scans:
+            failures.append(f"{description} ({', '.join(sorted(scans))}): {command}")
+    return failures
+
+
+def main():
+    from app.config import Config
+    config = Config.from_env(mongo_uri=os.environ.get('BIGQUIZ_MONGO_URI'))
+    from pymongo.mongo_client import MongoClient
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--check', action='store_true',
+                        help='Fail when any records command scans collection')
+    parser.add_argument('--uri', default=config.mongo_uri, required=config.mongo_uri is None,
+                        help='MongoDB connection string, BIGQUIZ_MONGO_URI by default')
+    parser.add_argument('--db', default=config.mongo_db)
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    ensure_indexes(db)
+    if args.check:
+        failures = check_query_plans(db)
+        for failure in failures:
+            print(f'Collection scan {failure}')
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+    Batched Trivia API ingestion keeping questions collection topped up
+
+    Run from repository root:
+        python -m app.quiz.ingest --target 5000
+        python -m app.quiz.ingest --target 5000 --interval 600
+"""
+import argparse
+import os
+import time
+import requests
+from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.mongo_client import MongoClient
+from app.quiz.opentdb import OpenTDBClient, OpenTDBError, BATCH_SIZE
+from app.quiz.records import Question
+
+MAX_BATCHES = 100  # HTTP calls of single top up run
+MAX_IDLE_BATCHES = 3  # Batches in a row without new question ending top up run
+
+
+def prepare_batch(db, results, col='questions'):
+    """
+        Convert Trivia API results to records which are not yet in collection
+    Parameters
+    ----------
+    db : pymongo.database.Database
+        Database containing questions collection
+    results : list of dict
+        Trivia API question records
+    col : str, default 'questions'
+        Name of questions collection
+
+    Returns
+    -------
+    list of dict
+        New questions collection records deduplicated by question_code
+    """
+    documents = {}
+    for result in results:
+        document = Question.document_from_api(result)
+        documents.setdefault(document['question_code'], document)
+    existing = db[col].find(
+        {'question_code': {'$in': list(documents)}}, {'question_code': 1, '_id': 0})
+    for record in existing:
+        documents.pop(record['question_code'], None)
+    return list(documents.values())
+
+
+def insert_batch(db, documents, col='questions'):
+    """
+        Bulk insert of questions, duplicates inserted meanwhile are skipped
+    Parameters
+    ----------
+    db : pymongo.database.Database
+        Database containing questions collection
+    documents : list of dict
+        New questions collection records
+    col : str, default 'questions'
+        Name of questions collection
+
+    Returns
+    -------
+    int
+        Number of inserted records
+    """
+    if not documents:
+        return 0
+    try:
+        return len(db[col].insert_many(documents, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        return e.details['nInserted']
+
+
+def ingest(db, client, target, col='questions', batch_size=BATCH_SIZE, max_batches=MAX_BATCHES,
+           max_idle_batches=MAX_IDLE_BATCHES):
+    """
+        Fetch batches from Trivia API until collection contains target number of questions
+    Parameters
+    ----------
+    db : pymongo.database.Database
+        Database containing questions collection
+    client : OpenTDBClient
+        Trivia API client
+    target : int
+        Expected number of questions in collection
+    col : str, default 'questions'
+        Name of questions collection
+    batch_size : int, default BATCH_SIZE
+        Number of questions requested in single HTTP call
+    max_batches : int, default MAX_BATCHES
+        Limit of HTTP calls, None for no limit
+    max_idle_batches : int, default MAX_IDLE_BATCHES
+        Number of batches in a row without new question after which run stops, as API serves only known questions
+
+    Returns
+    -------
+    int
+        Number of inserted records
+    """
+    inserted = 0
+    batches = 0
+    idle_batches = 0
+    missing = target - db[col].count_documents({})
+    while missing > 0 and (max_batches is None or batches < max_batches) and idle_batches < max_idle_batches:
+        try:
+            results = client.fetch(min(batch_size, missing))
+        except OpenTDBError as e:
+            print(e)
+            break
+        batches += 1
+        added = insert_batch(db, prepare_batch(db, results, col), col)
+        idle_batches = 0 if added else idle_batches + 1
+        inserted += added
+        missing -= added
+    return inserted
+
+
+def main():
+    from app.config import Config
+    config = Config.from_env(mongo_uri=os.environ.get('BIGQUIZ_MONGO_URI'))
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--target', type=int, required=True,
+                        help='Expected number of questions in collection')
+    parser.add_argument('--interval', type=float, default=None,
+                        help='Seconds between top up runs, single run if not given')
+    parser.add_argument('--uri', default=config.mongo_uri, required=config.mongo_uri is None,
+                        help='MongoDB connection string, BIGQUIZ_MONGO_URI by default')
+    parser.add_argument('--db', default=config.mongo_db)
+    parser.add_argument('--url', default=None, help='Trivia API endpoint')
+    parser.add_argument('--max-batches', type=int, default=MAX_BATCHES,
+                        help='Limit of HTTP calls in single top up run')
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    Question.create_indexes(db, 'questions')
+    client = OpenTDBClient(args.url) if args.url else OpenTDBClient()
+    while True:
+        start = time.perf_counter()
+        try:
+            inserted = ingest(db, client, args.target, max_batches=args.max_batches)
+        except (requests.RequestException, PyMongoError) as e:
+            if args.interval is None:
+                raise
+            # Transient failure of periodic run, next run tries again
+            print(e)
+        else:
+            print(f'Inserted {inserted} questions in {time.perf_counter() - start:.1f} s')
+        if args.interval is None:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,443 @@
+import fcntl
+import glob
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from bson import json_util
+from pymongo import UpdateOne
+from app.quiz.cache import default_cache
+
+ROUND_FIELD = 'journal_rounds'  # Record field with tags of last applied rounds
+ROUND_HISTORY = 64  # Number of round tags kept in record for idempotent replay
+
+
+class Journal:
+    """
+    Append-only journal file of JSON lines synchronized to disk in batches
+    Every fsync covers all entries appended before it, so concurrent writers share
+    disk flushes. File is locked while open, so other processes know it is in use.
+
+    Attributes
+    ----------
+    path : str
+        Journal file path
+
+    Methods
+    -------
+    append(entry)
+        Write entry, returning its sequence number
+    wait(seq=None)
+        Block until entry with sequence number is on disk
+    size()
+        Current journal size in bytes
+    rewrite(entries)
+        Atomically replace journal content
+    read(path)
+        Entries of journal file, truncated last line is skipped
+    close()
+        Synchronize and close journal file
+    """
+
+    def __init__(self, path, sync_interval=0.002) -> None:
+        """
+            Open journal for appending and start synchronizing thread
+        Parameters
+        ----------
+        path : str
+            Journal file path
+        sync_interval : float, default 0.002
+            Seconds of collecting entries before next fsync
+        """
+        self.path = path
+        self.sync_interval = sync_interval
+        self._file = self._open(path)
+        self._condition = threading.Condition()
+        self._written = 0
+        self._synced = 0
+        self._closed = False
+        self._syncer = threading.Thread(
+            target=self._run, name='journal-sync', daemon=True)
+        self._syncer.start()
+
+    @staticmethod
+    def _open(path):
+        """
+            Open file for appending under exclusive lock
+        """
+        journal_file = open(path, 'ab')
+        fcntl.flock(journal_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return journal_file
+
+    def append(self, entry):
+        """
+            Write entry, returning its sequence number
+        Parameters
+        ----------
+        entry : dict
+            BSON serializable entry
+
+        Returns
+        -------
+        int
+            Sequence number of entry
+        """
+        line = (json_util.dumps(entry) + '\n').encode()
+        with self._condition:
+            self._file.write(line)
+            self._written += 1
+            self._condition.notify_all()
+            return self._written
+
+    def wait(self, seq=None):
+        """
+            Block until entry with sequence number is on disk
+        Parameters
+        ----------
+        seq : int, optional
+            Sequence number returned by append, last appended entry by default
+        """
+        with self._condition:
+            seq = self._written if seq is None else seq
+            while self._synced < seq and not self._closed:
+                self._condition.wait()
+
+    def size(self):
+        """
+            Current journal size in bytes
+        """
+        with self._condition:
+            return self._file.tell()
+
+    def rewrite(self, entries):
+        """
+            Atomically replace journal content
+        Parameters
+        ----------
+        entries : list of dict
+            New journal content
+        """
+        temporary = f'{self.path}.{uuid.uuid4().hex}'
+        with self._condition:
+            new_file = self._open(temporary)
+            for entry in entries:
+                new_file.write((json_util.dumps(entry) + '\n').encode())
+            new_file.flush()
+            os.fsync(new_file.fileno())
+            os.replace(temporary, self.path)
+            self._file.close()
+            self._file = new_file
+            self._synced = self._written
+            self._condition.notify_all()
+
+    @staticmethod
+    def read(path):
+        """
+            Entries of journal file, truncated last line is skipped
+        Parameters
+        ----------
+        path : str
+            Journal file path
+
+        Returns
+        -------
+        list of dict
+            Journal entries in writing order
+        """
+        entries = []
+        with open(path, 'rb') as journal_file:
+            for line in journal_file:
+                try:
+                    entries.append(json_util.loads(line))
+                except ValueError:
+                    print(f'Skipped broken journal line of {path}')
+        return entries
+
+    def close(self):
+        """
+            Synchronize and close journal file
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._syncer.join()
+        self._file.close()
+
+    def _run(self):
+        """
+            Synchronizing thread, one fsync for all entries appended meanwhile
+        """
+        while True:
+            with self._condition:
+                while self._synced == self._written and not self._closed:
+                    self._condition.wait()
+                if self._closed and self._synced == self._written:
+                    return
+            time.sleep(self.sync_interval)
+            with self._condition:
+                seq = self._written
+                self._file.flush()
+                descriptor = os.dup(self._file.fileno())
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+            with self._condition:
+                self._synced = max(self._synced, seq)
+                self._condition.notify_all()
+
+
+class WriteBehind:
+    """
+    Journaled write-behind of round results and live game states
+    Rounds are journaled in request and written to MongoDB by background thread in batches.
+    Every round update is conditioned on its tag, so replayed round is applied only once.
+
+    Attributes
+    ----------
+    db : pymongo.database.Database
+        MongoDB Database reference
+    directory : str
+        Directory of journal files, one file per process
+
+    Methods
+    -------
+    record_state(key, state)
+        Journal live game state of room
+    submit(unit)
+        Journal updates of UnitOfWork and queue them for writing
+    wait_synced()
+        Block until journaled entries are on disk
+    wait_flushed()
+        Block until submitted rounds are written to MongoDB
+    recover()
+        Replay journals of finished processes
+    close()
+        Write queued rounds and close journal
+    """
+
+    def __init__(self, db, directory, batch_size=256, max_bytes=16 * 2**20, state_ttl=3600.0, retry=1.0) -> None:
+        """
+            Open journal of process and start writing thread
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            MongoDB Database reference
+        directory : str
+            Directory of journal files
+        batch_size : int, default 256
+            Maximal number of rounds in single write
+        max_bytes : int, default 16 MiB
+            Journal size which triggers compaction after all rounds are written
+        state_ttl : float, default 3600.0
+            Seconds after which journaled room state is dropped
+        retry : float, default 1.0
+            Seconds of waiting after failed write
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.db = db
+        self.directory = directory
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.state_ttl = state_ttl
+        self.retry = retry
+        self.journal = Journal(os.path.join(
+            directory, f'journal-{os.getpid()}-{uuid.uuid4().hex[:8]}.log'))
+        self._states = OrderedDict()
+        self._queue = deque()
+        self._submitted = 0
+        self._flushed = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(
+            target=self._run, name='write-behind', daemon=True)
+        self._writer.start()
+
+    def record_state(self, key, state):
+        """
+            Journal live game state of room
+        Parameters
+        ----------
+        key : str
+            Room identifier
+        state : dict
+            Document returned by Quiz.dump_state
+
+        Returns
+        -------
+        int
+            Journal sequence number of entry
+        """
+        entry = {'type': 'state', 'key': key,
+                 'time': time.time(), 'state': state}
+        with self._condition:
+            self._states[key] = entry
+            self._states.move_to_end(key)
+        return self.journal.append(entry)
+
+    def submit(self, unit):
+        """
+            Journal updates of UnitOfWork and queue them for writing
+        Parameters
+        ----------
+        unit : UnitOfWork
+            Unit with collected round updates
+
+        Returns
+        -------
+        str
+            Round tag
+        """
+        updates, upserts = unit.take_updates()
+        entry = {'type': 'round', 'tag': uuid.uuid4().hex,
+                 'updates': updates, 'upserts': upserts}
+        with self._condition:
+            self.journal.append(entry)
+            self._queue.append(entry)
+            self._submitted += 1
+            self._condition.notify_all()
+        return entry['tag']
+
+    def wait_synced(self):
+        """
+            Block until journaled entries are on disk
+        """
+        self.journal.wait()
+
+    def wait_flushed(self):
+        """
+            Block until rounds submitted so far are written to MongoDB
+        """
+        with self._condition:
+            submitted = self._submitted
+            while self._flushed < submitted:
+                self._condition.wait()
+
+    def recover(self):
+        """
+            Replay journals of finished processes, their files are removed afterwards
+            Rounds missing their flushed mark are written again, at most once per record.
+        Returns
+        -------
+        dict
+            Room identifier to last journaled live state
+        """
+        states = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, 'journal-*.log'))):
+            if path == self.journal.path:
+                continue
+            try:
+                lock = Journal._open(path)
+            except OSError:
+                # Journal is still used by living process
+                continue
+            try:
+                rounds = OrderedDict()
+                for entry in Journal.read(path):
+                    if entry['type'] == 'round':
+                        rounds[entry['tag']] = entry
+                    elif entry['type'] == 'flushed':
+                        for tag in entry['tags']:
+                            rounds.pop(tag, None)
+                    elif entry['type'] == 'state' and time.time() - entry['time'] < self.state_ttl:
+                        states[entry['key']] = entry
+                self._write(list(rounds.values()))
+                os.remove(path)
+            finally:
+                lock.close()
+        for key, entry in states.items():
+            self.record_state(key, entry['state'])
+        return {key: entry['state'] for key, entry in states.items()}
+
+    def close(self):
+        """
+            Write queued rounds and close journal
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._writer.join()
+        self.journal.close()
+
+    @staticmethod
+    def operations(rounds):
+        """
+            Group updates of rounds by collection, every update is conditioned on round tag
+            Upserts are idempotent by themselves, so they are sent without tag
+        Parameters
+        ----------
+        rounds : list of dict
+            Journal round entries
+
+        Returns
+        -------
+        dict
+            Collection name to list of pymongo.UpdateOne in rounds order
+        """
+        operations = OrderedDict()
+        for entry in rounds:
+            for col, _id, update in entry['updates']:
+                update = dict(update)
+                pushed = dict(update.get('$push', {}))
+                pushed[ROUND_FIELD] = {
+                    '$each': [entry['tag']], '$slice': -ROUND_HISTORY}
+                update['$push'] = pushed
+                operations.setdefault(col, []).append(UpdateOne(
+                    {'_id': _id, ROUND_FIELD: {'$ne': entry['tag']}}, update))
+            for col, query, update in entry.get('upserts', []):
+                operations.setdefault(col, []).append(
+                    UpdateOne(query, update, upsert=True))
+        return operations
+
+    def _write(self, rounds):
+        """
+            Send rounds as one ordered bulk_write per collection
+        """
+        for col, ops in self.operations(rounds).items():
+            self.db[col].bulk_write(ops, ordered=True)
+        cache = default_cache()
+        for entry in rounds:
+            for col, _id, _ in entry['updates']:
+                cache.invalidate(self.db, col, _id)
+
+    def _run(self):
+        """
+            Writing thread, takes queued rounds in batches
+        """
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                rounds = [self._queue[x]
+                          for x in range(min(self.batch_size, len(self._queue)))]
+            try:
+                self._write(rounds)
+            except Exception as e:
+                print(e)
+                time.sleep(self.retry)
+                continue
+            self.journal.append(
+                {'type': 'flushed', 'tags': [entry['tag'] for entry in rounds]})
+            with self._condition:
+                for _ in rounds:
+                    self._queue.popleft()
+                self._flushed += len(rounds)
+                self._condition.notify_all()
+                idle = not self._queue
+            if idle and self.journal.size() > self.max_bytes:
+                self._compact()
+
+    def _compact(self):
+        """
+            Replace journal by live states of rooms, called when all rounds are written
+        """
+        now = time.time()
+        with self._condition:
+            if self._queue:
+                return
+            for key in [key for key, entry in self._states.items() if now - entry['time'] > self.state_ttl]:
+                del self._states[key]
+            self.journal.rewrite(list(self._states.values()))
@@ -0,0 +1,249 @@
+"""
+    Database migrations of BigQuiz collections
+
+    Run from repository root:
+        python -m app.quiz.migrate question-codes
+        python -m app.quiz.migrate seen-questions
+        python -m app.quiz.migrate game-users-key
+        python -m app.quiz.migrate user-names
+
+    question-codes rewrites codes in users documents, so it has to run before seen-questions.
+    user-names merges users of the same name, unique name index can not be built before it.
+"""
+import argparse
+import os
+import datetime
+from pymongo import UpdateOne, DeleteOne
+from pymongo.mongo_client import MongoClient
+from app.quiz.records import Game, User, Question, SeenQuestion, SEEN_COLLECTION
+
+
+def _flush(collection, operations):
+    """
+        Send collected operations as one bulk write
+    Returns
+    -------
+    list
+        Empty list for next operations
+    """
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return []
+
+
+def migrate_question_codes(db, games_col='games', users_col='users', questions_col='questions', batch_size=1000):
+    """
+        Rewrite question codes to content hashes in questions, users and games collections
+        Questions with the same content are merged, so unique question_code index can be created.
+        Old codes shared by several questions are replaced in users history by all new codes.
+    Parameters
+    ----------
+    db : pymongo.database.Database
+        Database containing BigQuiz collections
+    games_col : str, default 'games'
+        Games collection name
+    users_col : str, default 'users'
+        Users collection name
+    questions_col : str, default 'questions'
+        Questions collection name
+    batch_size : int, default 1000
+        Number of operations sent in single bulk write
+
+    Returns
+    -------
+    dict
+        Number of rewritten questions, removed duplicates, users and games
+    """
+    if 'question_code_1' in db[questions_col].index_information():
+        db[questions_col].drop_index('question_code_1')
+    mapping = {}
+    new_codes = set()
+    operations = []
+    summary = {'questions': 0, 'duplicates': 0, 'users': 0, 'games': 0}
+    for document in db[questions_col].find({}, {'question': 1, 'correct_answer': 1, 'incorrect_answers': 1, 'question_code': 1}):
+        code = Question.make_question_code(
+            document['question'], document['correct_answer'], document['incorrect_answers'])
+        mapping.setdefault(document['question_code'], [])
+        if code not in mapping[document['question_code']]:
+            mapping[document['question_code']].append(code)
+        if code in new_codes:
+            operations.append(DeleteOne({'_id': document['_id']}))
+            summary['duplicates'] += 1
+        else:
+            new_codes.add(code)
+            if code != document['question_code']:
+                operations.append(UpdateOne({'_id': document['_id']}, {
+                    '$set': {'question_code': code}}))
+                summary['questions'] += 1
+        if len(operations) >= batch_size:
+            operations = _flush(db[questions_col], operations)
+    _flush(db[questions_col], operations)
+    Question.create_indexes(db, questions_col)
+
+    for col, key, expand in ((users_col, 'users', True), (games_col, 'games', False)):
+        operations = []
+        for document in db[col].find({}, {'questions': 1}):
+            questions = []
+            for old_code in document.get('questions', []):
+                codes = mapping.get(old_code, [old_code])
+                questions.extend(codes if expand else codes[:1])
+            if questions != document.get('questions', []):
+                operations.append(UpdateOne({'_id': document['_id']}, {
+                    '$set': {'questions': questions}}))
+                summary[key] += 1
+            if len(operations) >= batch_size:
+                operations = _flush(db[col], operations)
+        _flush(db[col], operations)
+    return summary
+
+
+def migrate_seen_questions(db, users_col='users', seen_col=SEEN_COLLECTION, batch_size=1000):
+    """
+        Move questions arrays of users documents into seen-questions collection
+        Array is removed only after its records are written, so interrupted migration can be run again.
+    Parameters
+    ----------
+    db : pymongo.database.Database
+        Database containing BigQuiz collections
+    users_col : str, default 'users'
+        Users collection name
+    seen_col : str, default SEEN_COLLECTION
+        Seen-questions collection name
+    batch_size : int, default 1000
+        Number of operations sent in single bulk write
+
+    Returns
+    -------
+    dict
+        Number of migrated users and seen-questions records
+    """
+    SeenQuestion.create_indexes(db, seen_col)
+    migrated_at = datetime.datetime.now()  # Real time of seeing is not stored in arrays
+    summary = {'users': 0, 'seen': 0}
+    operations = []
+    for document in db[users_col].find({'questions': {'$exists': True}}, {'questions': 1}):
+        for code in dict.fromkeys(document['questions']):
+            operations.append(UpdateOne({'user_id': document['_id'], 'question_code': code},
+                                        {'$setOnInsert': {'seen_at': migrated_at}},
+                                        upsert=True))
+            summary['seen'] += 1
+            if len(operations) >= batch_size:
+                operations = _flush(db[seen_col], operations)
+        operations = _flush(db[seen_col], operations)
+        db[users_col].update_one({'_id': document['_id']}, {
+                                 '$unset': {'questions': ''}})
+        summary['users'] += 1
+    return summary
+
+
+def migrate_game_users_key(db, games_col='games', batch_size=1000):
+    """
+        Set users_key of games saved before it existed, so Game.load_by_users can find them
+    Parameters
+    ----------
+    db : pymongo.database.Database
+        Database containing BigQuiz collections
+    games_col : str, default 'games'
+        Games collection name
+    batch_size : int, default 1000
+        Number of operations sent in single bulk write
+
+    Returns
+    -------
+    dict
+        Number of updated games
+    """
+    Game.create_indexes(db, games_col)
+    summary = {'games': 0}
+    operations = []
+    for document in db[games_col].find({'users_key': {'$exists': False}}, {'users': 1}):
+        operations.append(UpdateOne({'_id': document['_id']}, {
+            '$set': {'users_key': Game.make_users_key(document.get('users', []))}}))
+        summary['games'] += 1
+        if len(operations) >= batch_size:
+            operations = _flush(db[games_col], operations)
+    _flush(db[games_col], operations)
+    return summary
+
+
+def migrate_user_names(db, users_col='users', games_col='games', seen_col=SEEN_COLLECTION, batch_size=1000):
+    """
+        Merge users sharing the same name into the oldest of them, so unique name index can be created
+        Games, correct answers and seen questions of removed users are moved to the kept one.
+    Parameters
+    ----------
+    db : pymongo.database.Database
+        Database containing BigQuiz collections
+    users_col : str, default 'users'
+        Users collection name
+    games_col : str, default 'games'
+        Games collection name
+    seen_col : str, default SEEN_COLLECTION
+        Seen-questions collection name
+    batch_size : int, default 1000
+        Number of operations sent in single bulk write
+
+    Returns
+    -------
+    dict
+        Number of removed duplicate users, rewritten games and moved seen-questions records
+    """
+    summary = {'users': 0, 'games': 0, 'seen': 0}
+    duplicates = db[users_col].aggregate([
+        {'$group': {'_id': '$name', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}}])
+    for group in duplicates:
+        documents = sorted(db[users_col].find({'_id': {'$in': group['ids']}}), key=lambda x: x['_id'])
+        kept, removed = documents[0], [x['_id'] for x in documents[1:]]
+        update = {'games': list(dict.fromkeys(x for document in documents for x in document.get('games', []))),
+                  'correct_answers': sum(document.get('correct_answers', 0) for document in documents)}
+        if any('questions' in document for document in documents):
+            update['questions'] = list(dict.fromkeys(
+                x for document in documents for x in document.get('questions', [])))
+        db[users_col].update_one({'_id': kept['_id']}, {'$set': update})
+
+        operations = []
+        for record in db[seen_col].find({'user_id': {'$in': removed}}):
+            operations.append(UpdateOne({'user_id': kept['_id'], 'question_code': record['question_code']},
+                                        {'$setOnInsert': {'seen_at': record.get('seen_at')}}, upsert=True))
+            summary['seen'] += 1
+            if len(operations) >= batch_size:
+                operations = _flush(db[seen_col], operations)
+        _flush(db[seen_col], operations)
+        db[seen_col].delete_many({'user_id': {'$in': removed}})
+
+        operations = []
+        for game in db[games_col].find({'users': {'$in': removed}}, {'users': 1}):
+            users = [kept['_id'] if x in removed else x for x in game['users']]
+            operations.append(UpdateOne({'_id': game['_id']}, {
+                '$set': {'users': users, 'users_key': Game.make_users_key(users)}}))
+            summary['games'] += 1
+            if len(operations) >= batch_size:
+                operations = _flush(db[games_col], operations)
+        _flush(db[games_col], operations)
+        db[users_col].delete_many({'_id': {'$in': removed}})
+        summary['users'] += len(removed)
+    User.create_indexes(db, users_col)
+    return summary
+
+
+MIGRATIONS = {'question-codes': migrate_question_codes,
+              'seen-questions': migrate_seen_questions,
+              'game-users-key': migrate_game_users_key,
+              'user-names': migrate_user_names}
+
+
+def main():
+    from app.config import Config
+    config = Config.from_env(mongo_uri=os.environ.get('BIGQUIZ_MONGO_URI'))
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('migration', choices=sorted(MIGRATIONS))
+    parser.add_argument('--uri', default=config.mongo_uri, required=config.mongo_uri is None,
+                        help='MongoDB connection string, BIGQUIZ_MONGO_URI by default')
+    parser.add_argument('--db', default=config.mongo_db)
+    args = parser.parse_args()
+    print(MIGRATIONS[args.migration](MongoClient(args.uri)[args.db]))
+
+
+if __name__ == '__main__':
+    main()
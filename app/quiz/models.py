@@ -2,7 +2,17 @@ from app.quiz.records import User, Question, Game
 import random
 from pymongo.database import Database
 from app.libs.types import UnchangedTypedPropert
-from collections import OrderedDict
+from app.quiz.pool import QuestionPool
+from app.quiz.unit_of_work import UnitOfWork
+from app.quiz.events import Broadcaster
+from collections import Counter, OrderedDict, deque
+import threading
+import time
+from app.libs.metrics import default_registry
+
+ANSWER_WAIT = 10.0  # Seconds of waiting for next question by answer given between rounds
+round_seconds = default_registry().histogram(
+    'bigquiz_round_seconds', 'Time from showing question to its last answer')
 
 
 class Quiz:
@@ -13,6 +23,8 @@ class Quiz:
     ----------
     db : pymongo.database.Database
         MongoDB Database reference
+    events : Broadcaster
+        Stream of question-changed, answer-received and score-updated events
 
     Methods
     -------
@@ -21,41 +33,76 @@ class Quiz:
     current_question()
     current_question(question)
         Set new question and reset MongoDB state for new answers
+    question_state()
+        Current question with answers in displayed order
     start_game(game)
         Set new or saved Game and load it's state
     update_game(game)
         Update game and users params in connected MongoDB records
+    attach_write_behind(write_behind, key)
+        Journal answers and round results, writing rounds to MongoDB in background
+    flush_rounds(wait=False)
+        Write queued round results in completion order
     consider_question()
         Check if all answers for current question are received and in that case edit game and users params
     register_user(user)
         Add user ro loaded users list and prepare game state for additional one
+    remove_user(user_name)
+        Remove user from loaded users list and game state
     get_known_questions()
-        Prepare unique question codes list based on users questions
+        Question codes seen by loaded users since load, kept up to date incrementally
+    get_player_ids()
+        Ids of loaded users
     register_answer(user_name,choice)
         Put choice in user's key update answers order and run loading new question if needed 
     load_next_question()
         Load new question based on previous one
     propose_game()
         Check if in games collection is unfinished game started by all loaded users
+    dump_state()
+        Live game state as MongoDB document
+    load_state(state)
+        Replace live game state by one dumped by other worker
+    close()
+        Release background resources of quiz
     """
     db = UnchangedTypedPropert(Database)
+    unit_of_work = UnitOfWork  # Unit collecting round writes
+    question_pool = QuestionPool  # Pool of prefetched questions
 
-    def __init__(self, db):
+    def __init__(self, db, use_transaction=False):
         """
             Initialize quiz game manager with default state
         Parameters
         ----------
         db : pymongo.database.Database
             MongoDB Database reference
+        use_transaction : bool, default False
+            Write round results in single transaction, requires replica set
         """
         self.db = db
+        self.use_transaction = use_transaction
         self._loaded_users = OrderedDict()
         self._current_question = None
+        self._question_shown = None  # perf_counter of showing current question, kept with metrics only
+        self._round_closed = False  # Answers are rejected between completed round and next question
         self._shuffled_answers = [0, 1, 2, 3]
         self._users_answers = OrderedDict()
         self._score = OrderedDict()
         self._order = []
         self.__current_game = None
+        self._known_counts = Counter()  # Question code to number of loaded users knowing it
+        self._known_snapshot = frozenset()
+        self._lock = threading.RLock()  # Guards game state, held only for in-memory work
+        self._write_lock = threading.Lock()  # Keeps round writes in completion order
+        self._transition_lock = threading.Lock()  # Serializes game starts and question loads, held over I/O
+        self._round_opened = threading.Condition(self._lock)  # Notified when next question is shown
+        self._pending_rounds = deque()
+        self._write_behind = None
+        self._journal_key = None
+        self.events = Broadcaster()
+        self._question_pool = self.question_pool(
+            db, self.get_known_questions, players=self.get_player_ids)
 
     @property
     def loaded_users(self):
@@ -82,7 +129,7 @@ class Quiz:
     @current_question.setter
     def current_question(self, question):
         """
-            Set new question and reset MongoDB state for new answers
+            Set new question and reset MongoDB state for new answers, called under state lock
         Parameters
         ----------
         question : Question
@@ -92,7 +139,27 @@ class Quiz:
             self._users_answers = dict.fromkeys(self._users_answers, None)
             self._order = []
             self._current_question = question
+            self._round_closed = False
+            self._round_opened.notify_all()
             random.shuffle(self._shuffled_answers)
+            if round_seconds.enabled:
+                self._question_shown = time.perf_counter()
+            self.events.publish('question-changed', self.question_state())
+
+    def question_state(self):
+        """
+            Current question with answers in displayed order
+        Returns
+        -------
+        dict
+            Json format question state, None values without question
+        """
+        question = self.current_question
+        if question is None:
+            return {'question': None, 'category': None, 'answers': []}
+        answers = [question.correct_answer] + list(question.incorrect_answers)
+        return {'question': question.question, 'category': question.category,
+                'answers': [answers[x] for x in self._shuffled_answers if x < len(answers)]}
 
     def start_game(self, game):
         """
@@ -102,27 +169,133 @@ class Quiz:
         game : Game
             New or saved Game object
         """
-        if isinstance(game, Game):
-            self.__current_game = game
-            if game._id == None:
-                for user in self.loaded_users:
-                    game.users.append(user._id)
-                game.save_to_db('games')
-                for user in self.loaded_users:
-                    user.games.append(game._id)
-                self._score = OrderedDict.fromkeys(self._score, 0)
-            else:
-                self._score = OrderedDict(
-                    [(k, v) for k, v in zip(self._score.keys(), game.score)])
-            self.load_next_question()
+        if not isinstance(game, Game):
+            return
+        with self._transition_lock:
+            with self._lock:
+                is_new = self._prepare_game(game)
+            try:
+                if is_new:
+                    game.save_to_db('games')
+                    with self._lock:
+                        unit = self._join_game_unit(game)
+                    unit.flush()
+                self.load_next_question()
+            except Exception:
+                with self._lock:
+                    self._abort_game()
+                raise
+        self.flush_rounds()
+
+    def _prepare_game(self, game):
+        """
+            Set game as current one and prepare score, called under state lock
+            Answers are rejected until question of the game is loaded
+        Parameters
+        ----------
+        game : Game
+            New or saved Game object
+
+        Returns
+        -------
+        Boolean
+            Game is new and has to be saved
+        """
+        self.__current_game = game
+        self._round_closed = True
+        if game._id == None:
+            game.users.load([user._id for user in self.loaded_users])
+            game.score = [0 for _ in self.loaded_users]
+            self._score = OrderedDict.fromkeys(self._score, 0)
+            return True
+        self._score = OrderedDict(
+            [(k, v) for k, v in zip(self._score.keys(), game.score)])
+        return False
+
+    def _abort_game(self):
+        """
+            Drop current game after failed game start or question load, called under state lock
+            Waiting and later answers are rejected at once, the game can be proposed and started again
+        """
+        self.__current_game = None
+        self._round_closed = False
+        self._round_opened.notify_all()
+        self._journal_state()
+
+    def _join_game_unit(self, game):
+        """
+            Add saved new game to loaded users' games, called under state lock, unit is flushed outside
+        Returns
+        -------
+        UnitOfWork
+            Unit with users' updates
+        """
+        unit = self.unit_of_work(self.db, self.use_transaction)
+        for user in self.loaded_users:
+            user.games.load([game._id])
+            unit.add(user, 'users')
+        return unit
 
     def update_game(self):
         """
             Update game and users params in connected MongoDB records
+            Only round changes are sent, one bulk_write per collection
+        """
+        with self._lock:
+            self._queue_round()
+        self.flush_rounds()
+
+    def attach_write_behind(self, write_behind, key):
+        """
+            Journal answers and round results, writing rounds to MongoDB in background
+        Parameters
+        ----------
+        write_behind : WriteBehind
+            Journaled writer shared by quizzes of process
+        key : str
+            Identifier of quiz state in journal
+        """
+        self._write_behind = write_behind
+        self._journal_key = key
+
+    def _journal_state(self):
         """
-        self.__current_game.save_to_db('games')
+            Journal live game state, called under state lock so entries keep changes order
+        """
+        if self._write_behind is not None:
+            self._write_behind.record_state(
+                self._journal_key, self.dump_state())
+
+    def _queue_round(self):
+        """
+            Collect changes of game and users as next round to write, called under state lock
+        """
+        unit = self.unit_of_work(self.db, self.use_transaction)
+        unit.add(self.__current_game, 'games')
         for user in self.loaded_users:
-            user.save_to_db('users')
+            unit.add(user, 'users')
+        if self._write_behind is not None:
+            self._write_behind.submit(unit)
+        else:
+            self._pending_rounds.append(unit)
+
+    def flush_rounds(self, wait=False):
+        """
+            Write queued round results in completion order, outside of state lock
+            With write-behind rounds are already journaled, only disk synchronization is awaited
+        Parameters
+        ----------
+        wait : bool, default False
+            With write-behind wait until rounds are written to MongoDB
+        """
+        if self._write_behind is not None:
+            if wait:
+                self._write_behind.wait_flushed()
+            self._write_behind.wait_synced()
+            return
+        with self._write_lock:
+            while self._pending_rounds:
+                self._pending_rounds.popleft().flush()
 
     def consider_question(self):
         """
@@ -139,6 +312,9 @@ class Quiz:
                     self._loaded_users[user].correct_answers += 1
                 self._loaded_users[user].questions.append(
                     self.current_question.question_code)
+            self._known_counts[self.current_question.question_code] = len(
+                self._users_answers)
+            self._known_snapshot = None
             return True
         return False
 
@@ -155,26 +331,79 @@ class Quiz:
         TypeError
             New user is not in User type
         """
-        if isinstance(user, User):
+        if not isinstance(user, User):
+            raise TypeError
+        with self._lock:
+            previous = self._loaded_users.get(user.name)
+            if previous is not None:
+                self._forget_questions(previous)
             self._users_answers[user.name] = None
             self._score[user.name] = 0
             self._loaded_users[user.name] = user
-        else:
-            raise TypeError
+            self._known_counts.update(set(user.questions))
+            self._known_snapshot = None
+            self._journal_state()
+        self._question_pool.invalidate()
+
+    def remove_user(self, user_name):
+        """
+            Remove user from loaded users list and game state
+        Parameters
+        ----------
+        user_name : str
+            Name of removed user
+        """
+        with self._lock:
+            user = self._loaded_users.pop(user_name, None)
+            if user is None:
+                print('Unregistered user')
+                return
+            self._forget_questions(user)
+            self._users_answers.pop(user_name, None)
+            self._score.pop(user_name, None)
+            if user_name in self._order:
+                self._order.remove(user_name)
+            self._journal_state()
+        self._question_pool.invalidate()
+
+    def _forget_questions(self, user):
+        """
+            Remove questions of leaving user from known questions index, called under state lock
+        """
+        for code in set(user.questions):
+            self._known_counts[code] -= 1
+            if self._known_counts[code] <= 0:
+                del self._known_counts[code]
+        self._known_snapshot = None
 
     def get_known_questions(self):
-        """_summary_
-            Prepare unique question codes list based on users questions
+        """
+            Question codes seen by loaded users since load and questions of current game
+            Earlier history is skipped by sampler anti-join with seen-questions collection.
+            Index is updated with every user and round, set is rebuilt at most once per change
         Returns
         -------
-        list
+        frozenset
             Question codes
         """
-        known_questions_codes = set()
-        for user in self.loaded_users:
-            for question in user.questions:
-                known_questions_codes.add(question)
-        return list(known_questions_codes)
+        snapshot = self._known_snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._known_snapshot is None:
+                    self._known_snapshot = frozenset(self._known_counts)
+                snapshot = self._known_snapshot
+        return snapshot
+
+    def get_player_ids(self):
+        """
+            Ids of loaded users
+        Returns
+        -------
+        list of ObjectId
+            Ids of saved loaded users
+        """
+        with self._lock:
+            return [user._id for user in self._loaded_users.values() if user._id is not None]
 
     def register_answer(self, user_name, choice):
         """
@@ -193,33 +422,81 @@ class Quiz:
 
         TODO EXCEPTIONS
         """
-        if self.__current_game:
-            try:
-                self._users_answers[user_name] = choice
-            except KeyError:
-                print('Unregistered user')
-            else:
-                try:
-                    self._order.remove(user_name)
-                except ValueError:
-                    print('This user answer first time')
-                finally:
-                    self._order.append(user_name)
-                if self.consider_question():
-                    self.__current_game.questions.append(
-                        self.current_question.question_code)
-                    self.__current_game.score = list(self._score.values())
-                    self.update_game()
-                    self.load_next_question()
-                return True
-        return False
+        with self._lock:
+            # Answer given while next question is loading counts for that question
+            if self._round_closed and not self._round_opened.wait_for(
+                    lambda: not self._round_closed, ANSWER_WAIT):
+                return False
+            completed = self._apply_answer(user_name, choice)
+            if completed is None:
+                return False
+            self._journal_state()
+        if completed:
+            with self._transition_lock:
+                with self._lock:
+                    waiting = self._round_closed  # Game started meanwhile could load question already
+                if waiting:
+                    try:
+                        self.load_next_question()
+                    except Exception:
+                        with self._lock:
+                            self._abort_game()
+                        self.flush_rounds()  # Completed round is still written
+                        raise
+        if completed or self._write_behind is not None:
+            self.flush_rounds()
+        return True
+
+    def _apply_answer(self, user_name, choice):
+        """
+            Register answer in game state and queue round results, called under state lock
+        Parameters
+        ----------
+        user_name : str
+            Name of responded user
+        choice : int
+            Id of given answer
+
+        Returns
+        -------
+        Boolean or None
+            Completeness of the question, None for rejected answer
+        """
+        if not self.__current_game or self._round_closed:
+            return None
+        if user_name not in self._users_answers:
+            print('Unregistered user')
+            return None
+        self._users_answers[user_name] = choice
+        try:
+            self._order.remove(user_name)
+        except ValueError:
+            print('This user answer first time')
+        finally:
+            self._order.append(user_name)
+        self.events.publish('answer-received', {
+            'user': user_name, 'answered': list(self._order)})
+        completed = self.consider_question()
+        if completed:
+            self._round_closed = True
+            self.__current_game.questions.append(
+                self.current_question.question_code)
+            self.__current_game.score = list(self._score.values())
+            self.events.publish('score-updated', dict(self._score))
+            self._queue_round()
+            if self._question_shown is not None:
+                round_seconds.observe(time.perf_counter() - self._question_shown)
+        return completed
 
     def load_next_question(self):
         """
-            Load new question based on previous one
+            Load new question from prefetched pool outside of state lock and show it
+            Empty pool falls back to MongoDB or Trivia API, so readers of state are not blocked meanwhile
         """
-        self.current_question = Question.get_unknown_question(
-            self.db, self.get_known_questions(), 'questions')
+        question = self._question_pool.pop()
+        with self._lock:
+            self.current_question = question
+            self._journal_state()
 
     def propose_game(self):
         """
@@ -230,5 +507,81 @@ class Quiz:
             Game record reference connected with all users
         """
         proposed_game = Game.load_by_users(
-            self.db, [x._id for x in self.loaded_users], 'games')
+            self.db, [x._id for x in self.loaded_users], 'games', unfinished=True)
         return proposed_game or Game(self.db)
+
+    def dump_state(self):
+        """
+            Live game state as MongoDB document, records are referenced by ids
+        Returns
+        -------
+        dict
+            Users, answers, score, answers order, shuffle, current question and game
+        """
+        with self._lock:
+            question = self._current_question
+            game = self.__current_game
+            return {'users': [[name, user._id] for name, user in self._loaded_users.items()],
+                    'answers': [[name, answer] for name, answer in self._users_answers.items()],
+                    'score': [[name, points] for name, points in self._score.items()],
+                    'order': list(self._order),
+                    'shuffle': list(self._shuffled_answers),
+                    'question': question._id if question is not None else None,
+                    'game': game._id if game is not None else None}
+
+    def load_state(self, state):
+        """
+            Replace live game state by one dumped by other worker
+            Records are reloaded, because other worker could change them
+            Users deleted meanwhile are dropped from state, as remove_user would do
+        Parameters
+        ----------
+        state : dict
+            Document returned by dump_state
+        """
+        users = OrderedDict()
+        for name, _id in state['users']:
+            user = User.load_by_id(self.db, _id, cached=False)
+            if user is None:
+                print(f'Dropped missing user {name}')
+                continue
+            users[name] = user
+        game = Game.load_by_id(
+            self.db, state['game'], cached=False) if state['game'] is not None else None
+        question = self._current_question
+        if state['question'] is None:
+            question = None
+        elif question is None or question._id != state['question']:
+            question = Question.load_by_id(self.db, state['question'])
+        with self._lock:
+            users_changed = list(users) != list(self._loaded_users)
+            question_changed = question is not self._current_question
+            self._loaded_users = users
+            # Reloaded users have no questions seen since load, rounds of other worker are in game
+            self._known_counts = Counter()
+            for user in users.values():
+                self._known_counts.update(set(user.questions))
+            self._known_counts.update(
+                {code: len(users) for code in (game.questions if game is not None and users else [])})
+            self._known_snapshot = None
+            self._users_answers = OrderedDict(
+                (name, answer) for name, answer in state['answers'] if name in users)
+            self._score = OrderedDict((name, score) for name, score in state['score'] if name in users)
+            self._order = [name for name in state['order'] if name in users]
+            self._shuffled_answers = list(state['shuffle'])
+            self._current_question = question
+            self.__current_game = game
+            # Complete answers mean other worker closed the round without showing next question yet
+            self._round_closed = question is None or bool(
+                self._users_answers) and None not in self._users_answers.values()
+            if question_changed:
+                self.events.publish('question-changed', self.question_state())
+        if users_changed:
+            self._question_pool.invalidate()
+
+    def close(self):
+        """
+            Release background resources of quiz
+        """
+        self._question_pool.stop()
+        self.events.close()
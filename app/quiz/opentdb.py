@@ -0,0 +1,258 @@
+import asyncio
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from app.libs.metrics import default_registry, timed
+
+OPEN_TDB_URL = "https://opentdb.com/api.php"
+BATCH_SIZE = 50  # Maximal amount accepted by Trivia API
+RATE_LIMIT_CODE = 5  # Trivia API response_code for too many requests
+# Request path waits at most REQUEST_BACKOFF seconds, long default backoff is left to ingestion
+REQUEST_RETRIES = 1
+REQUEST_BACKOFF = 0.5
+RESPONSE_CODES = {1: 'no results', 2: 'invalid parameter', 3: 'token not found', 4: 'token empty'}
+fetch_seconds = default_registry().histogram(
+    'bigquiz_opentdb_fetch_seconds', 'Duration of Trivia API fetches with retries', ('client',))
+
+
+class OpenTDBError(requests.HTTPError):
+    """
+    Trivia API answered with non-zero response_code other than rate limit
+
+    Attributes
+    ----------
+    response_code : int
+        Trivia API response_code
+    """
+
+    def __init__(self, response_code) -> None:
+        self.response_code = response_code
+        super().__init__(f"Trivia API response_code {response_code}: {RESPONSE_CODES.get(response_code, 'unknown')}")
+
+
+def api_results(body):
+    """
+        Questions of Trivia API response body, None for rate limit response
+    Parameters
+    ----------
+    body : dict
+        Decoded Trivia API response
+
+    Returns
+    -------
+    list of dict or None
+        Trivia API question records
+
+    Raises
+    ------
+    OpenTDBError
+        Trivia API returned other non-zero response_code
+    """
+    if body['response_code'] == RATE_LIMIT_CODE:
+        return None
+    if body['response_code'] != 0:
+        raise OpenTDBError(body['response_code'])
+    return body['results']
+
+
+class OpenTDBClient:
+    """
+    Trivia API client reusing pooled HTTP connections
+
+    Attributes
+    ----------
+    url : str
+        Trivia API questions endpoint
+    timeout : float
+        Timeout of single HTTP request in seconds
+
+    Methods
+    -------
+    fetch(amount)
+        Get list of random multiple choice questions
+    """
+
+    def __init__(self, url=OPEN_TDB_URL, timeout=5.0, retries=5, backoff=5.0, pool_size=4) -> None:
+        """
+            Prepare pooled HTTP session
+        Parameters
+        ----------
+        url : str, default OPEN_TDB_URL
+            Trivia API questions endpoint
+        timeout : float, default 5.0
+            Timeout of single HTTP request in seconds
+        retries : int, default 5
+            Number of retries after rate limit response
+        backoff : float, default 5.0
+            Initial wait in seconds after rate limit response, doubled with every retry
+        pool_size : int, default 4
+            Number of kept alive connections
+        """
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @timed(fetch_seconds, 'sync')
+    def fetch(self, amount=BATCH_SIZE):
+        """
+            Get list of random multiple choice questions
+        Parameters
+        ----------
+        amount : int, default BATCH_SIZE
+            Number of requested questions
+
+        Returns
+        -------
+        list of dict
+            Trivia API question records
+
+        Raises
+        ------
+        OpenTDBError
+            Trivia API returned non-zero response_code other than rate limit
+        requests.HTTPError
+            Trivia API is still rate limiting after all retries or returned error status
+        """
+        wait = self.backoff
+        for attempt in range(self.retries + 1):
+            response = self.session.get(
+                self.url, params={'amount': amount, 'type': 'multiple'}, timeout=self.timeout)
+            if response.status_code != 429:
+                response.raise_for_status()
+                results = api_results(response.json())
+                if results is not None:
+                    return results
+            if attempt < self.retries:
+                time.sleep(wait)
+                wait *= 2
+        raise requests.HTTPError(f'Trivia API rate limit after {self.retries} retries')
+
+
+class AsyncOpenTDBClient(OpenTDBClient):
+    """
+    Trivia API client for asyncio code, waiting for responses without blocking event loop
+    httpx is imported on first usage, so synchronous API does not need it
+
+    Attributes
+    ----------
+    url : str
+        Trivia API questions endpoint
+    timeout : float
+        Timeout of single HTTP request in seconds
+
+    Methods
+    -------
+    fetch(amount)
+        Get list of random multiple choice questions
+    aclose()
+        Close pooled connections
+    """
+
+    def __init__(self, url=OPEN_TDB_URL, timeout=5.0, retries=5, backoff=5.0, pool_size=4) -> None:
+        """
+            Prepare settings, pooled HTTP client is created on first request
+        Parameters
+        ----------
+        url : str, default OPEN_TDB_URL
+            Trivia API questions endpoint
+        timeout : float, default 5.0
+            Timeout of single HTTP request in seconds
+        retries : int, default 5
+            Number of retries after rate limit response
+        backoff : float, default 5.0
+            Initial wait in seconds after rate limit response, doubled with every retry
+        pool_size : int, default 4
+            Number of kept alive connections
+        """
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.session = None
+
+    @timed(fetch_seconds, 'async')
+    async def fetch(self, amount=BATCH_SIZE):
+        """
+            Get list of random multiple choice questions
+        Parameters
+        ----------
+        amount : int, default BATCH_SIZE
+            Number of requested questions
+
+        Returns
+        -------
+        list of dict
+            Trivia API question records
+
+        Raises
+        ------
+        httpx.HTTPStatusError
+            Trivia API returned error status
+        OpenTDBError
+            Trivia API returned non-zero response_code other than rate limit
+        requests.HTTPError
+            Trivia API is still rate limiting after all retries
+        """
+        if self.session is None:
+            import httpx
+            self.session = httpx.AsyncClient(timeout=self.timeout, limits=httpx.Limits(
+                max_connections=self.pool_size, max_keepalive_connections=self.pool_size))
+        wait = self.backoff
+        for attempt in range(self.retries + 1):
+            response = await self.session.get(
+                self.url, params={'amount': amount, 'type': 'multiple'})
+            if response.status_code != 429:
+                response.raise_for_status()
+                results = api_results(response.json())
+                if results is not None:
+                    return results
+            if attempt < self.retries:
+                await asyncio.sleep(wait)
+                wait *= 2
+        raise requests.HTTPError(f'Trivia API rate limit after {self.retries} retries')
+
+    async def aclose(self):
+        """
+            Close pooled connections
+        """
+        if self.session is not None:
+            await self.session.aclose()
+            self.session = None
+
+
+_default_client = None
+_default_async_client = None
+
+
+def default_client():
+    """
+        Shared client used by records loading single questions in requests, with short backoff
+    Returns
+    -------
+    OpenTDBClient
+        Process wide Trivia API client
+    """
+    global _default_client
+    if _default_client is None:
+        _default_client = OpenTDBClient(retries=REQUEST_RETRIES, backoff=REQUEST_BACKOFF)
+    return _default_client
+
+
+def default_async_client():
+    """
+        Shared client used by asyncio records loading single questions in requests, with short backoff
+    Returns
+    -------
+    AsyncOpenTDBClient
+        Process wide asyncio Trivia API client
+    """
+    global _default_async_client
+    if _default_async_client is None:
+        _default_async_client = AsyncOpenTDBClient(retries=REQUEST_RETRIES, backoff=REQUEST_BACKOFF)
+    return _default_async_client
@@ -0,0 +1,139 @@
+import threading
+from collections import deque
+from app.quiz.records import Question
+
+
+class QuestionPool:
+    """
+    Per game pool of ready to serve questions refilled in background thread
+
+    Attributes
+    ----------
+    size : int
+        Number of questions kept in pool
+    low_water : int
+        Pool length which triggers background refill
+
+    Methods
+    -------
+    pop()
+        Take question unknown to players, loading it synchronously if pool is empty
+    invalidate()
+        Drop prefetched questions after change of players set
+    refill()
+        Load questions until pool is full
+    stop()
+        Stop background refilling thread
+    """
+
+    def __init__(self, db, known_questions, col='questions', size=8, low_water=3, players=None):
+        """
+            Prepare empty pool, background worker is started on first demand
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            Database containing questions collection
+        known_questions : callable
+            Function returning set of question codes known by players
+        col : str, default 'questions'
+            Name of questions collection
+        size : int, default 8
+            Number of questions kept in pool
+        low_water : int, default 3
+            Pool length which triggers background refill
+        players : callable, optional
+            Function returning ids of players, whose stored history is skipped by sampler
+        """
+        self.db = db
+        self.size = size
+        self.low_water = low_water
+        self._known_questions = known_questions
+        self._players = players or (lambda: ())
+        self._col = col
+        self._questions = deque()
+        self._lock = threading.Lock()
+        self._refill_needed = threading.Event()
+        self._generation = 0
+        self._stopped = False
+        self._worker = None
+
+    def __len__(self):
+        return len(self._questions)
+
+    def pop(self):
+        """
+            Take question unknown to players, loading it synchronously if pool is empty
+        Returns
+        -------
+        Question
+            Question not contained in players' history
+        """
+        known = self._known_questions()
+        question = None
+        with self._lock:
+            while self._questions:
+                candidate = self._questions.popleft()
+                if candidate.question_code not in known:
+                    question = candidate
+                    break
+            pooled = [x.question_code for x in self._questions]
+        if question is None:
+            question = Question.get_unknown_question(
+                self.db, known, self._col, exclude=pooled, users=self._players())
+        if len(self._questions) < self.low_water:
+            self._request_refill()
+        return question
+
+    def invalidate(self):
+        """
+            Drop prefetched questions after change of players set
+        """
+        with self._lock:
+            self._questions.clear()
+            self._generation += 1
+        self._request_refill()
+
+    def refill(self):
+        """
+            Load questions until pool is full, results loaded for outdated players set are skipped
+        """
+        while not self._stopped and len(self._questions) < self.size:
+            with self._lock:
+                generation = self._generation
+                pooled = [x.question_code for x in self._questions]
+            question = Question.get_unknown_question(
+                self.db, self._known_questions(), self._col, exclude=pooled, users=self._players())
+            with self._lock:
+                if generation == self._generation and question.question_code not in pooled:
+                    self._questions.append(question)
+
+    def stop(self):
+        """
+            Stop background refilling thread
+        """
+        self._stopped = True
+        self._refill_needed.set()
+
+    def _request_refill(self):
+        """
+            Wake up background worker, starting it if needed
+        """
+        if self._worker is None:
+            self._worker = threading.Thread(
+                target=self._run, name='question-pool', daemon=True)
+            self._worker.start()
+        self._refill_needed.set()
+
+    def _run(self):
+        """
+            Background worker loop
+        """
+        while True:
+            self._refill_needed.wait()
+            self._refill_needed.clear()
+            if self._stopped:
+                return
+            try:
+                self.refill()
+            except Exception as e:
+                print(e)
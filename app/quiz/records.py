@@ -2,10 +2,19 @@ import datetime
 import abc
 from bson.objectid import ObjectId
 from pymongo.database import Database
-import requests
-import base64
+import hashlib
+import unicodedata
+import pymongo
+from pymongo import IndexModel
+from pymongo.errors import DuplicateKeyError
 from app.libs.types import UnchangedTypedPropert, MongoIdList
-import random
+from app.quiz.opentdb import default_client, OpenTDBError
+from app.quiz.journal import ROUND_FIELD
+from app.quiz.cache import default_cache
+
+SAMPLE_SIZE = 16  # Random questions checked server side before full $nin scan
+QUESTION_CODE_LENGTH = 20  # Hexadecimal characters of truncated BLAKE2 question hash
+SEEN_COLLECTION = 'seen_questions'  # One record per user and question seen by user
 
 
 class MongoRecordAdapter(abc.ABC):
@@ -19,14 +28,35 @@ class MongoRecordAdapter(abc.ABC):
         MongoDB Database reference
     Methods
     -------
+    from_document(cls, db, document, games_col='games', users_col='users', guestions_col='questions')
+        Alternative constructor of record's object built from already fetched record
+    load_one(cls, db, query, col, projection=None, sort=None, games_col='games', users_col='users', guestions_col='questions', cached=True)
+        Alternative constructor of record selected by filter, loaded from cache or in single query
+    cache_key(cls, query)
+        Cache lookup key of find filter
+    load_from_db(col)
+        Filling object params with values from existed record
     save_to_db(col)
         Save Record in MongoDB collection
+    mark_saved()
+        Remember current params as stored in database
+    pending_update()
+        Prepare minimal update of params changed since last save or load
+    pending_upserts()
+        Idempotent writes of related records in other collections
+    create_indexes(cls, db, col)
+        Idempotently create indexes required by record queries
     to_json()
         Abstract method for MongoRecordAdapter to json/bson converting
 
     """
     _id = UnchangedTypedPropert(ObjectId)
     db = UnchangedTypedPropert(Database)
+    indexes = []  # pymongo.IndexModel list required by record queries
+    projection = None  # Fields fetched by load constructors, whole record by default
+    cache_keys = ()  # Unique fields, besides _id, under which loaded record is cached
+    __slots__ = UnchangedTypedPropert.storage(
+        '_id', 'db') + ('_saved_state', '__weakref__')
 
     def __init__(self, db) -> None:
         """
@@ -37,10 +67,123 @@ class MongoRecordAdapter(abc.ABC):
             Database containing adapting record
         """
         self.db = db
+        self._saved_state = None
+
+    @classmethod
+    def from_document(cls, db, document, games_col='games', users_col='users', guestions_col='questions'):
+        """
+        Alternative constructor of record's object built from already fetched record
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            Database containing adapting record
+        document : dict
+            Collection record containing _id
+        games_col : str, default 'games'
+            Games collection name
+        users_col : str, default 'users'
+            Users collection name
+        guestions_col : str, default 'questions'
+            Questions collection name
+
+        Returns
+        -------
+        MongoRecordAdapter
+            New instance of class containing values of fetched record
+        """
+        instance = cls(db, games_col, users_col, guestions_col)
+        instance._id = document['_id']
+        instance.fill_from_document(document)
+        return instance
+
+    @classmethod
+    def load_one(cls, db, query, col, projection=None, sort=None, games_col='games', users_col='users', guestions_col='questions', cached=True):
+        """
+        Alternative constructor of record selected by filter, loaded from cache or in single query
+        Only equality filter on _id or one of cache_keys with default projection uses cache.
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            Database containing adapting record
+        query : dict
+            Find filter of record
+        col : str
+            Name of record collection
+        projection : dict, optional
+            Fetched fields, projection of class by default
+        sort : list of tuple, optional
+            Order selecting first of matched records
+        games_col : str, default 'games'
+            Games collection name
+        users_col : str, default 'users'
+            Users collection name
+        guestions_col : str, default 'questions'
+            Questions collection name
+        cached : bool, default True
+            Use record cache, False reads current record from database
+
+        Returns
+        -------
+        MongoRecordAdapter
+            New instance of class containing values of fetched record or None
+        """
+        key = cls.cache_key(query) if cached and projection is None and sort is None else None
+        document = None
+        if key is not None:
+            document = default_cache().get(db, col, *key)
+        if document is None:
+            document = db[col].find_one(
+                query, cls.projection if projection is None else projection, sort=sort)
+            if document is None:
+                return None
+            if key is not None:
+                default_cache().put(db, col, document, cls.cache_keys)
+        return cls.from_document(db, document, games_col, users_col, guestions_col)
+
+    @classmethod
+    def cache_key(cls, query):
+        """
+        Cache lookup key of find filter
+        Parameters
+        ----------
+        query : dict
+            Find filter of record
+
+        Returns
+        -------
+        tuple or None
+            (field, value) of equality filter on _id or one of cache_keys, None for other filters
+        """
+        if len(query) != 1:
+            return None
+        field, value = next(iter(query.items()))
+        if field != '_id' and field not in cls.cache_keys or isinstance(value, dict):
+            return None
+        return field, value
+
+    def load_from_db(self, col):
+        """
+        Filling object params with values from existed record
+        Parameters
+        ----------
+        col : str
+            Name of record collection
+
+        Raises
+        ------
+        LookupError
+            Record does not exist
+        """
+        document = self.db[col].find_one({'_id': self._id}, self.projection)
+        if document is None:
+            raise LookupError(f'No record {self._id} in {col}')
+        self.fill_from_document(document)
 
     def save_to_db(self, col):
         """
-        Save Record in MongoDB collection
+        Save Record in MongoDB collection, saved record receives only changed fields
+        Duplicates are detected by unique indexes of collection
+
         Parameters
         ----------
         col : str
@@ -51,17 +194,86 @@ class MongoRecordAdapter(abc.ABC):
         AttributeError
             Try to create new record with same params as existed one
         """
-        new_record = self.to_json()
-        result = self.db[col].find(new_record)
         if self._id == None:
-            if not len(list(result)):
-                x = self.db[col].insert_one(new_record)
-                self._id = ObjectId(x.inserted_id)
-            else:
-                raise AttributeError
+            try:
+                x = self.db[col].insert_one(self.to_json())
+            except DuplicateKeyError as e:
+                raise AttributeError(str(e)) from e
+            self._id = ObjectId(x.inserted_id)
         else:
-            self.db[col].update_one({'_id': self._id},  {
-                '$set': new_record})
+            update = self.pending_update()
+            if update:
+                self.db[col].update_one({'_id': self._id}, update)
+        for related_col, query, update in self.pending_upserts():
+            self.db[related_col].update_one(query, update, upsert=True)
+        default_cache().invalidate(self.db, col, self._id)
+        self.mark_saved()
+
+    def mark_saved(self):
+        """
+        Remember current params as stored in database
+        """
+        self._saved_state = {field: list(value) if isinstance(value, list) else value
+                             for field, value in self.to_json().items()}
+
+    def pending_update(self):
+        """
+        Prepare minimal update of params changed since last save or load
+        Lists grown only at the end are extended with $push, integers and elements
+        of integer lists are changed with $inc
+
+        Returns
+        -------
+        dict
+            MongoDB update document, empty if nothing changed
+        """
+        saved = self._saved_state or {}
+        update = {}
+        for field, value in self.to_json().items():
+            if field not in saved:
+                update.setdefault('$set', {})[field] = value
+                continue
+            old = saved[field]
+            if type(old) == type(value) and old == value:
+                continue
+            if isinstance(old, list) and isinstance(value, list) and \
+                    len(value) > len(old) and value[:len(old)] == old:
+                update.setdefault('$push', {})[field] = {
+                    '$each': value[len(old):]}
+            elif type(old) == int and type(value) == int:
+                update.setdefault('$inc', {})[field] = value - old
+            elif isinstance(old, list) and isinstance(value, list) and len(old) == len(value) and \
+                    all(type(x) == int and type(y) == int for x, y in zip(old, value)):
+                for position, (x, y) in enumerate(zip(old, value)):
+                    if x != y:
+                        update.setdefault('$inc', {})[f'{field}.{position}'] = y - x
+            else:
+                update.setdefault('$set', {})[field] = value
+        return update
+
+    def pending_upserts(self):
+        """
+        Idempotent writes of related records in other collections, changed since last save or load
+        Returns
+        -------
+        list of tuple
+            (collection name, filter, update) upserts, empty by default
+        """
+        return []
+
+    @classmethod
+    def create_indexes(cls, db, col):
+        """
+        Idempotently create indexes required by record queries
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            Database containing adapting record
+        col : str
+            Target collection name
+        """
+        if cls.indexes:
+            db[col].create_indexes(cls.indexes)
 
     @abc.abstractmethod
     def to_json(self):
@@ -83,11 +295,15 @@ class Game(MongoRecordAdapter):
     Methods
     -------
     users()
-    load_by_id(cls, db, games_col='games', users_col='users', guestions_col='questions')
+    load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True)
         Alternative constructor of existed record's object selected by id
-    load_from_db(col)
-        Filling object params with values from existed record
-    load_by_users
+    fill_from_document(document)
+        Filling object params with values from already fetched record
+    make_users_key(users)
+        Canonical key of users set stored in users_key field
+    users_query(users, unfinished=False)
+        Find filter of games played by exactly given users
+    load_by_users(cls, db, users, col, unfinished=False)
         Alternative constructor of existed record's object selected by users list
     save_to_db(col)
         Save Record in MongoDB collection
@@ -95,6 +311,12 @@ class Game(MongoRecordAdapter):
         Game to json/bson converting
     """
     winner = UnchangedTypedPropert(ObjectId)
+    indexes = [IndexModel([('users_key', pymongo.ASCENDING), ('is_finished', pymongo.ASCENDING),
+                           ('_id', pymongo.DESCENDING)])]
+    projection = {ROUND_FIELD: 0}
+    newest_first = [('_id', pymongo.DESCENDING)]  # Order of games matched by load_by_users
+    __slots__ = UnchangedTypedPropert.storage('winner', 'game_time') + \
+        ('_users', 'questions', 'score', 'is_finished')
     game_time = UnchangedTypedPropert(datetime.datetime)
 
     def __init__(self, db, games_col='games', users_col='users', guestions_col='questions') -> None:
@@ -130,7 +352,7 @@ class Game(MongoRecordAdapter):
         return self._users
 
     @classmethod
-    def load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions'):
+    def load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True):
         """
             Alternative constructor of existed record's object selected by id
         Parameters
@@ -145,46 +367,78 @@ class Game(MongoRecordAdapter):
             Users collection name
         guestions_col : str, default 'questions'
             Questions collection name
+        cached : bool, default True
+            Use record cache, False reads current record from database
 
         Returns
         -------
         Game
-            New instance of Game class containing values of existed record
+            New instance of Game class containing values of existed record or None
         """
-        instance = cls(db, games_col, users_col, guestions_col)
-        instance._id = _id
-        instance.load_from_db(games_col)
-        return instance
+        return cls.load_one(db, {'_id': _id}, games_col, games_col=games_col,
+                            users_col=users_col, guestions_col=guestions_col, cached=cached)
 
-    def load_from_db(self, col):
+    def fill_from_document(self, document):
         """
-            Filling object params with values from existed record
+            Filling object params with values from already fetched record
         Parameters
         ----------
-        col : str
-            Name of games collection
+        document : dict
+            Games collection record
+        """
+        self.is_finished = document['is_finished']
+        self.users.load(document['users'])
+        if document['winner'] != self.winner:
+            self.winner = document['winner']
+        self.questions = document['questions']
+        self.score = document['score']
+        self.mark_saved()
+        # Record saved before users_key existed receives it with next update
+        self._saved_state['users_key'] = document.get('users_key')
 
-        Raises
-        ------
-        TODO Check all pymongo Exceptions
+    @staticmethod
+    def make_users_key(users):
         """
-        try:
-            result = self.db[col].find({'_id': self._id})[0]
-        except Exception as e:
-            raise e
-        else:
-            self.is_finished = result['is_finished']
-            for user in result['users']:
-                self.users.append(user)
-            if result['winner'] != self.winner:
-                self.winner = result['winner']
-            self.questions = result['questions']
-            self.score = result['score']
+            Canonical key of users set stored in users_key field
+            Order and repetitions of ids do not change the key, so exact set is matched by equality
+        Parameters
+        ----------
+        users : list of ObjectId
+            Users ObjectIds
+
+        Returns
+        -------
+        str
+            Sorted hexadecimal ids joined by comma
+        """
+        return ','.join(sorted({str(x) for x in users}))
+
+    @staticmethod
+    def users_query(users, unfinished=False):
+        """
+            Find filter of games played by exactly given users
+        Parameters
+        ----------
+        users : list of ObjectId
+            Users ObjectIds
+        unfinished : bool, default False
+            Match only games which are not finished
+
+        Returns
+        -------
+        dict
+            Find filter served by users_key index
+        """
+        query = {'users_key': Game.make_users_key(users)}
+        if unfinished:
+            query['is_finished'] = False
+        return query
 
     @classmethod
-    def load_by_users(cls, db, users, col):
+    def load_by_users(cls, db, users, col, unfinished=False):
         """
             Alternative constructor of existed record's object selected by users list
+            Exact users set is matched by indexed users_key, the newest game is loaded in one query
         Parameters
         ----------
         db : pymongo.database.Database
@@ -193,19 +447,16 @@ class Game(MongoRecordAdapter):
             List of users ObjectIds
         col : str
             Name of games collection
+        unfinished : bool, default False
+            Match only games which are not finished
 
         Returns
         -------
         Game
-            New instance of Game class containing values of existed record
+            New instance of Game class containing values of existed record or None
         """
-        result = list(db[col].find(
-            {'users': {'$all': users}}))   # Find query to find only identic users' list
-        for game in result:
-            if set(result[0]['users']) == set(users):
-                return cls.load_by_id(db, result[0]['_id'])
-        else:
-            return None
+        return cls.load_one(db, cls.users_query(users, unfinished), col,
+                            sort=cls.newest_first, games_col=col)
 
     def save_to_db(self, col):
         """
@@ -229,7 +480,7 @@ class Game(MongoRecordAdapter):
         dict
             Json format object params
         """
-        return {'date': self.game_time, 'users': list(self.users), 'questions': self.questions, 'winner': self.winner, 'is_finished': self.is_finished, 'score': self.score}
+        return {'date': self.game_time, 'users': list(self.users), 'users_key': self.make_users_key(self.users), 'questions': self.questions, 'winner': self.winner, 'is_finished': self.is_finished, 'score': self.score}
 
 
 class User(MongoRecordAdapter):
@@ -242,13 +493,20 @@ class User(MongoRecordAdapter):
     game_time : datetime.datetime
         Date and time of game starting
 
+    questions : list of str
+        Codes of questions seen since load, whole history is kept in SEEN_COLLECTION
+
      Methods
     -------
     games()
-    load_by_id(cls, db, games_col='games', users_col='users', guestions_col='questions')
+    load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True)
         Alternative constructor of existed record's object selected by id
-    load_from_db(col)
-        Filling object params with values from existed record
+    fill_from_document(document)
+        Filling object params with values from already fetched record
+    mark_saved()
+        Remember current params and number of seen questions stored in database
+    pending_upserts()
+        Seen-questions records of questions seen since last save
     load_by_name
         Alternative constructor of existed record's object selected by user's name
     save_to_db(col)
@@ -257,6 +515,11 @@ class User(MongoRecordAdapter):
         Game to json/bson converting
     """
     name = UnchangedTypedPropert(str, '')
+    indexes = [IndexModel([('name', pymongo.ASCENDING)], unique=True)]
+    projection = {ROUND_FIELD: 0, 'questions': 0}  # History arrays of not migrated records are skipped
+    cache_keys = ('name',)
+    __slots__ = UnchangedTypedPropert.storage(
+        'name') + ('_games', 'questions', 'correct_answers')
 
     def __init__(self, db, games_col='games', users_col='users', guestions_col='questions') -> None:
         """
@@ -291,7 +554,7 @@ class User(MongoRecordAdapter):
         return self._games
 
     @classmethod
-    def load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions'):
+    def load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True):
         """
             Alternative constructor of existed record's object selected by id
 
@@ -307,39 +570,30 @@ class User(MongoRecordAdapter):
             Users collection name
         guestions_col : str, default 'questions'
             Questions collection name
+        cached : bool, default True
+            Use record cache, False reads current record from database
 
         Returns
         -------
         User
-            New instance of User class containing values of existed record
+            New instance of User class containing values of existed record or None
         """
-        instance = cls(db, games_col, users_col, guestions_col)
-        instance._id = _id
-        instance.load_from_db(users_col)
-        return instance
+        return cls.load_one(db, {'_id': _id}, users_col, games_col=games_col,
+                            users_col=users_col, guestions_col=guestions_col, cached=cached)
 
-    def load_from_db(self, col):
+    def fill_from_document(self, document):
         """
-            Filling object params with values from existed record
+            Filling object params with values from already fetched record
         Parameters
         ----------
-        col : str
-            Name of users collection
-
-        Raises
-        ------
-        TODO Check all pymongo Exceptions
+        document : dict
+            Users collection record
         """
-        try:
-            result = self.db[col].find({'_id': self._id})[0]
-        except Exception as e:
-            raise e
-        else:
-            for game in result['games']:
-                self.games.append(game)
-            self.name = result['name']
-            self.questions = result['questions']
-            self.correct_answers = result['correct_answers']
+        self.games.load(document['games'])
+        self.name = document['name']
+        self.questions = []
+        self.correct_answers = document['correct_answers']
+        self.mark_saved()
 
     def to_json(self):
         """
@@ -349,7 +603,29 @@ class User(MongoRecordAdapter):
         dict
             Json format object params
         """
-        return {'name': self.name, 'correct_answers': self.correct_answers, 'questions': self.questions, 'games': list(self.games)}
+        return {'name': self.name, 'correct_answers': self.correct_answers, 'games': list(self.games)}
+
+    def mark_saved(self):
+        """
+            Remember current params and number of seen questions stored in database
+        """
+        super().mark_saved()
+        self._saved_state['questions'] = len(self.questions)
+
+    def pending_upserts(self):
+        """
+            Seen-questions records of questions seen since last save
+            Upsert of existing pair changes nothing, so repeated write is harmless
+        Returns
+        -------
+        list of tuple
+            (collection name, filter, update) upserts
+        """
+        saved = (self._saved_state or {}).get('questions', 0)
+        seen_at = datetime.datetime.now()
+        return [(SEEN_COLLECTION, {'user_id': self._id, 'question_code': code},
+                 {'$setOnInsert': {'seen_at': seen_at}})
+                for code in self.questions[saved:]]
 
     @classmethod
     def load_by_name(cls, db, name, col):
@@ -367,17 +643,72 @@ class User(MongoRecordAdapter):
         Returns
         -------
         User
-            New instance of User class containing values of existed record
+            New instance of User class containing values of existed or created record
         """
-        result = list(db[col].find(
-            {'name': name}))
+        user = cls.load_one(db, {'name': name}, col, users_col=col)
+        if user is not None:
+            return user
+        new_user = cls(db, users_col=col)
+        new_user.name = name
         try:
-            return cls.load_by_id(db, result[0]['_id'])
-        except Exception as e:
-            new_user = cls(db)
-            new_user.name = name
             new_user.save_to_db(col)
-            return new_user
+        except AttributeError:
+            # Same name registered meanwhile by parallel request, unique index keeps one record
+            return cls.load_one(db, {'name': name}, col, users_col=col)
+        return new_user
+
+
+class SeenQuestion:
+    """
+        Seen-questions collection, one record per user and question seen by user
+        Records are written only by upserts of User.pending_upserts, so no adapter object is built
+    Methods
+    -------
+    create_indexes(cls, db, col)
+        Idempotently create indexes required by seen-questions queries
+    unseen_stages(users, col=SEEN_COLLECTION)
+        Aggregation stages dropping questions seen by any of users
+    """
+    indexes = [IndexModel([('user_id', pymongo.ASCENDING), ('question_code', pymongo.ASCENDING)], unique=True)]
+
+    @classmethod
+    def create_indexes(cls, db, col):
+        """
+            Idempotently create indexes required by seen-questions queries
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            Database containing seen-questions collection
+        col : str
+            Seen-questions collection name
+        """
+        db[col].create_indexes(cls.indexes)
+
+    @staticmethod
+    def unseen_stages(users, col=SEEN_COLLECTION):
+        """
+            Aggregation stages dropping questions seen by any of users
+            Every question is checked by at most len(users) point reads of compound index
+        Parameters
+        ----------
+        users : list of ObjectId
+            Ids of players
+        col : str, default SEEN_COLLECTION
+            Seen-questions collection name
+
+        Returns
+        -------
+        list of dict
+            $lookup anti-join stages, empty without users
+        """
+        if not users:
+            return []
+        return [{'$lookup': {'from': col, 'let': {'code': '$question_code'}, 'as': 'seen', 'pipeline': [
+                    {'$match': {'user_id': {'$in': list(users)},
+                                '$expr': {'$eq': ['$question_code', '$$code']}}},
+                    {'$limit': 1}, {'$project': {'_id': 1}}]}},
+                {'$match': {'seen': {'$size': 0}}},
+                {'$project': {'seen': 0}}]
 
 
 class Question(MongoRecordAdapter):
@@ -394,17 +725,31 @@ class Question(MongoRecordAdapter):
     incorrect_answers : list of str
         List of incorrect answers
     question_code : str
-        8 characters code of question used for question recognizing
+        Content hash of question used for question recognizing
      Methods
     -------
-    load_by_id(cls, db, games_col='games', users_col='users', guestions_col='questions')
+    load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True)
         Alternative constructor of existed record's object selected by id
-    load_from_db(col)
-        Filling object params with values from existed record
+    mark_saved()
+        Questions params are set once, so stored record never needs snapshot of them
+    pending_update()
+        Stored question can not change, because all params are set once
+    fill_from_document(document)
+        Filling object params with values from already fetched record
     load_new_question()
         Trivia API request for geting new random question
-    get_unknown_question(cls, db, questions, col)
+    make_question_code(question, correct_answer, incorrect_answers)
+        Prepare stable content hash used for question recognizing
+    document_from_api(cls, response)
+        Trivia API question to questions collection record converting
+    get_unknown_question(cls, db, questions, col, exclude=(), users=())
         Alternative constructor for record containing question not contained in list
+    sample_unknown_document(db, questions, col, sample_size=SAMPLE_SIZE, exclude=(), users=())
+        Pick random record with question not contained in list
+    sample_pipeline(sample_size=SAMPLE_SIZE, users=())
+        Aggregation pipeline of random records checked by sample_unknown_document
+    unknown_pipeline(questions, exclude=(), users=())
+        Aggregation pipeline of sample_unknown_document fallback filtering on the database side
     save_to_db(col)
         Save Record in MongoDB collection
     to_json()
@@ -415,6 +760,10 @@ class Question(MongoRecordAdapter):
     correct_answer = UnchangedTypedPropert(str, '')
     incorrect_answers = UnchangedTypedPropert(list, [])
     question_code = UnchangedTypedPropert(str, '')
+    indexes = [IndexModel([('question_code', pymongo.ASCENDING)], unique=True)]
+    cache_keys = ('question_code',)
+    __slots__ = UnchangedTypedPropert.storage(
+        'category', 'question', 'correct_answer', 'incorrect_answers', 'question_code')
 
     def __init__(self, db, games_col='games', users_col='users', guestions_col='questions') -> None:
         """
@@ -433,7 +782,7 @@ class Question(MongoRecordAdapter):
         super().__init__(db)
 
     @classmethod
-    def load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions'):
+    def load_by_id(cls, db, _id, games_col='games', users_col='users', guestions_col='questions', cached=True):
         """
             Alternative constructor of existed record's object selected by id
 
@@ -449,39 +798,46 @@ class Question(MongoRecordAdapter):
             Users collection name
         guestions_col : str, default 'questions'
             Questions collection name
+        cached : bool, default True
+            Use record cache, questions never change, so it is safe for them
 
         Returns
         -------
         Question
-            New instance of Question class containing values of existed record
+            New instance of Question class containing values of existed record or None
         """
-        instance = cls(db, games_col, users_col, guestions_col)
-        instance._id = _id
-        instance.load_from_db(guestions_col)
-        return instance
+        return cls.load_one(db, {'_id': _id}, guestions_col, games_col=games_col,
+                            users_col=users_col, guestions_col=guestions_col, cached=cached)
 
-    def load_from_db(self, col):
+    def mark_saved(self):
+        """
+            Questions params are set once, so stored record never needs snapshot of them
+        """
+
+    def pending_update(self):
+        """
+            Stored question can not change, because all params are set once
+        Returns
+        -------
+        dict
+            Empty MongoDB update document
+        """
+        return {}
+
+    def fill_from_document(self, document):
         """
-            Filling object params with values from existed record
+            Filling object params with values from already fetched record
         Parameters
         ----------
-        col : str
-            Name of questions collection
-
-        Raises
-        ------
-        TODO Check all pymongo Exceptions
+        document : dict
+            Questions collection record
         """
-        try:
-            result = self.db[col].find({'_id': self._id})[0]
-        except Exception as e:
-            raise e
-        else:
-            self.question = result['question']
-            self.category = result['category']
-            self.correct_answer = result['correct_answer']
-            self.incorrect_answers = result['incorrect_answers']
-            self.question_code = result['question_code']
+        self.question = document['question']
+        self.category = document['category']
+        self.correct_answer = document['correct_answer']
+        self.incorrect_answers = document['incorrect_answers']
+        self.question_code = document['question_code']
+        self.mark_saved()
 
     def to_json(self):
         """
@@ -495,49 +851,175 @@ class Question(MongoRecordAdapter):
 
     def load_new_question(self):
         """
-            load_new_question
+            Trivia API request for geting new random question
+        Raises
+        ------
+        OpenTDBError
+            Trivia API returned no question
+        """
+        results = default_client().fetch(1)
+        if not results:
+            raise OpenTDBError(1)
+        self.fill_from_document(self.document_from_api(results[0]))
+
+    @staticmethod
+    def make_question_code(question, correct_answer, incorrect_answers):
+        """
+            Prepare stable content hash used for question recognizing
+            Texts are normalized, so different spacing or letter case gives the same code
+        Parameters
+        ----------
+        question : str
+            Text of question
+        correct_answer : str
+            Text of correct answer
+        incorrect_answers : list of str
+            List of incorrect answers
+
+        Returns
+        -------
+        str
+            QUESTION_CODE_LENGTH characters hexadecimal code of question
+        """
+        def normalize(text):
+            return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+        content = '\x1f'.join([normalize(question), normalize(correct_answer)] +
+                               sorted(normalize(x) for x in incorrect_answers))
+        return hashlib.blake2b(content.encode(), digest_size=QUESTION_CODE_LENGTH // 2).hexdigest()
+
+    @classmethod
+    def document_from_api(cls, response):
         """
-        api_url = "https://opentdb.com/api.php?amount=1&type=multiple"
-        response = requests.get(api_url).json()['results'][0]
-        self.category = response['category']
-        self.question = response['question']
-        self.correct_answer = response['correct_answer']
-        self.incorrect_answers = response['incorrect_answers']
-        coded = base64.b64encode(response['question'].encode()).decode()
-        self.question_code = coded[1:5]+coded[-8:-4]
+            Trivia API question to questions collection record converting
+        Parameters
+        ----------
+        response : dict
+            Single question from Trivia API results
+
+        Returns
+        -------
+        dict
+            Json format question params
+        """
+        return {'question': response['question'], 'category': response['category'], 'correct_answer': response['correct_answer'], 'incorrect_answers': response['incorrect_answers'], 'question_code': cls.make_question_code(response['question'], response['correct_answer'], response['incorrect_answers'])}
 
     @classmethod
-    def get_unknown_question(cls, db, questions, col):
+    def get_unknown_question(cls, db, questions, col, exclude=(), users=()):
         """
             Alternative constructor for record containing question not contained in list
         Parameters
         ----------
         db : pymongo.database.Database
             Database containing Question style record
-        questions : list of str
-            Known questions list
+        questions : set of str
+            Known question codes, any container supporting in operator
         col : str
             Name of questions collection
+        exclude : sequence of str, default ()
+            Few additional codes to skip, such as already prefetched questions
+        users : list of ObjectId, default ()
+            Players whose stored history of seen questions is skipped
 
         Returns
         -------
         Question
             Unique new instance of Question class
+
+        Raises
+        ------
+        pymongo.errors.PyMongoError
+            Sampling failed, Trivia API is asked only when no unknown question is stored
         """
-        result = list(db[col].find(
-            {"question_code": {'$nin': questions}}))
-        try:
-            random_question = random.choice(result)
-        except Exception as e:
-            print('EEEEE', e)
+        random_question = cls.sample_unknown_document(
+            db, questions, col, exclude=exclude, users=users)
+        if random_question is None:
             new_question = cls(db)
-            # TODO check if new receiving question is not in list
+            # Every stored question is known, so random API question is new unless it is already stored
             new_question.load_new_question()
-            new_question.save_to_db(col)
+            try:
+                new_question.save_to_db(col)
+            except AttributeError:
+                new_question = cls.load_one(
+                    db, {'question_code': new_question.question_code}, col, guestions_col=col)
         else:
-            new_question = cls.load_by_id(db, random_question['_id'])
-        finally:
-            return new_question
+            # Stored questions never change, so sampled record can be served by later loads
+            default_cache().put(db, col, random_question, cls.cache_keys)
+            new_question = cls.from_document(db, random_question, guestions_col=col)
+        return new_question
+
+    @staticmethod
+    def sample_unknown_document(db, questions, col, sample_size=SAMPLE_SIZE, exclude=(), users=()):
+        """
+            Pick random record with question not contained in list
+            $sample as first stage reads sample_size random records regardless of collection size,
+            stored history of players is anti-joined to them and codes seen since load are checked here.
+            Filtering on the database side is fallback for players which know most of the questions.
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            Database containing Question style record
+        questions : set of str
+            Known question codes, any container supporting in operator
+        col : str
+            Name of questions collection
+        sample_size : int, default SAMPLE_SIZE
+            Number of random records checked before database side filtering fallback
+        exclude : sequence of str, default ()
+            Few additional codes to skip
+        users : list of ObjectId, default ()
+            Players whose stored history of seen questions is skipped
+
+        Returns
+        -------
+        dict or None
+            Questions collection record or None if all questions are known
+        """
+        for document in db[col].aggregate(Question.sample_pipeline(sample_size, users)):
+            code = document['question_code']
+            if code not in questions and code not in exclude:
+                return document
+        for document in db[col].aggregate(Question.unknown_pipeline(questions, exclude, users)):
+            return document
+        return None
+
+    @staticmethod
+    def sample_pipeline(sample_size=SAMPLE_SIZE, users=()):
+        """
+            Aggregation pipeline of random records checked by sample_unknown_document
+        Parameters
+        ----------
+        sample_size : int, default SAMPLE_SIZE
+            Number of random records
+        users : list of ObjectId, default ()
+            Players whose seen questions are dropped from sample
+
+        Returns
+        -------
+        list of dict
+            Aggregation pipeline
+        """
+        return [{'$sample': {'size': sample_size}}] + SeenQuestion.unseen_stages(users)
+
+    @staticmethod
+    def unknown_pipeline(questions, exclude=(), users=()):
+        """
+            Aggregation pipeline of sample_unknown_document fallback filtering on the database side
+        Parameters
+        ----------
+        questions : set of str
+            Known question codes
+        exclude : sequence of str, default ()
+            Few additional codes to skip
+        users : list of ObjectId, default ()
+            Players whose seen questions are skipped
+
+        Returns
+        -------
+        list of dict
+            Aggregation pipeline
+        """
+        return [{'$match': {'question_code': {'$nin': list(questions) + list(exclude)}}}] + \
+            SeenQuestion.unseen_stages(users) + [{'$sample': {'size': 1}}]
 
     def __str__(self) -> str:
         """
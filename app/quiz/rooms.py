@@ -0,0 +1,226 @@
+import threading
+import time
+from contextlib import contextmanager
+from .models import Quiz
+
+DEFAULT_ROOM = 'default'  # Room used by endpoints without room prefix
+
+
+class Room:
+    """
+    Single game room holding Quiz and its lock
+
+    Attributes
+    ----------
+    room_id : str
+        Room identifier
+    quiz : Quiz
+        Game manager of room
+    lock : threading.RLock
+        Lock serializing requests of room
+    last_used : float
+        time.monotonic() of last room usage
+    version : int
+        Version of shared state loaded in quiz
+    """
+    __slots__ = ('room_id', 'quiz', 'lock', 'last_used', 'version')
+
+    def __init__(self, room_id, quiz) -> None:
+        self.room_id = room_id
+        self.quiz = quiz
+        self.lock = threading.RLock()
+        self.last_used = time.monotonic()
+        self.version = 0
+
+
+class RoomRegistry:
+    """
+    Registry of game rooms keyed by room id with idle rooms eviction
+    With state_store live game state is shared by registries of all workers,
+    every use() of room runs under store lease with state of last user.
+
+    Methods
+    -------
+    get(room_id)
+        Get room, creating it on first usage
+    use(room_id, exclusive=True)
+        Context manager giving room's Quiz under room lock
+    remove(room_id)
+        Close room and release its resources
+    evict_idle(now=None)
+        Close rooms unused longer than idle_timeout
+    recover()
+        Restore rooms journaled by finished processes
+    close()
+        Close all rooms
+    """
+
+    def __init__(self, db, idle_timeout=3600.0, sweep_interval=60.0, quiz_factory=Quiz, state_store=None, write_behind=None) -> None:
+        """
+            Prepare empty registry
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            MongoDB Database reference shared by rooms
+        idle_timeout : float, default 3600.0
+            Seconds after which unused room is evicted
+        sweep_interval : float, default 60.0
+            Minimal seconds between idle rooms sweeps made on room access
+        quiz_factory : callable, default Quiz
+            Function creating Quiz for database
+        state_store : MemoryStateStore or MongoStateStore, optional
+            Store of live game states shared with other workers, state is kept
+            only in this registry by default
+        write_behind : WriteBehind, optional
+            Journaled writer of rooms' answers and round results, rounds are written
+            to MongoDB in requests by default
+        """
+        self.db = db
+        self.state_store = state_store
+        self.write_behind = write_behind
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._quiz_factory = quiz_factory
+        self._rooms = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def __contains__(self, room_id):
+        return room_id in self._rooms
+
+    def get(self, room_id):
+        """
+            Get room, creating it on first usage
+        Parameters
+        ----------
+        room_id : str
+            Room identifier
+
+        Returns
+        -------
+        Room
+            Room connected with id
+        """
+        now = time.monotonic()
+        if now - self._last_sweep > self.sweep_interval:
+            self.evict_idle(now)
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                room = self._rooms[room_id] = Room(
+                    room_id, self._quiz_factory(self.db))
+                if self.write_behind is not None:
+                    room.quiz.attach_write_behind(self.write_behind, room_id)
+            room.last_used = now
+        return room
+
+    @contextmanager
+    def use(self, room_id, exclusive=True):
+        """
+            Context manager giving room's Quiz under room lock
+        Parameters
+        ----------
+        room_id : str
+            Room identifier
+        exclusive : bool, default True
+            Hold room lock, without state_store Quiz can serialize its own calls instead
+
+        Yields
+        ------
+        Quiz
+            Game manager of room
+        """
+        room = self.get(room_id)
+        if self.state_store is None and not exclusive:
+            yield room.quiz
+            room.last_used = time.monotonic()
+            return
+        with room.lock:
+            if self.state_store is None:
+                yield room.quiz
+            else:
+                yield from self._shared(room)
+            room.last_used = time.monotonic()
+
+    def _shared(self, room):
+        """
+            Run room usage under store lease, loading and storing changed live state
+        """
+        token, version, state = self.state_store.acquire(room.room_id)
+        try:
+            if state is not None and version != room.version:
+                room.quiz.load_state(state)
+                room.version = version
+            before = room.quiz.dump_state()
+            yield room.quiz
+            room.quiz.flush_rounds(wait=True)
+            after = room.quiz.dump_state()
+        except BaseException:
+            self.state_store.release(room.room_id, token)
+            raise
+        room.version = self.state_store.release(
+            room.room_id, token, after if after != before else None)
+
+    def remove(self, room_id):
+        """
+            Close room and release its resources
+        Parameters
+        ----------
+        room_id : str
+            Room identifier
+        """
+        with self._lock:
+            room = self._rooms.pop(room_id, None)
+        if room is not None:
+            room.quiz.close()
+
+    def evict_idle(self, now=None):
+        """
+            Close rooms unused longer than idle_timeout
+        Parameters
+        ----------
+        now : float, optional
+            Current time.monotonic() value
+
+        Returns
+        -------
+        list of str
+            Ids of evicted rooms
+        """
+        now = time.monotonic() if now is None else now
+        self._last_sweep = now
+        with self._lock:
+            idle = [room for room in self._rooms.values()
+                    if now - room.last_used > self.idle_timeout and room.lock.acquire(blocking=False)]
+            for room in idle:
+                del self._rooms[room.room_id]
+        for room in idle:
+            room.quiz.close()
+            room.lock.release()
+        return [room.room_id for room in idle]
+
+    def recover(self):
+        """
+            Restore rooms journaled by finished processes, their pending rounds are written first
+        Returns
+        -------
+        list of str
+            Ids of restored rooms
+        """
+        if self.write_behind is None:
+            return []
+        states = self.write_behind.recover()
+        for room_id, state in states.items():
+            with self.use(room_id) as quiz:
+                quiz.load_state(state)
+        return list(states)
+
+    def close(self):
+        """
+            Close all rooms
+        """
+        for room_id in list(self._rooms):
+            self.remove(room_id)
@@ -0,0 +1,190 @@
+import threading
+import time
+import uuid
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+STATE_COLLECTION = 'room_states'  # Collection of live game states shared by workers
+
+
+class MemoryStateStore:
+    """
+    Live room states shared by registries of single process, stand-in of MongoStateStore
+
+    Attributes
+    ----------
+    lease : float
+        Seconds after which lease of crashed holder expires
+
+    Methods
+    -------
+    acquire(room_id)
+        Take exclusive lease of room state
+    release(room_id, token, state=None)
+        Give back lease, storing new state version if given
+    """
+
+    def __init__(self, lease=30.0) -> None:
+        """
+            Prepare empty store
+        Parameters
+        ----------
+        lease : float, default 30.0
+            Seconds after which lease of crashed holder expires
+        """
+        self.lease = lease
+        self._states = {}
+        self._holders = {}
+        self._condition = threading.Condition()
+
+    def acquire(self, room_id):
+        """
+            Take exclusive lease of room state, waiting for other holder
+        Parameters
+        ----------
+        room_id : str
+            Room identifier
+
+        Returns
+        -------
+        tuple
+            (lease token, state version, state dict or None)
+        """
+        token = uuid.uuid4().hex
+        with self._condition:
+            while True:
+                holder = self._holders.get(room_id)
+                now = time.time()
+                if holder is None or holder[1] < now:
+                    self._holders[room_id] = (token, now + self.lease)
+                    break
+                self._condition.wait(holder[1] - now)
+            version, state = self._states.get(room_id, (0, None))
+        return token, version, state
+
+    def release(self, room_id, token, state=None):
+        """
+            Give back lease, storing new state version if given
+        Parameters
+        ----------
+        room_id : str
+            Room identifier
+        token : str
+            Token received from acquire
+        state : dict, optional
+            New room state, previous one is kept by default
+
+        Returns
+        -------
+        int
+            Current state version
+        """
+        with self._condition:
+            version = self._states.get(room_id, (0, None))[0]
+            holder = self._holders.get(room_id)
+            if holder is None or holder[0] != token:
+                print('Expired room lease')
+                return version
+            if state is not None:
+                version += 1
+                self._states[room_id] = (version, state)
+            del self._holders[room_id]
+            self._condition.notify_all()
+        return version
+
+
+class MongoStateStore:
+    """
+    Live room states kept in MongoDB collection, so any worker process can serve any room
+    Lease is taken by conditional update of room document, state is written with release.
+
+    Attributes
+    ----------
+    lease : float
+        Seconds after which lease of crashed holder expires
+    poll : float
+        Seconds between tries of taking busy lease
+
+    Methods
+    -------
+    acquire(room_id)
+        Take exclusive lease of room state
+    release(room_id, token, state=None)
+        Give back lease, storing new state version if given
+    """
+
+    def __init__(self, db, col=STATE_COLLECTION, lease=30.0, poll=0.005) -> None:
+        """
+            Prepare store
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            Database shared by workers
+        col : str, default STATE_COLLECTION
+            Name of states collection
+        lease : float, default 30.0
+            Seconds after which lease of crashed holder expires
+        poll : float, default 0.005
+            Seconds between tries of taking busy lease
+        """
+        self.collection = db[col]
+        self.lease = lease
+        self.poll = poll
+
+    def acquire(self, room_id):
+        """
+            Take exclusive lease of room state, waiting for other holder
+        Parameters
+        ----------
+        room_id : str
+            Room identifier
+
+        Returns
+        -------
+        tuple
+            (lease token, state version, state dict or None)
+        """
+        token = uuid.uuid4().hex
+        while True:
+            now = time.time()
+            try:
+                document = self.collection.find_one_and_update(
+                    {'_id': room_id, '$or': [{'locked_until': {'$lt': now}},
+                                             {'locked_until': {'$exists': False}}]},
+                    {'$set': {'locked_until': now + self.lease, 'token': token},
+                     '$setOnInsert': {'version': 0, 'state': None}},
+                    upsert=True, return_document=ReturnDocument.AFTER)
+            except DuplicateKeyError:
+                # Room document exists and is leased by other worker
+                time.sleep(self.poll)
+                continue
+            return token, document['version'], document['state']
+
+    def release(self, room_id, token, state=None):
+        """
+            Give back lease, storing new state version if given
+        Parameters
+        ----------
+        room_id : str
+            Room identifier
+        token : str
+            Token received from acquire
+        state : dict, optional
+            New room state, previous one is kept by default
+
+        Returns
+        -------
+        int
+            Current state version
+        """
+        update = {'$unset': {'locked_until': '', 'token': ''}}
+        if state is not None:
+            update['$set'] = {'state': state}
+            update['$inc'] = {'version': 1}
+        document = self.collection.find_one_and_update(
+            {'_id': room_id, 'token': token}, update, {'version': 1},
+            return_document=ReturnDocument.AFTER)
+        if document is None:
+            print('Expired room lease')
+            document = self.collection.find_one({'_id': room_id}, {'version': 1})
+        return document['version'] if document else 0
@@ -1,17 +1,882 @@
+import asyncio
+import gc
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from types import SimpleNamespace
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 import pytest
+from bson.objectid import ObjectId
+from pymongo import monitoring
+from pymongo.errors import OperationFailure
 from pymongo.mongo_client import MongoClient
 from pymongo.collection import Collection
-from .records import User, Game, Question
+from pytest_mock_resources import create_mongo_fixture
+from app.quiz.records import User, Game, Question, SEEN_COLLECTION
+from app.quiz.pool import QuestionPool
+from app.quiz.opentdb import OpenTDBClient, OpenTDBError, default_client, default_async_client
+from app.quiz.ingest import ingest
+from app.quiz.migrate import migrate_question_codes, migrate_seen_questions, migrate_game_users_key, migrate_user_names
+from app.quiz.indexes import ensure_indexes, check_query_plans
+from app.quiz.unit_of_work import UnitOfWork
+from app.quiz.rooms import RoomRegistry
+from app.quiz.state import MemoryStateStore, MongoStateStore
+from app.quiz.journal import WriteBehind, Journal
+from app.quiz.models import Quiz
+from app.quiz.async_models import AsyncQuiz
+from app.quiz.async_records import AsyncUser, AsyncQuestion
+from app.quiz.events import Broadcaster, format_sse
+from app.quiz.cache import RecordCache
+from app.app import create_app
+from app.asgi import create_asgi_app
+from app.config import Config
+from app.libs.metrics import MetricsRegistry, CommandMetrics, timed
+from app.quiz import cache
 from pymongo.database import Database
+from motor.motor_asyncio import AsyncIOMotorClient
 
 thing = {'users': None}
 
+mongo = create_mongo_fixture()
+
+
+@pytest.fixture(autouse=True)
+def record_cache(monkeypatch):
+    fresh = RecordCache()
+    monkeypatch.setattr(cache, '_default_cache', fresh)
+    return fresh
+
+
+def make_question_document(number):
+    return {'question': f'Question {number}?', 'category': 'General', 'correct_answer': 'A',
+            'incorrect_answers': ['B', 'C', 'D'], 'question_code': f'code{number:04}'}
+
 
 @pytest.fixture
 def example_game():
     pass
 
 
+@pytest.fixture
+def question_bank(mongo):
+    mongo['questions'].insert_many(
+        [make_question_document(number) for number in range(20)])
+    return mongo
+
+
 def test_create_game():
     # TODO find good Mongo Database Mock or use normal MongoClient
     assert True
+
+
+def test_get_unknown_question_skips_known(question_bank):
+    known = [f'code{number:04}' for number in range(20) if number != 7]
+    question = Question.get_unknown_question(
+        question_bank, known, 'questions')
+    assert question.question_code == 'code0007'
+    assert question.question == 'Question 7?'
+    assert question.incorrect_answers == ['B', 'C', 'D']
+    assert question._id is not None
+
+
+def test_sample_unknown_document_returns_none_when_all_known(question_bank):
+    known = [f'code{number:04}' for number in range(20)]
+    assert Question.sample_unknown_document(
+        question_bank, known, 'questions') is None
+
+
+def seen_codes(db, user_id):
+    return sorted(x['question_code'] for x in db[SEEN_COLLECTION].find({'user_id': user_id}))
+
+
+def test_get_unknown_question_skips_stored_history(question_bank):
+    ensure_indexes(question_bank)
+    users = [User.load_by_name(question_bank, name, 'users') for name in ('ann', 'bob')]
+    for number, user in enumerate(users):
+        user.questions.extend(f'code{x:04}' for x in range(number, 20, 2) if x != 7)
+        user.save_to_db('users')
+    for _ in range(5):
+        question = Question.get_unknown_question(
+            question_bank, set(), 'questions', users=[x._id for x in users])
+        assert question.question_code == 'code0007'
+
+
+def test_get_unknown_question_raises_sampling_errors(question_bank, monkeypatch):
+    def sample_failed(*args, **kwargs):
+        raise OperationFailure('MongoDB is down')
+
+    def fetch(amount):
+        raise AssertionError('Trivia API is asked only for exhausted bank')
+
+    monkeypatch.setattr(Question, 'sample_unknown_document', staticmethod(sample_failed))
+    monkeypatch.setattr(default_client(), 'fetch', fetch)
+    with pytest.raises(OperationFailure):
+        Question.get_unknown_question(question_bank, set(), 'questions')
+
+
+def test_async_get_unknown_question_raises_sampling_errors(monkeypatch):
+    async def sample_failed(*args, **kwargs):
+        raise OperationFailure('MongoDB is down')
+
+    async def fetch(amount):
+        raise AssertionError('Trivia API is asked only for exhausted bank')
+
+    monkeypatch.setattr(AsyncQuestion, 'sample_unknown_document', staticmethod(sample_failed))
+    monkeypatch.setattr(default_async_client(), 'fetch', fetch)
+    with pytest.raises(OperationFailure):
+        asyncio.run(AsyncQuestion.get_unknown_question(None, set(), 'questions'))
+
+
+def test_quiz_keeps_known_questions_index(question_bank):
+    quiz = Quiz(question_bank)
+    names = ['ann', 'bob', 'cid']
+    for number, name in enumerate(names):
+        user = User.load_by_name(question_bank, name, 'users')
+        user.questions = [f'code{number:04}', 'code0019']
+        quiz.register_user(user)
+    quiz.start_game(quiz.propose_game())
+    for number in range(9):
+        quiz.register_answer(names[number % 3], 0)
+    quiz.remove_user('bob')
+    rebuilt = {code for user in quiz.loaded_users for code in user.questions}
+    assert quiz.get_known_questions() == rebuilt
+    assert quiz.get_known_questions() is quiz.get_known_questions()
+    assert 'code0001' not in quiz.get_known_questions()
+    quiz.close()
+
+
+def test_question_pool_serves_unknown_questions(question_bank):
+    known = set()
+    pool = QuestionPool(question_bank, lambda: known, size=5, low_water=2)
+    pool.refill()
+    assert len(pool) == 5
+    served = set()
+    for _ in range(10):
+        question = pool.pop()
+        assert question.question_code not in known
+        known.add(question.question_code)
+        served.add(question.question_code)
+    pool.stop()
+    assert len(served) == 10
+
+
+def test_question_pool_invalidate_drops_prefetched(question_bank):
+    known = set()
+    pool = QuestionPool(question_bank, lambda: known, size=5)
+    pool.refill()
+    known.update(x.question_code for x in list(pool._questions))
+    pool.stop()
+    pool.invalidate()
+    assert len(pool) == 0
+    assert pool.pop().question_code not in known
+
+
+class OpenTDBStub(BaseHTTPRequestHandler):
+    """
+        Local stand-in of Trivia API serving questions from server.bank
+    """
+
+    def do_GET(self):
+        server = self.server
+        amount = int(parse_qs(urlparse(self.path).query)['amount'][0])
+        if server.rate_limited > 0:
+            server.rate_limited -= 1
+            body = {'response_code': 5, 'results': []}
+        elif server.response_code:
+            body = {'response_code': server.response_code, 'results': []}
+        else:
+            results = [server.bank[(server.position + n) % len(server.bank)]
+                       for n in range(amount)]
+            server.position += amount
+            body = {'response_code': 0, 'results': results}
+        server.requests += 1
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def opentdb_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), OpenTDBStub)
+    server.bank = [{'type': 'multiple', 'difficulty': 'easy', 'category': 'General',
+                    'question': f'{n:03} stub question {n:03}?', 'correct_answer': 'A',
+                    'incorrect_answers': ['B', 'C', 'D']} for n in range(70)]
+    server.position = 0
+    server.rate_limited = 0
+    server.response_code = 0
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def stub_client(server):
+    return OpenTDBClient(f'http://127.0.0.1:{server.server_address[1]}/api.php', backoff=0)
+
+
+def test_opentdb_client_retries_after_rate_limit(opentdb_server):
+    opentdb_server.rate_limited = 2
+    results = stub_client(opentdb_server).fetch(50)
+    assert len(results) == 50
+    assert opentdb_server.requests == 3
+
+
+def test_ingest_dedupes_by_question_code(mongo, opentdb_server):
+    client = stub_client(opentdb_server)
+    assert ingest(mongo, client, 60) == 60
+    assert ingest(mongo, client, 100, max_batches=3) == 10
+    codes = [x['question_code'] for x in mongo['questions'].find()]
+    assert len(codes) == len(set(codes)) == 70
+    requests_before = opentdb_server.requests
+    assert ingest(mongo, client, 100) == 0
+    assert opentdb_server.requests - requests_before == 3
+
+
+def test_opentdb_error_codes_are_raised(mongo, opentdb_server):
+    opentdb_server.response_code = 1
+    with pytest.raises(OpenTDBError) as error:
+        stub_client(opentdb_server).fetch(50)
+    assert error.value.response_code == 1
+    assert ingest(mongo, stub_client(opentdb_server), 10) == 0
+    assert opentdb_server.requests == 2
+
+
+def test_question_code_is_normalized_content_hash():
+    code = Question.make_question_code('Capital of  France?', 'Paris', ['Rome', 'Berlin', 'Madrid'])
+    assert code == Question.make_question_code('capital of France?', 'Paris ', ['Madrid', 'Rome', 'Berlin'])
+    assert code != Question.make_question_code('Capital of France?', 'Rome', ['Paris', 'Berlin', 'Madrid'])
+    assert len(code) == 20
+
+
+def test_migrate_question_codes(mongo):
+    def old_question(text):
+        return {'question': text, 'category': 'General', 'correct_answer': 'A',
+                'incorrect_answers': ['B', 'C', 'D'], 'question_code': 'oldcode1'}
+    mongo['questions'].insert_many(
+        [old_question('First?'), old_question('Second?'), old_question('First?')])
+    mongo['users'].insert_one({'name': 'ann', 'correct_answers': 0, 'questions': ['oldcode1'], 'games': []})
+    mongo['games'].insert_one({'users': [], 'questions': ['oldcode1'], 'score': [], 'is_finished': False, 'winner': None})
+    summary = migrate_question_codes(mongo)
+    codes = sorted(x['question_code'] for x in mongo['questions'].find())
+    assert summary['duplicates'] == 1
+    assert codes == sorted([Question.make_question_code('First?', 'A', ['B', 'C', 'D']),
+                            Question.make_question_code('Second?', 'A', ['B', 'C', 'D'])])
+    assert sorted(mongo['users'].find_one()['questions']) == codes
+    assert mongo['games'].find_one()['questions'][0] in codes
+
+
+def test_migrate_seen_questions(mongo):
+    user_id = mongo['users'].insert_one({'name': 'ann', 'correct_answers': 0, 'questions': ['a', 'b', 'a'], 'games': []}).inserted_id
+    assert migrate_seen_questions(mongo, batch_size=1) == {'users': 1, 'seen': 2}
+    assert migrate_seen_questions(mongo) == {'users': 0, 'seen': 0}
+    assert seen_codes(mongo, user_id) == ['a', 'b']
+    assert 'questions' not in mongo['users'].find_one({'_id': user_id})
+    assert User.load_by_id(mongo, user_id).questions == []
+
+
+def test_migrate_user_names_merges_duplicates(mongo):
+    first, second = [mongo['users'].insert_one(
+        {'name': 'ann', 'correct_answers': 2, 'games': [x]}).inserted_id for x in ('g1', 'g2')]
+    bob = mongo['users'].insert_one({'name': 'bob', 'correct_answers': 0, 'games': []}).inserted_id
+    game = mongo['games'].insert_one({'users': [second, bob], 'questions': []}).inserted_id
+    mongo[SEEN_COLLECTION].insert_many([{'user_id': second, 'question_code': code} for code in 'ab'])
+    mongo[SEEN_COLLECTION].insert_one({'user_id': first, 'question_code': 'a'})
+    assert ensure_indexes(mongo) == ['users']
+    assert migrate_user_names(mongo) == {'users': 1, 'games': 1, 'seen': 2}
+    assert ensure_indexes(mongo) == []
+    assert mongo['users'].find_one({'name': 'ann'}) == {
+        '_id': first, 'name': 'ann', 'correct_answers': 4, 'games': ['g1', 'g2']}
+    assert mongo['games'].find_one({'_id': game})['users_key'] == Game.make_users_key([first, bob])
+    assert seen_codes(mongo, first) == ['a', 'b'] and seen_codes(mongo, second) == []
+
+
+def test_ensure_indexes_is_idempotent(mongo):
+    ensure_indexes(mongo)
+    ensure_indexes(mongo)
+    assert mongo['users'].index_information()['name_1']['unique']
+    assert mongo['questions'].index_information()['question_code_1']['unique']
+    assert 'users_key_1_is_finished_1__id_-1' in mongo['games'].index_information()
+
+
+def test_records_query_plans_use_indexes(question_bank):
+    ensure_indexes(question_bank)
+    question_bank[SEEN_COLLECTION].insert_many(
+        [{'user_id': ObjectId(), 'question_code': f'code{x:04}'} for x in range(20)])
+    assert check_query_plans(question_bank) == []
+    question_bank[SEEN_COLLECTION].drop_indexes()
+    failures = check_query_plans(question_bank)
+    assert [x.split(' ')[0] for x in failures] == [
+        'User.pending_upserts', 'Question.sample_pipeline', 'Question.unknown_pipeline']
+
+
+def test_load_by_users_matches_exact_user_set(mongo):
+    ann, bob, cid = [User.load_by_name(mongo, name, 'users')._id for name in ('ann', 'bob', 'cid')]
+    for users in ([ann, bob, cid], [bob, ann], [ann]):
+        game = Game(mongo)
+        game.users.load(users)
+        game.save_to_db('games')
+    found = Game.load_by_users(mongo, [ann, bob], 'games')
+    assert set(found.users) == {ann, bob}
+    assert found.pending_update() == {}
+    assert Game.load_by_users(mongo, [bob, cid], 'games') is None
+    found.is_finished = True
+    found.save_to_db('games')
+    assert Game.load_by_users(mongo, [bob, ann], 'games', unfinished=True) is None
+    legacy = mongo['games'].insert_one({'users': [cid, bob], 'questions': [], 'score': [0, 0],
+                                        'is_finished': False, 'winner': None}).inserted_id
+    assert migrate_game_users_key(mongo) == {'games': 1}
+    assert Game.load_by_users(mongo, [bob, cid], 'games', unfinished=True)._id == legacy
+
+
+def test_load_by_name_keeps_single_user(mongo):
+    ensure_indexes(mongo)
+    first = User.load_by_name(mongo, 'ann', 'users')
+    second = User.load_by_name(mongo, 'ann', 'users')
+    assert first._id == second._id
+    assert mongo['users'].count_documents({'name': 'ann'}) == 1
+
+
+def test_record_cache_serves_loads_until_saved(mongo, record_cache):
+    user = User(mongo)
+    user.name = 'ann'
+    user.save_to_db('users')
+    assert User.load_by_name(mongo, 'ann', 'users')._id == user._id
+    assert record_cache.stats()['misses'] == 1
+    by_name = User.load_by_name(mongo, 'ann', 'users')
+    by_id = User.load_by_id(mongo, user._id)
+    assert by_name._id == by_id._id == user._id
+    assert record_cache.stats()['hits'] == 2
+    by_id.games.append(ObjectId())
+    assert len(by_name.games) == 0  # Hits decode separate documents
+    by_id.save_to_db('users')
+    assert record_cache.stats()['invalidations'] == 1
+    assert list(User.load_by_id(mongo, user._id).games) == list(by_id.games)
+    assert list(User.load_by_id(mongo, user._id, cached=False).games) == list(by_id.games)
+
+
+def test_record_cache_expires_and_evicts(mongo):
+    record_cache = RecordCache(max_bytes=300, ttl={'users': 0.0, 'questions': None})
+    record_cache.put(mongo, 'users', {'_id': 1, 'name': 'ann'}, keys=('name',))
+    time.sleep(0.01)
+    assert record_cache.get(mongo, 'users', 'name', 'ann') is None
+    record_cache.put(mongo, 'games', {'_id': 1})
+    assert len(record_cache) == 0  # Collection without TTL entry is not cached
+    for number in range(4):
+        record_cache.put(mongo, 'questions', make_question_document(number) | {'_id': number})
+    stats = record_cache.stats()
+    assert stats['bytes'] <= 300 and stats['evictions'] == 4 - stats['entries']
+    assert record_cache.get(mongo, 'questions', '_id', 3)['question_code'] == 'code0003'
+    assert record_cache.get(mongo, 'questions', '_id', 0) is None
+    assert record_cache.stats()['expirations'] == 1
+
+
+def test_unit_of_work_merges_record_updates(mongo):
+    user_id = mongo['users'].insert_one({'name': 'ann', 'correct_answers': 1, 'questions': ['a'], 'games': []}).inserted_id
+    game_id = mongo['games'].insert_one({'questions': [], 'score': [0, 0]}).inserted_id
+    unit = UnitOfWork(mongo)
+    unit.push('users', user_id, 'questions', 'b')
+    unit.inc('users', user_id, 'correct_answers')
+    unit.push('users', user_id, 'questions', 'c')
+    unit.push('games', game_id, 'questions', 'b')
+    unit.inc('games', game_id, 'score.1')
+    assert [len(x) for x in unit.operations().values()] == [1, 1]
+    unit.flush()
+    assert len(unit) == 0
+    user = mongo['users'].find_one({'_id': user_id})
+    assert user['questions'] == ['a', 'b', 'c']
+    assert user['correct_answers'] == 2
+    assert mongo['games'].find_one({'_id': game_id})['score'] == [0, 1]
+
+
+def test_save_to_db_sends_only_changes(mongo):
+    user = User.load_by_name(mongo, 'ann', 'users')
+    user.questions.extend(['a', 'b'])
+    user.correct_answers += 1
+    assert user.pending_update() == {'$inc': {'correct_answers': 1}}
+    assert [x[1]['question_code'] for x in user.pending_upserts()] == ['a', 'b']
+    user.save_to_db('users')
+    assert user.pending_update() == {}
+    assert user.pending_upserts() == []
+    game = Game(mongo)
+    game.score = [0, 0]
+    game.save_to_db('games')
+    game.score = [0, 2]
+    assert game.pending_update() == {'$inc': {'score.1': 2}}
+    reloaded = User.load_by_id(mongo, user._id)
+    assert 'questions' not in mongo['users'].find_one({'_id': user._id})
+    assert seen_codes(mongo, user._id) == ['a', 'b']
+    assert reloaded.questions == []
+    assert reloaded.correct_answers == 1
+
+
+def test_save_to_db_detects_duplicates_by_unique_index(mongo):
+    ensure_indexes(mongo)
+    User.load_by_name(mongo, 'ann', 'users')
+    duplicate = User(mongo)
+    duplicate.name = 'ann'
+    with pytest.raises(AttributeError):
+        duplicate.save_to_db('users')
+
+
+def test_dropped_records_are_released():
+    db = MongoClient('mongodb://localhost:27017', connect=False)['BIGQUIZ']
+    references = []
+    for number in range(300):
+        question = Question(db)
+        question.fill_from_document(make_question_document(number))
+        user = User(db)
+        user.name = f'player{number}'
+        references += [weakref.ref(question), weakref.ref(user)]
+    del question, user
+    gc.collect()
+    assert all(reference() is None for reference in references)
+
+
+def test_records_are_compact_and_write_once():
+    db = MongoClient('mongodb://localhost:27017', connect=False)['BIGQUIZ']
+    user = User(db)
+    user.name = 'ann'
+    with pytest.raises(AttributeError):
+        user.name = 'bob'
+    with pytest.raises(AttributeError):
+        user.nickname = 'bob'
+    for record in (user, Game(db), Question(db)):
+        assert not hasattr(record, '__dict__')
+    assert user.name == 'ann'
+
+
+class ClosingQuiz:
+    def __init__(self, db):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_room_registry_keeps_rooms_apart_and_evicts_idle():
+    registry = RoomRegistry(None, idle_timeout=10, quiz_factory=ClosingQuiz)
+    first_room = registry.get('first')
+    assert registry.get('first') is first_room
+    second_room = registry.get('second')
+    assert second_room.quiz is not first_room.quiz
+    first_room.last_used = second_room.last_used - 20
+    assert registry.evict_idle(second_room.last_used) == ['first']
+    assert first_room.quiz.closed
+    assert 'first' not in registry and 'second' in registry
+
+
+@pytest.mark.parametrize('store_type', ['memory', 'mongo'])
+def test_workers_share_live_game_state(question_bank, store_type):
+    store = MemoryStateStore() if store_type == 'memory' else MongoStateStore(question_bank)
+    workers = [RoomRegistry(question_bank, state_store=store) for _ in range(2)]
+    names = ['ann', 'bob']
+    for number, name in enumerate(names):
+        user = User.load_by_name(question_bank, name, 'users')
+        with workers[number % 2].use('room') as quiz:
+            quiz.register_user(user)
+    with workers[0].use('room') as quiz:
+        quiz.start_game(quiz.propose_game())
+    for number in range(6):
+        with workers[number % 2].use('room', exclusive=False) as quiz:
+            assert quiz.register_answer(names[number % 2], 0)
+    states = []
+    for worker in workers:
+        with worker.use('room') as quiz:
+            states.append(quiz.dump_state())
+    assert states[0] == states[1]
+    stored_game = question_bank['games'].find_one({'_id': states[0]['game']})
+    assert len(stored_game['questions']) == 3
+    assert [name for name, _ in states[0]['score']] == names
+    for worker in workers:
+        worker.close()
+
+
+def test_load_state_drops_deleted_users(question_bank):
+    quiz = Quiz(question_bank)
+    names = ['ann', 'bob', 'cid']
+    for name in names:
+        quiz.register_user(User.load_by_name(question_bank, name, 'users'))
+    quiz.start_game(quiz.propose_game())
+    played = quiz.current_question.question_code
+    assert all(quiz.register_answer(name, 0) for name in names)
+    state = quiz.dump_state()
+    question_bank['users'].delete_one({'name': 'bob'})
+    other = Quiz(question_bank)
+    other.load_state(state)
+    assert list(other._loaded_users) == list(other._score) == list(other._users_answers) == ['ann', 'cid']
+    assert other._known_counts == {played: 2}
+    assert other.register_answer('ann', 0) and other.register_answer('cid', 0)
+    assert other.current_question.question_code != quiz.current_question.question_code
+    quiz.close()
+    other.close()
+
+
+def test_mongo_state_store_lease_is_exclusive(mongo):
+    store = MongoStateStore(mongo, lease=0.2, poll=0.001)
+    token, version, state = store.acquire('room')
+    assert (version, state) == (0, None)
+    start = time.monotonic()
+    second_token, version, state = store.acquire('room')
+    assert time.monotonic() - start >= 0.15
+    assert store.release('room', token, {'order': []}) == 0
+    assert store.release('room', second_token, {'order': ['ann']}) == 1
+    assert store.acquire('room')[1:] == (1, {'order': ['ann']})
+
+
+def play_journaled_room(registry, db, answers):
+    names = ['ann', 'bob']
+    for name in names:
+        user = User.load_by_name(db, name, 'users')
+        with registry.use('room') as quiz:
+            quiz.register_user(user)
+    with registry.use('room') as quiz:
+        quiz.start_game(quiz.propose_game())
+    for number in range(answers):
+        with registry.use('room', exclusive=False) as quiz:
+            assert quiz.register_answer(names[number % 2], 0)
+    return quiz
+
+
+def test_write_behind_writes_rounds_in_background(question_bank, tmp_path):
+    write_behind = WriteBehind(question_bank, str(tmp_path))
+    quiz = play_journaled_room(RoomRegistry(
+        question_bank, write_behind=write_behind), question_bank, 6)
+    write_behind.wait_flushed()
+    stored_game = question_bank['games'].find_one({'_id': quiz.dump_state()['game']})
+    assert len(stored_game['questions']) == 3
+    assert len(stored_game['journal_rounds']) == 3
+    write_behind.close()
+    entries = Journal.read(write_behind.journal.path)
+    assert [x['type'] for x in entries].count('round') == 3
+    assert sum(len(x['tags']) for x in entries if x['type'] == 'flushed') == 3
+
+
+class LostWritesDatabase:
+    """
+        Database of crashed process, writes wait for opened gate and land in lost_ prefixed collections
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.name = db.name
+        self.gate = threading.Event()
+
+    def __getitem__(self, col):
+        self.gate.wait()
+        return self.db[f'lost_{col}']
+
+
+def test_write_behind_replays_journal_of_crashed_process(question_bank, tmp_path):
+    lost = LostWritesDatabase(question_bank)
+    crashed = WriteBehind(lost, str(tmp_path / 'crashed'))
+    state = play_journaled_room(RoomRegistry(
+        question_bank, write_behind=crashed), question_bank, 5).dump_state()
+    crashed.wait_synced()
+    # Journal as left on disk by process killed before its writer sent any round
+    copy = str(tmp_path / 'journal-crashed.log')
+    shutil.copyfile(crashed.journal.path, copy)
+    lost.gate.set()
+    crashed.close()
+    assert question_bank['games'].find_one({'_id': state['game']})['questions'] == []
+
+    write_behind = WriteBehind(question_bank, str(tmp_path))
+    registry = RoomRegistry(question_bank, write_behind=write_behind)
+    assert registry.recover() == ['room']
+    with registry.use('room') as quiz:
+        assert quiz.dump_state() == state
+    stored_game = question_bank['games'].find_one({'_id': state['game']})
+    assert len(stored_game['questions']) == 2
+    assert not os.path.exists(copy)
+    registry.close()
+    write_behind.close()
+
+
+def test_write_behind_round_is_applied_once(mongo, tmp_path):
+    _id = mongo['games'].insert_one({'questions': []}).inserted_id
+    write_behind = WriteBehind(mongo, str(tmp_path))
+    entry = {'tag': 'round1', 'updates': [['games', _id, {'$push': {'questions': {'$each': ['code']}}}]]}
+    write_behind._write([entry])
+    write_behind._write([entry])
+    assert mongo['games'].find_one({'_id': _id})['questions'] == ['code']
+    write_behind.close()
+
+
+def test_concurrent_answers_keep_game_consistent(question_bank):
+    question_bank['questions'].insert_many(
+        [make_question_document(number) for number in range(20, 300)])
+    quiz = Quiz(question_bank)
+    names = [f'player{n}' for n in range(8)]
+    for name in names:
+        quiz.register_user(User.load_by_name(question_bank, name, 'users'))
+    game = quiz.propose_game()
+    quiz.start_game(game)
+
+    def answer(number):
+        return quiz.register_answer(names[number % len(names)], number % 4)
+
+    with ThreadPoolExecutor(16) as executor:
+        assert all(executor.map(answer, range(1600)))
+    quiz.close()
+    assert len(game.questions) == len(set(game.questions)) > 0
+    stored_game = question_bank['games'].find_one({'_id': game._id})
+    assert stored_game['questions'] == game.questions
+    assert stored_game['score'] == list(quiz._score.values())
+    for name in names:
+        stored_user = question_bank['users'].find_one({'name': name})
+        assert seen_codes(question_bank, stored_user['_id']) == sorted(game.questions)
+        assert stored_user['correct_answers'] == quiz._score[name]
+
+
+def test_failing_question_pool_does_not_block_room(question_bank, monkeypatch):
+    quiz = Quiz(question_bank)
+    names = ['ann', 'bob']
+    for name in names:
+        quiz.register_user(User.load_by_name(question_bank, name, 'users'))
+    quiz.start_game(quiz.propose_game())
+    pop = quiz._question_pool.pop
+
+    def pool_failed():
+        raise OperationFailure('MongoDB is down')
+
+    monkeypatch.setattr(quiz._question_pool, 'pop', pool_failed)
+    assert quiz.register_answer('ann', 0)
+    with pytest.raises(OperationFailure):
+        quiz.register_answer('bob', 0)
+    with pytest.raises(OperationFailure):
+        quiz.start_game(quiz.propose_game())
+    start = time.perf_counter()
+    assert not quiz.register_answer('ann', 0)
+    assert time.perf_counter() - start < 1.0
+    stored_game = question_bank['games'].find_one({})
+    assert len(stored_game['questions']) == 1
+
+    monkeypatch.setattr(quiz._question_pool, 'pop', pop)
+    quiz.start_game(quiz.propose_game())
+    assert quiz.register_answer('ann', 0) and quiz.register_answer('bob', 0)
+    assert len(question_bank['games'].find_one({})['questions']) == 2
+    quiz.close()
+
+
+def test_async_quiz_plays_rounds(question_bank):
+    names = ['ann', 'bob']
+
+    async def play():
+        db = AsyncIOMotorClient(
+            **question_bank.pmr_credentials.as_mongo_kwargs())[question_bank.name]
+        quiz = AsyncQuiz(db)
+        for name in names:
+            quiz.register_user(await AsyncUser.load_by_name(db, name, 'users'))
+        game = await quiz.propose_game()
+        await quiz.start_game(game)
+        answers = await asyncio.gather(
+            *[quiz.register_answer(names[number % 2], number % 4) for number in range(12)])
+        quiz.close()
+        return quiz, game, answers
+
+    quiz, game, answers = asyncio.run(play())
+    assert all(answers)
+    assert len(game.questions) == len(set(game.questions)) == 6
+    stored_game = question_bank['games'].find_one({'_id': game._id})
+    assert stored_game['questions'] == game.questions
+    assert stored_game['score'] == list(quiz._score.values())
+    for name in names:
+        stored_user = question_bank['users'].find_one({'name': name})
+        assert stored_user['games'] == [game._id]
+        assert seen_codes(question_bank, stored_user['_id']) == sorted(game.questions)
+
+
+def test_asgi_rejects_unknown_routes_before_creating_rooms(mongo):
+    registry = RoomRegistry(mongo, quiz_factory=AsyncQuiz)
+    application = create_asgi_app(db=mongo, registry=registry)
+
+    async def get(path):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+        await application({'type': 'http', 'path': path, 'headers': []}, None, send)
+        return sent[0]['status']
+
+    async def run():
+        return [await get('/quiz/rooms/a/nothing/ann'), await get('/quiz/rooms/b/put_answer/ann'),
+                await get('/quiz/rooms/c/remove_user/ann/bob'), await get('/quiz/rooms/d/events/x'),
+                await get('/quiz/rooms/e/remove_user/ann')]
+
+    assert asyncio.run(run()) == [404, 404, 404, 404, 200]
+    assert len(registry) == 1 and 'e' in registry
+    registry.close()
+
+
+def test_broadcaster_fans_out_and_replays_events():
+    broadcaster = Broadcaster(history=3)
+    first = broadcaster.listen(timeout=0.01)
+    second = broadcaster.listen(timeout=0.01)
+    assert next(first) is None
+    broadcaster.publish('score-updated', {'ann': 1})
+    assert next(first) == next(second) == (1, 'score-updated', {'ann': 1})
+    for number in range(4):
+        broadcaster.publish('answer-received', {'user': number})
+    assert [x[0] for x in broadcaster.events_after(1)] == [3, 4, 5]
+    broadcaster.close()
+    assert [x[0] for x in first] == [3, 4, 5]
+    assert format_sse((1, 'score-updated', {'ann': 1})) == 'id: 1\nevent: score-updated\ndata: {"ann": 1}\n\n'
+
+
+def test_broadcaster_waits_for_listener_from_future():
+    broadcaster = Broadcaster()
+    broadcaster.publish('score-updated', {'ann': 1})
+    stale = broadcaster.listen(last_id=1000, timeout=0.05)  # Last-Event-ID from before restart
+    start = time.perf_counter()
+    assert next(stale) is None
+    assert time.perf_counter() - start >= 0.04
+    broadcaster.publish('score-updated', {'ann': 2})
+    assert next(stale) == (2, 'score-updated', {'ann': 2})
+    broadcaster.close()
+
+
+class CommandCounter(monitoring.CommandListener):
+    """
+        Records database commands sent by client, connection handshakes are skipped
+    """
+    skipped = {'hello', 'ismaster', 'isMaster', 'saslStart', 'saslContinue', 'endSessions', 'ping'}
+
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name not in self.skipped:
+            self.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class CountedQuiz(Quiz):
+    question_pool = partial(QuestionPool, size=0, low_water=0)  # Questions loaded on demand only
+
+
+def mongo_uri(db):
+    return 'mongodb://{username}:{password}@{host}:{port}/?authSource={authSource}'.format(
+        **db.pmr_credentials.as_mongo_kwargs())
+
+
+@pytest.fixture
+def counted_client(question_bank):
+    counter = CommandCounter()
+    app = create_app(Config(mongo_uri(question_bank), question_bank.name, quiz_factory=CountedQuiz,
+                            client_options={'event_listeners': [counter]}))
+    context = app.extensions['bigquiz']
+    context.rooms  # Indexes are ensured on first usage in process
+    yield app.test_client(), counter
+    context.close()
+
+
+def test_controllers_round_trips(counted_client):
+    client, counter = counted_client
+
+    def round_trips(url):
+        counter.commands.clear()
+        assert client.get(f'/quiz/rooms/room{url}').status_code == 200
+        return len(counter.commands)
+
+    def correct_choice():
+        return 'ABCD'[client.application.extensions['bigquiz'].rooms.get('room').quiz._shuffled_answers.index(0)]
+
+    assert round_trips('/register_user/ann') == 2  # find, insert of new user
+    assert round_trips('/register_user/bob') == 2
+    assert round_trips('/register_user/ann') == 1  # find of existing user
+    assert round_trips('/register_user/ann') == 0  # served by record cache
+    assert round_trips('/start_game') == 4  # find game, insert game, users games, question
+    assert round_trips(f'/put_answer/ann/{correct_choice()}') == 0
+    # Next question, game, correct_answers of users, seen questions
+    assert round_trips(f'/put_answer/bob/{correct_choice()}') == 4
+    assert round_trips('/remove_user/bob') == 0
+    assert round_trips('/put_answer/ann/X') == 0
+    assert round_trips('/send_x/ann') == 4
+
+
+def test_metrics_time_calls_in_prometheus_format():
+    registry = MetricsRegistry()
+    seconds = registry.histogram('bigquiz_test_seconds', 'Test calls', ('endpoint',), buckets=(0.5,))
+
+    @timed(seconds)
+    def fast():
+        return 'fast'
+
+    @timed(seconds, 'waiting')
+    async def slow():
+        await asyncio.sleep(0.6)
+
+    assert fast() == fast.__wrapped__() == 'fast'
+    asyncio.run(slow())
+    rendered = registry.render()
+    assert '# TYPE bigquiz_test_seconds histogram' in rendered
+    assert 'bigquiz_test_seconds_bucket{endpoint="fast",le="0.5"} 1' in rendered
+    assert 'bigquiz_test_seconds_bucket{endpoint="waiting",le="0.5"} 0' in rendered
+    assert 'bigquiz_test_seconds_count{endpoint="waiting"} 1' in rendered
+    disabled = MetricsRegistry(enabled=False).histogram('bigquiz_test_seconds', 'Test calls')
+    assert timed(disabled)(slow) is slow
+
+    commands = CommandMetrics(registry)
+    for event in [SimpleNamespace(command_name='find', duration_micros=120),
+                  SimpleNamespace(command_name='update', duration_micros=80)]:
+        commands.succeeded(event)
+    assert 'bigquiz_mongo_command_seconds_count{command="find",outcome="succeeded"} 1' in registry.render()
+
+
+def test_create_app_connects_on_first_request(question_bank, monkeypatch):
+    with pytest.raises(KeyError):
+        create_app(Config.from_env({'BIGQUIZ_MONGO_DB': question_bank.name}))
+    app = create_app(Config.from_env({'BIGQUIZ_MONGO_URI': mongo_uri(question_bank),
+                                      'BIGQUIZ_MONGO_DB': question_bank.name}))
+    context = app.extensions['bigquiz']
+    assert not context.client.connected
+    client = app.test_client()
+    assert client.get('/quiz/rooms/lazy/register_user/ann').status_code == 200
+    assert context.client.connected
+    process_client, rooms = context.client.client, context.rooms
+    pid = os.getpid() + 1
+    monkeypatch.setattr(os, 'getpid', lambda: pid)  # Forked worker
+    assert context.client.client is not process_client and context.rooms is not rooms
+    assert client.get('/quiz/rooms/lazy/register_user/bob').status_code == 200
+    assert list(context.rooms.get('lazy').quiz._loaded_users) == ['bob']
+    context.close()
+
+
+def test_event_streams_are_limited_per_process(question_bank, monkeypatch):
+    app = create_app(Config(mongo_uri(question_bank), question_bank.name, event_streams=1))
+    client = app.test_client()
+    rooms = app.extensions['bigquiz'].rooms
+
+    def room_failed(room_id):
+        raise OperationFailure('MongoDB is down')
+
+    monkeypatch.setattr(rooms, 'get', room_failed)
+    assert client.get('/quiz/rooms/watched/events', buffered=False).status_code == 500
+    monkeypatch.undo()
+    first = client.get('/quiz/rooms/watched/events', buffered=False)
+    assert first.status_code == 200
+    assert client.get('/quiz/rooms/watched/events', buffered=False).status_code == 503
+    first.close()
+    second = client.get('/quiz/rooms/watched/events', buffered=False, headers={'Last-Event-ID': '1000'})
+    assert second.status_code == 200
+    assert next(second.response).startswith(b'event: question-changed')  # Future id gets current state
+    second.close()
+    app.extensions['bigquiz'].close()
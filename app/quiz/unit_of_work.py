@@ -0,0 +1,287 @@
+from collections import OrderedDict
+from pymongo import UpdateOne
+from app.quiz.cache import default_cache
+
+
+class UnitOfWork:
+    """
+    Collector of field level record updates flushed as one bulk_write per collection
+
+    Attributes
+    ----------
+    db : pymongo.database.Database
+        MongoDB Database reference
+    use_transaction : bool
+        Flush all collections in single transaction, requires replica set
+
+    Methods
+    -------
+    push(col, _id, field, *values)
+        Append values to array field of record
+    inc(col, _id, field, amount=1)
+        Increment numeric field of record
+    set(col, _id, field, value)
+        Replace field value of record
+    upsert(col, query, update)
+        Idempotently write record selected by filter, inserting it if missing
+    add(record, col)
+        Collect changes of MongoRecordAdapter record
+    take_updates()
+        Hand collected updates over to other writer and clear unit
+    flush()
+        Send collected updates and clear unit
+    """
+
+    def __init__(self, db, use_transaction=False) -> None:
+        """
+            Prepare empty unit of work
+        Parameters
+        ----------
+        db : pymongo.database.Database
+            MongoDB Database reference
+        use_transaction : bool, default False
+            Flush all collections in single transaction, requires replica set
+        """
+        self.db = db
+        self.use_transaction = use_transaction
+        self._updates = OrderedDict()
+        self._upserts = []
+        self._records = []
+
+    def __len__(self):
+        return len(self._updates) + len(self._upserts)
+
+    def _fields(self, col, _id, operator):
+        """
+            Get operator document of record update, creating it if needed
+        """
+        update = self._updates.setdefault((col, _id), {})
+        return update.setdefault(operator, {})
+
+    def push(self, col, _id, field, *values):
+        """
+            Append values to array field of record
+        Parameters
+        ----------
+        col : str
+            Collection name
+        _id : bson.objectid.ObjectId
+            Id of updated record
+        field : str
+            Name of array field
+        values :
+            Appended values
+        """
+        pushed = self._fields(col, _id, '$push').setdefault(field, {'$each': []})
+        pushed['$each'].extend(values)
+
+    def inc(self, col, _id, field, amount=1):
+        """
+            Increment numeric field of record
+        Parameters
+        ----------
+        col : str
+            Collection name
+        _id : bson.objectid.ObjectId
+            Id of updated record
+        field : str
+            Name of numeric field, dotted path for array element
+        amount : int, default 1
+            Increment value
+        """
+        fields = self._fields(col, _id, '$inc')
+        fields[field] = fields.get(field, 0) + amount
+
+    def set(self, col, _id, field, value):
+        """
+            Replace field value of record
+        Parameters
+        ----------
+        col : str
+            Collection name
+        _id : bson.objectid.ObjectId
+            Id of updated record
+        field : str
+            Name of field
+        value :
+            New field value
+        """
+        self._fields(col, _id, '$set')[field] = value
+
+    def upsert(self, col, query, update):
+        """
+            Idempotently write record selected by filter, inserting it if missing
+        Parameters
+        ----------
+        col : str
+            Collection name
+        query : dict
+            Filter selecting single record, matched by unique index
+        update : dict
+            MongoDB update document, repeated write must not change record
+        """
+        self._upserts.append([col, query, update])
+
+    def add(self, record, col):
+        """
+            Collect changes of saved MongoRecordAdapter record
+            Record is marked saved at once, so later changes form next update even before flush.
+            Failed flush restores previous saved state of records not collected again meanwhile.
+        Parameters
+        ----------
+        record : MongoRecordAdapter
+            Record with _id
+        col : str
+            Collection name
+        """
+        for operator, fields in record.pending_update().items():
+            if operator == '$push':
+                for field, pushed in fields.items():
+                    self.push(col, record._id, field, *pushed['$each'])
+            elif operator == '$inc':
+                for field, amount in fields.items():
+                    self.inc(col, record._id, field, amount)
+            else:
+                self._fields(col, record._id, operator).update(fields)
+        for related_col, query, update in record.pending_upserts():
+            self.upsert(related_col, query, update)
+        previous_state = record._saved_state
+        record.mark_saved()
+        self._records.append((record, previous_state, record._saved_state))
+
+    def take_updates(self):
+        """
+            Hand collected updates over to other writer and clear unit
+            Records stay marked saved, so the writer is responsible for delivering updates
+        Returns
+        -------
+        tuple
+            ([collection name, record _id, MongoDB update document] list in collecting order,
+             [collection name, filter, MongoDB update document] list of upserts)
+        """
+        updates = [[col, _id, update]
+                   for (col, _id), update in self._updates.items()]
+        upserts = self._upserts
+        self._updates = OrderedDict()
+        self._upserts = []
+        self._records = []
+        return updates, upserts
+
+    def operations(self):
+        """
+            Group collected updates by collection
+        Returns
+        -------
+        dict
+            Collection name to list of pymongo.UpdateOne
+        """
+        operations = OrderedDict()
+        for (col, _id), update in self._updates.items():
+            operations.setdefault(col, []).append(
+                UpdateOne({'_id': _id}, update))
+        for col, query, update in self._upserts:
+            operations.setdefault(col, []).append(
+                UpdateOne(query, update, upsert=True))
+        return operations
+
+    def _invalidate(self, keys):
+        """
+            Drop cached documents of written records
+        """
+        cache = default_cache()
+        for col, _id in keys:
+            cache.invalidate(self.db, col, _id)
+
+    def flush(self):
+        """
+            Send collected updates as one bulk_write per collection and clear unit
+        Returns
+        -------
+        dict
+            Collection name to pymongo.results.BulkWriteResult
+        """
+        operations = self.operations()
+        records = self._records
+        keys = list(self._updates)
+        self._updates = OrderedDict()
+        self._upserts = []
+        self._records = []
+        if not operations:
+            return {}
+        try:
+            if self.use_transaction:
+                with self.db.client.start_session() as session:
+                    results = session.with_transaction(
+                        lambda session: self._write(operations, session))
+            else:
+                results = self._write(operations)
+        except Exception:
+            for record, previous_state, saved_state in reversed(records):
+                if record._saved_state is saved_state:
+                    record._saved_state = previous_state
+            raise
+        self._invalidate(keys)
+        return results
+
+    def _write(self, operations, session=None):
+        """
+            Send grouped operations
+        """
+        return {col: self.db[col].bulk_write(ops, ordered=False, session=session)
+                for col, ops in operations.items()}
+
+
+class AsyncUnitOfWork(UnitOfWork):
+    """
+    Unit of work flushed with Motor, collected updates are the same as in UnitOfWork
+
+    Attributes
+    ----------
+    db : motor.motor_asyncio.AsyncIOMotorDatabase
+        Motor Database reference
+    use_transaction : bool
+        Flush all collections in single transaction, requires replica set
+
+    Methods
+    -------
+    flush()
+        Send collected updates and clear unit
+    """
+
+    async def flush(self):
+        """
+            Send collected updates as one bulk_write per collection and clear unit
+        Returns
+        -------
+        dict
+            Collection name to pymongo.results.BulkWriteResult
+        """
+        operations = self.operations()
+        records = self._records
+        keys = list(self._updates)
+        self._updates = OrderedDict()
+        self._upserts = []
+        self._records = []
+        if not operations:
+            return {}
+        try:
+            if self.use_transaction:
+                async with await self.db.client.start_session() as session:
+                    async with session.start_transaction():
+                        results = await self._write(operations, session)
+            else:
+                results = await self._write(operations)
+        except Exception:
+            for record, previous_state, saved_state in reversed(records):
+                if record._saved_state is saved_state:
+                    record._saved_state = previous_state
+            raise
+        self._invalidate(keys)
+        return results
+
+    async def _write(self, operations, session=None):
+        """
+            Send grouped operations
+        """
+        return {col: await self.db[col].bulk_write(ops, ordered=False, session=session)
+                for col, ops in operations.items()}
@@ -0,0 +1,144 @@
+"""
+    Requests per second of synchronous Flask server and ASGI server at many concurrent connections
+
+    Both servers are started as subprocesses against the same database and driven by
+    the same asyncio client, every connection plays as one player of a room.
+
+    Run from repository root against local mongod:
+        python -m benchmarks.bench_async --uri mongodb://localhost:27017 --connections 1000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import httpx
+from pymongo.mongo_client import MongoClient
+from app.quiz.indexes import ensure_indexes
+from app.quiz.records import SEEN_COLLECTION
+from benchmarks.bench_sampling import seed
+
+
+def serve_sync(uri, db_name, port):
+    """
+        Flask application of main.py served by threaded werkzeug server
+    """
+    from werkzeug.serving import run_simple
+    from app.app import create_app
+    from app.config import Config
+    run_simple('127.0.0.1', port, create_app(Config.from_env(mongo_uri=uri, mongo_db=db_name)), threaded=True)
+
+
+def serve_async(uri, db_name, port):
+    """
+        ASGI application served by uvicorn
+    """
+    import uvicorn
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from app.asgi import create_asgi_app
+    application = create_asgi_app(
+        connect=lambda: AsyncIOMotorClient(uri)[db_name])
+    uvicorn.run(application, host='127.0.0.1', port=port,
+                log_level='warning', backlog=4096)
+
+
+def start_server(mode, args, port):
+    """
+        Start server subprocess and wait until it accepts requests
+    """
+    process = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_async', mode,
+                                '--uri', args.uri, '--db', args.db, '--port', str(port)],
+                               env=dict(os.environ, PYTHONUNBUFFERED='1'))
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/quiz/rooms/probe/remove_user/nobody')
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+async def play(client, base_url, room_id, name, rounds, started, counter):
+    """
+        Single connection playing register_user -> start_game -> put_answer loop
+    """
+    prefix = f'{base_url}/quiz/rooms/{room_id}'
+    await client.get(f'{prefix}/register_user/{name}')
+    counter[0] += 1
+    if name.endswith('player0'):
+        await client.get(f'{prefix}/start_game')
+        counter[0] += 1
+        started.set()
+    await started.wait()
+    for number in range(rounds):
+        await client.get(f'{prefix}/put_answer/{name}/{"ABCD"[number % 4]}')
+        counter[0] += 1
+
+
+async def drive(base_url, connections, players, rounds):
+    """
+        Run all connections at once
+    Returns
+    -------
+    tuple
+        (number of requests, elapsed seconds)
+    """
+    limits = httpx.Limits(max_connections=connections,
+                          max_keepalive_connections=connections)
+    counter = [0]
+    async with httpx.AsyncClient(limits=limits, timeout=120.0) as client:
+        rooms = {}
+        tasks = []
+        for n in range(connections):
+            room_id = f'room{n // players}'
+            started = rooms.setdefault(room_id, asyncio.Event())
+            tasks.append(play(client, base_url, room_id,
+                              f'{room_id}-player{n % players}', rounds, started, counter))
+        start = time.perf_counter()
+        await asyncio.gather(*tasks)
+        return counter[0], time.perf_counter() - start
+
+
+def reset(db, questions):
+    for col in ('users', 'games', 'questions', SEEN_COLLECTION):
+        db[col].drop()
+    ensure_indexes(db)
+    seed(db['questions'], questions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('mode', nargs='?', default='bench',
+                        choices=['bench', 'serve-sync', 'serve-async'])
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db', default='BIGQUIZ_BENCH')
+    parser.add_argument('--port', type=int, default=5600)
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--questions', type=int, default=20_000)
+    args = parser.parse_args()
+    if args.mode == 'serve-sync':
+        return serve_sync(args.uri, args.db, args.port)
+    if args.mode == 'serve-async':
+        return serve_async(args.uri, args.db, args.port)
+
+    db = MongoClient(args.uri)[args.db]
+    print(f"{'server':>6} | {'requests':>8} | {'seconds':>8} | {'req/s':>8}")
+    for mode, port in (('serve-sync', args.port), ('serve-async', args.port + 1)):
+        reset(db, args.questions)
+        process = start_server(mode, args, port)
+        try:
+            requests, elapsed = asyncio.run(drive(
+                f'http://127.0.0.1:{port}', args.connections, args.players, args.rounds))
+        finally:
+            process.terminate()
+            process.wait()
+        print(f'{mode[6:]:>6} | {requests:>8} | {elapsed:>8.2f} | {requests / elapsed:>8.0f}')
+
+
+if __name__ == '__main__':
+    main()
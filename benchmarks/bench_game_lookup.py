@@ -0,0 +1,81 @@
+"""
+    Time of Game.load_by_users for players sharing thousands of historical games
+
+    Every historical game contains both players and one more user, so the former $all query
+    matches all of them, the exact users set matches only one unfinished game.
+
+    Run from repository root against local mongod:
+        python -m benchmarks.bench_game_lookup --uri mongodb://localhost:27017
+"""
+import argparse
+import statistics
+import time
+from bson.objectid import ObjectId
+from pymongo.mongo_client import MongoClient
+from app.quiz.indexes import ensure_indexes
+from app.quiz.records import Game
+
+HISTORY_SIZES = [10, 1_000, 10_000]
+
+
+def load_by_all(db, users):
+    """
+        Former lookup, $all scan with client side set comparison and second query by id
+    """
+    for game in db['games'].find({'users': {'$all': users}}):
+        if set(game['users']) == set(users):
+            return Game.load_by_id(db, game['_id'], cached=False)
+    return None
+
+
+def measure(function, repeats):
+    """
+        Time single lookups
+    Returns
+    -------
+    list of float
+        Call latencies in milliseconds
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db', default='BIGQUIZ_BENCH')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--sizes', type=int, nargs='+', default=HISTORY_SIZES)
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    users = [ObjectId(), ObjectId()]
+    print(f"{'games':>8} | {'$all p50 ms':>11} | {'key p50 ms':>10}")
+    for size in args.sizes:
+        db['games'].drop()
+        ensure_indexes(db, {'games': Game})
+        db['games'].create_index('users')  # Index used by former $all query
+        for start in range(0, size, 10_000):
+            batch = []
+            for _ in range(min(10_000, size - start)):
+                game_users = users + [ObjectId()]
+                batch.append({'users': game_users, 'users_key': Game.make_users_key(game_users),
+                              'questions': [], 'score': [0, 0, 0], 'is_finished': True, 'winner': None})
+            db['games'].insert_many(batch)
+        current = Game(db)
+        current.users.load(users)
+        current.save_to_db('games')
+        legacy = measure(lambda: load_by_all(db, users), args.repeats)
+        keyed = measure(lambda: Game.load_by_users(
+            db, users, 'games', unfinished=True), args.repeats)
+        assert Game.load_by_users(db, users, 'games', unfinished=True)._id == current._id
+        print(f'{size:>8} | {statistics.median(legacy):>11.3f} | {statistics.median(keyed):>10.3f}')
+    db['games'].drop()
+
+
+if __name__ == '__main__':
+    main()
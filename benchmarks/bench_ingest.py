@@ -0,0 +1,39 @@
+"""
+    Trivia API ingestion throughput in questions per second against local stub
+
+    Run from repository root against local mongod:
+        python -m benchmarks.bench_ingest --uri mongodb://localhost:27017
+"""
+import argparse
+import time
+from pymongo.mongo_client import MongoClient
+from app.quiz.ingest import ingest
+from app.quiz.opentdb import OpenTDBClient
+from benchmarks.opentdb_stub import start_stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db', default='BIGQUIZ_BENCH')
+    parser.add_argument('--target', type=int, default=20_000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 50])
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    server, url = start_stub()
+    print(f"{'batch':>6} | {'questions':>9} | {'q/s':>10}")
+    for batch_size in args.batch_sizes:
+        db['questions'].drop()
+        client = OpenTDBClient(url)
+        start = time.perf_counter()
+        inserted = ingest(db, client, args.target, batch_size=batch_size,
+                          max_batches=2 * args.target // batch_size + 1)
+        elapsed = time.perf_counter() - start
+        print(f'{batch_size:>6} | {inserted:>9} | {inserted / elapsed:>10.0f}')
+    db['questions'].drop()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+    Latency and throughput of quiz request lifecycle through Flask test client
+
+    Question bank is ingested from local Trivia API stub, then every room registers its players,
+    starts game and plays rounds by put_answer of all players. The last answer of a round is
+    reported separately as round_transition, since it writes round results and loads next question.
+    Results are saved as JSON, --compare prints p50 and throughput change against earlier run.
+
+    Run from repository root against local mongod:
+        python -m benchmarks.bench_lifecycle --uri mongodb://localhost:27017 --output lifecycle.json
+        python -m benchmarks.bench_lifecycle --compare lifecycle.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pymongo.mongo_client import MongoClient
+from app.app import create_app
+from app.config import Config
+from app.quiz.indexes import ensure_indexes
+from app.quiz.ingest import ingest
+from app.quiz.opentdb import OpenTDBClient
+from app.quiz.records import SEEN_COLLECTION
+from benchmarks.opentdb_stub import start_stub
+
+ENDPOINTS = ['register_user', 'start_game', 'put_answer', 'round_transition']
+
+
+def prepare_database(args):
+    """
+        Drop quiz collections and ingest question bank from Trivia API stub
+    """
+    db = MongoClient(args.uri)[args.db]
+    for col in ('users', 'games', 'questions', SEEN_COLLECTION, 'room_states'):
+        db[col].drop()
+    ensure_indexes(db)
+    server, url = start_stub()
+    try:
+        ingest(db, OpenTDBClient(url=url, backoff=0.0), args.questions, max_batches=None)
+    finally:
+        server.shutdown()
+    return db
+
+
+def play_room(app, room_id, args, timings):
+    """
+        Drive single room through Flask test client, answers are drawn from room seeded generator
+    """
+    client = app.test_client()
+    choices = random.Random(f'{args.seed}-{room_id}')
+
+    def call(endpoint, path):
+        start = time.perf_counter()
+        response = client.get(f'/quiz/rooms/{room_id}{path}')
+        timings[endpoint].append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+
+    names = [f'{room_id}-player{n}' for n in range(args.players)]
+    for name in names:
+        call('register_user', f'/register_user/{name}')
+    call('start_game', '/start_game')
+    for _ in range(args.rounds):
+        for name in names[:-1]:
+            call('put_answer', f'/put_answer/{name}/{choices.choice("ABCD")}')
+        call('round_transition', f'/put_answer/{names[-1]}/{choices.choice("ABCD")}')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(timings, elapsed):
+    """
+        Percentiles and throughput of every endpoint
+    Returns
+    -------
+    dict
+        Endpoint name to calls, throughput per second and latency percentiles in milliseconds
+    """
+    results = {}
+    for endpoint in ENDPOINTS:
+        values = timings[endpoint]
+        if not values:
+            continue
+        results[endpoint] = {'calls': len(values), 'per_second': len(values) / elapsed,
+                             'p50_ms': percentile(values, 0.5), 'p90_ms': percentile(values, 0.9),
+                             'p99_ms': percentile(values, 0.99), 'max_ms': max(values)}
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(e)
+        return None
+
+
+def compare(report, baseline):
+    """
+        Print p50 latency and throughput of report relative to baseline run
+    """
+    print(f"against {baseline.get('commit')} from {baseline.get('created')}")
+    print(f"{'endpoint':>16} | {'p50 ms':>8} | {'base ms':>8} | {'p50 x':>6} | {'req/s x':>7}")
+    for endpoint, result in report['results'].items():
+        base = baseline['results'].get(endpoint)
+        if base is None:
+            continue
+        print(f"{endpoint:>16} | {result['p50_ms']:>8.3f} | {base['p50_ms']:>8.3f} | "
+              f"{result['p50_ms'] / base['p50_ms']:>6.2f} | {result['per_second'] / base['per_second']:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db', default='BIGQUIZ_BENCH')
+    parser.add_argument('--questions', type=int, default=5_000)
+    parser.add_argument('--rooms', type=int, default=50)
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file of results')
+    parser.add_argument('--compare', help='JSON file of earlier run')
+    args = parser.parse_args()
+
+    db = prepare_database(args)
+    app = create_app(Config.from_env(mongo_uri=args.uri, mongo_db=args.db))
+
+    timings = defaultdict(list)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        futures = [executor.submit(play_room, app, f'room{n}', args, timings) for n in range(args.rooms)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+    app.extensions['bigquiz'].close()
+
+    report = {'commit': git_commit(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(), 'mongodb': db.client.server_info()['version'],
+              'parameters': {key: value for key, value in vars(args).items()
+                             if key not in ('uri', 'output', 'compare')},  # URI may hold credentials
+              'seconds': elapsed, 'per_second': sum(map(len, timings.values())) / elapsed,
+              'results': summarize(timings, elapsed)}
+    print(f"{report['per_second']:.0f} requests/s in {elapsed:.1f} s")
+    print(f"{'endpoint':>16} | {'calls':>6} | {'req/s':>8} | {'p50 ms':>8} | {'p90 ms':>8} | {'p99 ms':>8}")
+    for endpoint, result in report['results'].items():
+        print(f"{endpoint:>16} | {result['calls']:>6} | {result['per_second']:>8.1f} | "
+              f"{result['p50_ms']:>8.3f} | {result['p90_ms']:>8.3f} | {result['p99_ms']:>8.3f}")
+    if args.compare:
+        with open(args.compare) as file:
+            compare(report, json.load(file))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+    Memory per Question and User record for slotted classes and dict based equivalents
+
+    Only builds objects in memory, so no running mongod is needed:
+        python -m benchmarks.bench_record_memory
+"""
+import argparse
+import gc
+import tracemalloc
+from pymongo.mongo_client import MongoClient
+from app.quiz.records import Question, User
+
+
+class DictQuestion(Question):
+    """
+        Question with instance __dict__, layout of records before __slots__
+    """
+
+
+class DictUser(User):
+    """
+        User with instance __dict__, layout of records before __slots__
+    """
+
+
+def build_question(cls, db, number):
+    question = cls(db)
+    question.fill_from_document({'question': f'Question {number}?', 'category': 'General',
+                                 'correct_answer': 'A', 'incorrect_answers': ['B', 'C', 'D'],
+                                 'question_code': f'{number:020x}'})
+    return question
+
+
+def build_user(cls, db, number):
+    user = cls(db)
+    user.name = f'player{number}'
+    return user
+
+
+def bytes_per_object(factory, cls, db, amount):
+    """
+        Average traced memory of single object
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    objects = [factory(cls, db, number) for number in range(amount)]
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del objects
+    return used / amount
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--amount', type=int, default=100_000)
+    args = parser.parse_args()
+
+    db = MongoClient('mongodb://localhost:27017', connect=False)['BIGQUIZ_BENCH']
+    print(f"{'record':>8} | {'__dict__ B':>10} | {'__slots__ B':>11}")
+    for name, factory, dict_cls, slots_cls in (('Question', build_question, DictQuestion, Question),
+                                                ('User', build_user, DictUser, User)):
+        before = bytes_per_object(factory, dict_cls, db, args.amount)
+        after = bytes_per_object(factory, slots_cls, db, args.amount)
+        print(f'{name:>8} | {before:>10.0f} | {after:>11.0f}')
+
+
+if __name__ == '__main__':
+    main()
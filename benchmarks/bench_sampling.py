@@ -0,0 +1,108 @@
+"""
+    Latency of Question.get_unknown_question for growing question banks
+
+    Known questions are passed as set of codes seen since load, with --stored they are
+    kept in seen-questions collection of --players players and skipped by anti-join.
+
+    Run from repository root against local mongod:
+        python -m benchmarks.bench_sampling --uri mongodb://localhost:27017
+        python -m benchmarks.bench_sampling --uri mongodb://localhost:27017 --stored
+"""
+import argparse
+import statistics
+import time
+from bson.objectid import ObjectId
+from pymongo.mongo_client import MongoClient
+from app.quiz.indexes import ensure_indexes
+from app.quiz.records import Question, SEEN_COLLECTION
+
+BANK_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+def seed(collection, size, batch=10_000):
+    """
+        Fill collection up to size with generated questions
+    Parameters
+    ----------
+    collection : pymongo.collection.Collection
+        Questions collection
+    size : int
+        Expected number of records
+    batch : int, default 10000
+        Number of records inserted in one call
+    """
+    current = collection.estimated_document_count()
+    while current < size:
+        amount = min(batch, size - current)
+        collection.insert_many([{'question': f'Question {n}?', 'category': 'Benchmark', 'correct_answer': 'A',
+                                 'incorrect_answers': ['B', 'C', 'D'], 'question_code': f'{n:08x}'}
+                                for n in range(current, current + amount)], ordered=False)
+        current += amount
+
+
+def store_history(db, known, players):
+    """
+        Write known codes to seen-questions collection, split between players
+    Returns
+    -------
+    list of ObjectId
+        Ids of players
+    """
+    users = [ObjectId() for _ in range(players)]
+    db[SEEN_COLLECTION].drop()
+    ensure_indexes(db)
+    documents = [{'user_id': users[n % players], 'question_code': code}
+                 for n, code in enumerate(sorted(known))]
+    if documents:
+        db[SEEN_COLLECTION].insert_many(documents)
+    return users
+
+
+def measure(db, known, repeats, users=()):
+    """
+        Time single get_unknown_question calls
+    Returns
+    -------
+    list of float
+        Call latencies in milliseconds
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        Question.get_unknown_question(db, known, 'questions', users=users)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db', default='BIGQUIZ_BENCH')
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--known', type=int, default=500,
+                        help='Number of questions known by players')
+    parser.add_argument('--sizes', type=int, nargs='+', default=BANK_SIZES)
+    parser.add_argument('--stored', action='store_true',
+                        help='Keep known questions in seen-questions collection')
+    parser.add_argument('--players', type=int, default=4)
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    db['questions'].drop()
+    known = frozenset(f'{n:08x}' for n in range(args.known))
+    users = ()
+    if args.stored:
+        users = store_history(db, known, args.players)
+        known = frozenset()
+    print(f"{'bank size':>10} | {'p50 ms':>8} | {'p99 ms':>8}")
+    for size in sorted(args.sizes):
+        seed(db['questions'], size)
+        timings = sorted(measure(db, known, args.repeats, users))
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        print(f'{size:>10} | {statistics.median(timings):>8.3f} | {p99:>8.3f}')
+    db['questions'].drop()
+    db[SEEN_COLLECTION].drop()
+
+
+if __name__ == '__main__':
+    main()
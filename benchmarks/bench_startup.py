@@ -0,0 +1,71 @@
+"""
+    Time from process start to first served request of Flask application
+
+    Every repeat runs fresh interpreter, which imports application, builds it with create_app and
+    serves first quiz request through test client. The first request connects to MongoDB and
+    ensures indexes, --eager connects already in create_app step for comparison.
+
+    Run from repository root against local mongod:
+        python -m benchmarks.bench_startup --uri mongodb://localhost:27017 --repeats 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+STEPS = ['import', 'create_app', 'first_request', 'second_request']
+
+
+def child(args):
+    """
+        Measure startup steps in this process and print them as JSON
+    """
+    start = time.perf_counter()
+    from app.app import create_app
+    from app.config import Config
+    imported = time.perf_counter()
+    app = create_app(Config.from_env(mongo_uri=args.uri, mongo_db=args.db))
+    if args.eager:
+        app.extensions['bigquiz'].rooms
+    created = time.perf_counter()
+    client = app.test_client()
+    assert client.get('/quiz/rooms/startup/remove_user/nobody').status_code == 200
+    first = time.perf_counter()
+    assert client.get('/quiz/rooms/startup/remove_user/nobody').status_code == 200
+    second = time.perf_counter()
+    app.extensions['bigquiz'].close()
+    print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                      'first_request': first - created, 'second_request': second - first}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', nargs='?', default='bench', choices=['bench', 'child'])
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db', default='BIGQUIZ_BENCH')
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--eager', action='store_true', help='Connect in create_app step')
+    args = parser.parse_args()
+    if args.mode == 'child':
+        child(args)
+        return
+
+    command = [sys.executable, '-m', 'benchmarks.bench_startup', 'child', '--uri', args.uri, '--db', args.db]
+    if args.eager:
+        command.append('--eager')
+    timings = {step: [] for step in STEPS + ['process']}
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        timings['process'].append(time.perf_counter() - start)
+        for step, seconds in json.loads(output.strip().splitlines()[-1]).items():
+            timings[step].append(seconds)
+    print(f"{'step':>14} | {'p50 ms':>8} | {'max ms':>8}")
+    for step, values in timings.items():
+        print(f'{step:>14} | {statistics.median(values) * 1000:>8.1f} | {max(values) * 1000:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+    Time of User.load_by_id for users with long games and seen questions history
+
+    Run from repository root against local mongod:
+        python -m benchmarks.bench_user_load --uri mongodb://localhost:27017
+"""
+import argparse
+import statistics
+import time
+from pymongo.mongo_client import MongoClient
+from app.quiz.records import User, SEEN_COLLECTION
+
+HISTORY_SIZES = [10, 1_000, 100_000]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db', default='BIGQUIZ_BENCH')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--sizes', type=int, nargs='+', default=HISTORY_SIZES)
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    print(f"{'games':>8} | {'p50 ms':>9} | {'max ms':>9}")
+    for size in args.sizes:
+        db['games'].drop()
+        db['users'].drop()
+        db[SEEN_COLLECTION].drop()
+        games = []
+        for start in range(0, size, 10_000):
+            games.extend(db['games'].insert_many(
+                [{'users': [], 'questions': [], 'score': [], 'is_finished': True, 'winner': None}
+                 for _ in range(min(10_000, size - start))]).inserted_ids)
+        user_id = db['users'].insert_one(
+            {'name': f'veteran{size}', 'correct_answers': 0, 'games': games}).inserted_id
+        for start in range(0, size, 10_000):
+            db[SEEN_COLLECTION].insert_many(
+                [{'user_id': user_id, 'question_code': f'{n:08x}'}
+                 for n in range(start, min(start + 10_000, size))])
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            user = User.load_by_id(db, user_id, cached=False)
+            timings.append((time.perf_counter() - start) * 1000)
+        assert len(user.games) == size
+        print(f'{size:>8} | {statistics.median(timings):>9.3f} | {max(timings):>9.3f}')
+    db['games'].drop()
+    db['users'].drop()
+    db[SEEN_COLLECTION].drop()
+
+
+if __name__ == '__main__':
+    main()
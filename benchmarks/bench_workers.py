@@ -0,0 +1,73 @@
+"""
+    Throughput of production gunicorn server for growing number of worker processes
+
+    Live game state is shared through MongoDB, so every request may land on any worker.
+
+    Run from repository root against local mongod:
+        python -m benchmarks.bench_workers --uri mongodb://localhost:27017 --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import httpx
+from pymongo.mongo_client import MongoClient
+from benchmarks.bench_async import drive, reset
+
+
+def start_gunicorn(args, workers, port):
+    """
+        Start gunicorn subprocess and wait until it accepts requests
+    """
+    env = dict(os.environ, BIGQUIZ_MONGO_URI=args.uri, BIGQUIZ_MONGO_DB=args.db,
+               BIGQUIZ_STATE_STORE='mongo', WEB_CONCURRENCY=str(workers),
+               BIGQUIZ_THREADS=str(args.threads))
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                                '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+                                'wsgi:application'], env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/quiz/rooms/probe/remove_user/nobody')
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db', default='BIGQUIZ_BENCH')
+    parser.add_argument('--port', type=int, default=5700)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--connections', type=int, default=200)
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--questions', type=int, default=20_000)
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    baseline = None
+    print(f"{'workers':>7} | {'requests':>8} | {'seconds':>8} | {'req/s':>8} | {'speedup':>7}")
+    for workers in args.workers:
+        reset(db, args.questions)
+        db['room_states'].drop()
+        process = start_gunicorn(args, workers, args.port)
+        try:
+            requests, elapsed = asyncio.run(drive(
+                f'http://127.0.0.1:{args.port}', args.connections, args.players, args.rounds))
+        finally:
+            process.terminate()
+            process.wait()
+        throughput = requests / elapsed
+        baseline = baseline or throughput
+        print(f'{workers:>7} | {requests:>8} | {elapsed:>8.2f} | {throughput:>8.0f} | {throughput / baseline:>6.2f}x')
+
+
+if __name__ == '__main__':
+    main()
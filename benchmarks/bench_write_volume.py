@@ -0,0 +1,42 @@
+"""
+    Bytes of user update sent per round for growing question history
+
+    Compares delta update of MongoRecordAdapter.pending_update with seen-questions upserts
+    against full $set of user document embedding whole questions history.
+    Only encodes update documents, so no running mongod is needed:
+        python -m benchmarks.bench_write_volume
+"""
+import argparse
+import bson
+from bson.objectid import ObjectId
+from pymongo.mongo_client import MongoClient
+from app.quiz.records import Question, User
+
+HISTORY_SIZES = [10, 100, 1_000, 10_000, 100_000]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=HISTORY_SIZES)
+    args = parser.parse_args()
+
+    db = MongoClient('mongodb://localhost:27017', connect=False)['BIGQUIZ_BENCH']
+    print(f"{'history':>8} | {'delta bytes':>11} | {'full $set bytes':>15}")
+    for size in args.sizes:
+        user = User(db)
+        user.name = 'veteran'
+        user.questions = [Question.make_question_code(str(n), '', []) for n in range(size)]
+        user.games.load([ObjectId() for _ in range(size // 10)])
+        user.mark_saved()
+        user.questions.append(Question.make_question_code('next', '', []))
+        user.correct_answers += 1
+        delta = len(bson.encode(user.pending_update())) + \
+            sum(len(bson.encode(query)) + len(bson.encode(update))
+                for _, query, update in user.pending_upserts())
+        full = len(bson.encode(
+            {'$set': dict(user.to_json(), questions=user.questions)}))
+        print(f'{size:>8} | {delta:>11} | {full:>15}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""
+    Load generator replaying busy game night over quiz endpoints
+
+    Every room follows script drawn from --seed, so runs with the same parameters send the same
+    requests. Players join in a burst, the host starts game and every question brings answer storm
+    of all players within --think seconds. With --churn probability a player leaves and a new one
+    joins between questions. With --silent probability a player never answers, the host removes
+    silent players after the storm and resends own answer, which closes the round.
+
+    Requests are sent by threads or asyncio tasks to server at --url, or by threads to Flask
+    application loaded in-process when --url is not given. Report covers throughput, latency
+    percentiles, error rate, rejected rate and MongoDB operations per completed round, read from
+    serverStatus of database at --uri. Endpoints reject requests, such as answer of closed round,
+    with 200 and body false, so such requests are reported as rejected, apart from errors.
+
+    Run from repository root against local mongod:
+        python -m benchmarks.game_night --uri mongodb://localhost:27017 --rooms 300
+        python -m benchmarks.game_night --url http://127.0.0.1:5500 --mode asyncio --rooms 300
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pymongo.mongo_client import MongoClient
+from app.app import create_app
+from app.config import Config
+from app.quiz.indexes import ensure_indexes
+from app.quiz.records import SEEN_COLLECTION
+from benchmarks.bench_lifecycle import git_commit, percentile
+from benchmarks.bench_sampling import seed
+
+OPCOUNTERS = ('insert', 'query', 'update', 'delete', 'getmore', 'command')
+
+
+def room_script(room_id, args):
+    """
+        Scripted behavior of single room
+    Parameters
+    ----------
+    room_id : str
+        Game room id
+    args : argparse.Namespace
+        Scenario parameters
+
+    Yields
+    ------
+    list of tuple
+        Wave of (endpoint, path, delay in seconds) requests sent at once, next wave waits for all of them
+    """
+    rng = random.Random(f'{args.seed}-{room_id}')
+    prefix = f'/quiz/rooms/{room_id}'
+    serial = itertools.count()
+
+    def new_player():
+        return f'{room_id}-player{next(serial)}', rng.random() < args.silent
+
+    players = dict(new_player() for _ in range(args.players))  # Name to never answering flag
+    host = next(iter(players))
+    players[host] = False
+    yield [('register_user', f'{prefix}/register_user/{name}', rng.uniform(0, args.think)) for name in players]
+    yield [('start_game', f'{prefix}/start_game', 0.0)]
+    for _ in range(args.rounds):
+        guests = [name for name in players if name != host]
+        if guests and rng.random() < args.churn:
+            leaving = rng.choice(guests)
+            del players[leaving]
+            joining, silent = new_player()
+            players[joining] = silent
+            yield [('remove_user', f'{prefix}/remove_user/{leaving}', 0.0),
+                   ('register_user', f'{prefix}/register_user/{joining}', rng.uniform(0, args.think))]
+        yield [('put_answer', f'{prefix}/put_answer/{name}/{rng.choice("ABCD")}', rng.uniform(0, args.think))
+               for name, silent in players.items() if not silent]
+        silent = [name for name, silent in players.items() if silent]
+        if silent:
+            for name in silent:
+                del players[name]
+            yield [('remove_user', f'{prefix}/remove_user/{name}', 0.0) for name in silent]
+            yield [('put_answer', f'{prefix}/put_answer/{host}/{rng.choice("ABCD")}', 0.0)]
+
+
+def outcome(status, body):
+    """
+        Outcome of quiz endpoint response
+    Parameters
+    ----------
+    status : int
+        HTTP status code
+    body : str
+        Response body
+
+    Returns
+    -------
+    str
+        'ok', 'rejected' for body false or 'error' for other status or malformed body
+    """
+    if status != 200:
+        return 'error'
+    try:
+        return 'rejected' if json.loads(body) is False else 'ok'
+    except ValueError:
+        return 'error'
+
+
+class Recorder:
+    """
+    Thread safe collector of request latencies, errors and rejections per endpoint
+
+    Methods
+    -------
+    record(endpoint, milliseconds, result)
+        Store result of single request
+    summary(elapsed)
+        Throughput, latency percentiles and error rate of every endpoint
+    """
+
+    def __init__(self) -> None:
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, milliseconds, result):
+        with self._lock:
+            self.latencies[endpoint].append(milliseconds)
+            if result == 'error':
+                self.errors[endpoint] += 1
+            elif result == 'rejected':
+                self.rejected[endpoint] += 1
+
+    def summary(self, elapsed):
+        """
+            Throughput, latency percentiles and error rate of every endpoint
+        Parameters
+        ----------
+        elapsed : float
+            Seconds of whole run
+
+        Returns
+        -------
+        dict
+            Endpoint name to calls, requests per second, error and rejected rates and latency
+            percentiles in milliseconds
+        """
+        with self._lock:
+            return {endpoint: {'calls': len(values), 'per_second': len(values) / elapsed,
+                               'error_rate': self.errors[endpoint] / len(values),
+                               'rejected_rate': self.rejected[endpoint] / len(values),
+                               'p50_ms': percentile(values, 0.5), 'p99_ms': percentile(values, 0.99),
+                               'p999_ms': percentile(values, 0.999), 'max_ms': max(values)}
+                    for endpoint, values in sorted(self.latencies.items())}
+
+
+def run_threads(get, scripts, concurrency, recorder):
+    """
+        Play rooms in threads, requests of a wave are sent by shared pool of concurrency threads
+    Parameters
+    ----------
+    get : callable
+        Function sending GET request of room path, returning HTTP status code and body
+    """
+    def send(endpoint, path, delay):
+        time.sleep(delay)
+        start = time.perf_counter()
+        try:
+            result = outcome(*get(path))
+        except Exception as e:
+            print(e)
+            result = 'error'
+        recorder.record(endpoint, (time.perf_counter() - start) * 1000, result)
+
+    with ThreadPoolExecutor(concurrency) as requests:
+        def play(script):
+            for wave in script:
+                for future in [requests.submit(send, *request) for request in wave]:
+                    future.result()
+
+        with ThreadPoolExecutor(min(len(scripts), concurrency)) as rooms:
+            list(rooms.map(play, scripts))
+
+
+async def run_asyncio(base_url, scripts, concurrency, recorder):
+    """
+        Play rooms as asyncio tasks over httpx, at most concurrency requests are in flight
+    """
+    import httpx
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    in_flight = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        async def send(endpoint, path, delay):
+            await asyncio.sleep(delay)
+            async with in_flight:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    result = outcome(response.status_code, response.text)
+                except httpx.HTTPError as e:
+                    print(e)
+                    result = 'error'
+                recorder.record(endpoint, (time.perf_counter() - start) * 1000, result)
+
+        async def play(script):
+            for wave in script:
+                await asyncio.gather(*(send(*request) for request in wave))
+
+        await asyncio.gather(*(play(script) for script in scripts))
+
+
+def in_process_get(args):
+    """
+        GET function of Flask application built in this process, one test client per thread
+    """
+    app = create_app(Config.from_env(mongo_uri=args.uri, mongo_db=args.db))
+    local = threading.local()
+
+    def get(path):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        response = local.client.get(path)
+        return response.status_code, response.get_data(as_text=True)
+    return get
+
+
+def prepare_database(args):
+    """
+        Drop quiz collections and seed question bank
+    """
+    db = MongoClient(args.uri)[args.db]
+    for col in ('users', 'games', 'questions', SEEN_COLLECTION, 'room_states'):
+        db[col].drop()
+    ensure_indexes(db)
+    seed(db['questions'], args.questions)
+    return db
+
+
+def operations(db):
+    """
+        Sum of server operation counters, None without serverStatus privilege
+    """
+    try:
+        counters = db.command('serverStatus')['opcounters']
+    except Exception as e:
+        print(e)
+        return None
+    return sum(counters[name] for name in OPCOUNTERS)
+
+
+def completed_rounds(db):
+    """
+        Number of questions closed in all games
+    """
+    totals = list(db['games'].aggregate(
+        [{'$group': {'_id': None, 'rounds': {'$sum': {'$size': '$questions'}}}}]))
+    return totals[0]['rounds'] if totals else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db', default='BIGQUIZ_BENCH')
+    parser.add_argument('--url', help='Base url of running server, in-process Flask application by default')
+    parser.add_argument('--mode', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--rooms', type=int, default=300)
+    parser.add_argument('--players', type=int, default=6)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--churn', type=float, default=0.2, help='Probability of player swap between questions')
+    parser.add_argument('--silent', type=float, default=0.05, help='Probability of never answering player')
+    parser.add_argument('--think', type=float, default=0.5, help='Longest seconds of answer storm')
+    parser.add_argument('--questions', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file of results')
+    args = parser.parse_args()
+    if args.mode == 'asyncio' and args.url is None:
+        parser.error('asyncio mode needs --url of running server')
+
+    db = prepare_database(args)
+    scripts = [room_script(f'night{n}', args) for n in range(args.rooms)]
+    recorder = Recorder()
+    before = operations(db)
+    start = time.perf_counter()
+    if args.mode == 'asyncio':
+        asyncio.run(run_asyncio(args.url, scripts, args.concurrency, recorder))
+    elif args.url is not None:
+        import httpx
+        client = httpx.Client(base_url=args.url, timeout=120.0, limits=httpx.Limits(
+            max_connections=args.concurrency, max_keepalive_connections=args.concurrency))
+        def get(path):
+            response = client.get(path)
+            return response.status_code, response.text
+        run_threads(get, scripts, args.concurrency, recorder)
+    else:
+        run_threads(in_process_get(args), scripts, args.concurrency, recorder)
+    elapsed = time.perf_counter() - start
+    after = operations(db)
+
+    rounds = completed_rounds(db)
+    results = recorder.summary(elapsed)
+    calls = sum(result['calls'] for result in results.values())
+    errors = sum(recorder.errors.values())
+    rejected = sum(recorder.rejected.values())
+    mongo_ops = None if before is None or after is None else after - before
+    report = {'commit': git_commit(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'parameters': {key: value for key, value in vars(args).items()
+                             if key not in ('uri', 'output')},  # URI may hold credentials
+              'seconds': elapsed, 'per_second': calls / elapsed, 'error_rate': errors / calls,
+              'rejected_rate': rejected / calls,
+              'completed_rounds': rounds, 'mongo_ops': mongo_ops,
+              'mongo_ops_per_round': mongo_ops / rounds if mongo_ops is not None and rounds else None,
+              'results': results}
+    print(f"{calls} requests in {elapsed:.1f} s, {report['per_second']:.0f} requests/s, "
+          f"{errors} errors, {rejected} rejected, {rounds} completed rounds")
+    if mongo_ops is not None:
+        print(f"{mongo_ops} MongoDB operations, {report['mongo_ops_per_round'] or 0:.1f} per completed round")
+    print(f"{'endpoint':>14} | {'calls':>6} | {'errors':>6} | {'reject':>6} | "
+          f"{'p50 ms':>8} | {'p99 ms':>8} | {'p99.9 ms':>8}")
+    for endpoint, result in results.items():
+        print(f"{endpoint:>14} | {result['calls']:>6} | {result['error_rate']:>6.1%} | "
+              f"{result['rejected_rate']:>6.1%} | "
+              f"{result['p50_ms']:>8.3f} | {result['p99_ms']:>8.3f} | {result['p999_ms']:>8.3f}")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+    Load test of many simultaneous rooms driven through RoomRegistry like quiz endpoints
+
+    Run from repository root against local mongod:
+        python -m benchmarks.load_rooms --uri mongodb://localhost:27017 --rooms 500
+"""
+import argparse
+import statistics
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pymongo.mongo_client import MongoClient
+from app.quiz.indexes import ensure_indexes
+from app.quiz.records import User, SEEN_COLLECTION
+from app.quiz.rooms import RoomRegistry
+from benchmarks.bench_sampling import seed
+
+
+def play_room(registry, db, room_id, players, rounds, timings):
+    """
+        Run register_user -> start_game -> put_answer loop of single room
+    """
+    def timed(endpoint, func):
+        start = time.perf_counter()
+        func()
+        timings[endpoint].append((time.perf_counter() - start) * 1000)
+
+    def register(name):
+        user = User.load_by_name(db, name, 'users')
+        with registry.use(room_id) as quiz:
+            quiz.register_user(user)
+
+    def start():
+        with registry.use(room_id) as quiz:
+            quiz.start_game(quiz.propose_game())
+
+    def answer(name, choice):
+        with registry.use(room_id) as quiz:
+            quiz.register_answer(name, choice)
+
+    names = [f'{room_id}-player{n}' for n in range(players)]
+    for name in names:
+        timed('register_user', lambda: register(name))
+    timed('start_game', start)
+    for number in range(rounds):
+        for name in names:
+            timed('put_answer', lambda: answer(name, number % 4))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db', default='BIGQUIZ_BENCH')
+    parser.add_argument('--rooms', type=int, default=500)
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--questions', type=int, default=20_000)
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    for col in ('users', 'games', 'questions', SEEN_COLLECTION):
+        db[col].drop()
+    ensure_indexes(db)
+    seed(db['questions'], args.questions)
+    registry = RoomRegistry(db)
+    timings = defaultdict(list)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        futures = [executor.submit(play_room, registry, db, f'room{n}', args.players, args.rounds, timings)
+                   for n in range(args.rooms)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+    print(f'{args.rooms} rooms in {elapsed:.1f} s')
+    print(f"{'endpoint':>14} | {'calls':>7} | {'p50 ms':>8} | {'p99 ms':>8}")
+    for endpoint, values in timings.items():
+        print(f'{endpoint:>14} | {len(values):>7} | {statistics.median(values):>8.3f} | {percentile(values, 0.99):>8.3f}')
+    registry.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+    Local stand-in of Trivia API used by benchmarks
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class OpenTDBStubHandler(BaseHTTPRequestHandler):
+    """
+        Serve endless stream of unique generated multiple choice questions
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        amount = int(parse_qs(urlparse(self.path).query).get('amount', ['1'])[0])
+        with self.server.lock:
+            start = self.server.position
+            self.server.position += amount
+        results = [{'type': 'multiple', 'difficulty': 'easy', 'category': 'Benchmark',
+                    'question': f'{n:08} generated question {n:08}?', 'correct_answer': 'A',
+                    'incorrect_answers': ['B', 'C', 'D']} for n in range(start, start + amount)]
+        payload = json.dumps({'response_code': 0, 'results': results}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub():
+    """
+        Start stub server in background thread
+    Returns
+    -------
+    tuple of (ThreadingHTTPServer, str)
+        Running server and its questions endpoint url
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), OpenTDBStubHandler)
+    server.lock = threading.Lock()
+    server.position = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/api.php'
@@ -0,0 +1,26 @@
+"""
+    Gunicorn settings of production server, overridden by environment:
+        WEB_CONCURRENCY       number of worker processes, CPU count by default
+        BIGQUIZ_THREADS       threads of every worker, 8 by default
+        BIGQUIZ_STATE_STORE   'mongo' by default for more than one worker
+        BIGQUIZ_EVENT_STREAMS /events streams of every worker, half of threads by default
+"""
+import multiprocessing
+import os
+from constants import FLASK_PORT
+
+bind = f'0.0.0.0:{FLASK_PORT}'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('BIGQUIZ_THREADS', 8))
+# Application is imported once by master, every worker opens its own MongoClient on first request
+preload_app = True
+# Server-Sent Events streams keep their thread, so they get at most half of threads,
+# uvicorn app.asgi:application serves any number of streams, heartbeat of worker runs independently
+os.environ.setdefault('BIGQUIZ_EVENT_STREAMS', str(max(1, threads // 2)))
+timeout = 60
+keepalive = 5
+
+# Rooms of one game can be served by different workers only with shared live state
+if workers > 1:
+    os.environ.setdefault('BIGQUIZ_STATE_STORE', 'mongo')
@@ -1,5 +1,5 @@
 import sys
-from app.app import app
+from app.app import create_app
 import signal
 from constants import FLASK_PORT
 
@@ -10,5 +10,6 @@ def signal_handler(signal, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 if __name__ == '__main__':
+    app = create_app()
     # app.run(host="0.0.0.0", port=5500, debug=False, ssl_context=('cert.pem', 'key.pem'))
     app.run(host="0.0.0.0", port=FLASK_PORT, debug=False)
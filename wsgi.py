@@ -0,0 +1,10 @@
+"""
+    Production WSGI entry point, run from repository root:
+        gunicorn -c gunicorn.conf.py wsgi:application
+
+    main.py keeps Flask development server. Application is built without connecting to MongoDB,
+    every worker connects on its first request.
+"""
+from app.app import create_app
+
+application = create_app()